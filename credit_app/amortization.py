@@ -0,0 +1,170 @@
+from decimal import Decimal
+from itertools import islice
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import to_cents
+
+SCHEDULE_FIELDS = ['loan_index', 'month', 'payment', 'interest', 'principal', 'balance']
+
+def monthly_installments(loan_amount, interest_rate, tenure):
+    """Vectorized EMIs (float64) for arrays of loan amounts, annual rates in percent and tenures"""
+    loan_amount = np.asarray(loan_amount, dtype=np.float64)
+    tenure = np.asarray(tenure, dtype=np.int64)
+    monthly_rate = np.asarray(interest_rate, dtype=np.float64) / 1200
+    growth = np.power(1 + monthly_rate, tenure)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emi = loan_amount * monthly_rate * growth / (growth - 1)
+    return np.where(monthly_rate == 0, loan_amount / tenure, emi)
+
+def schedule_layout(tenure):
+    """Row offsets and per-row (loan_index, month) for concatenated schedules"""
+    tenure = np.asarray(tenure, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(tenure)[:-1])) if len(tenure) else np.zeros(0, dtype=np.int64)
+    loan_index = np.repeat(np.arange(len(tenure)), tenure)
+    month = np.arange(int(tenure.sum())) - offsets[loan_index] + 1
+    return offsets, loan_index, month
+
+def amortization_schedules(loan_amount, interest_rate, tenure, monthly_payment=None):
+    """Month-by-month schedules for many loans at once, in float64 (closed form)
+
+    Returns a dict of equal-length arrays (see SCHEDULE_FIELDS) with the schedules of all
+    loans concatenated in input order. Without monthly_payment the EMI is derived from
+    the loan terms.
+    """
+    loan_amount = np.asarray(loan_amount, dtype=np.float64)
+    tenure = np.asarray(tenure, dtype=np.int64)
+    monthly_rate = np.asarray(interest_rate, dtype=np.float64) / 1200
+    if monthly_payment is None:
+        monthly_payment = monthly_installments(loan_amount, interest_rate, tenure)
+    monthly_payment = np.asarray(monthly_payment, dtype=np.float64)
+
+    _, loan_index, month = schedule_layout(tenure)
+    rate = monthly_rate[loan_index]
+    payment = monthly_payment[loan_index]
+    principal_amount = loan_amount[loan_index]
+
+    # Balance after k payments: P(1+r)^k - EMI((1+r)^k - 1)/r, or P - k*EMI when r == 0
+    growth_before = np.power(1 + rate, month - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        balance_before = np.where(
+            rate == 0,
+            principal_amount - (month - 1) * payment,
+            principal_amount * growth_before - payment * (growth_before - 1) / rate,
+        )
+    # A payment above the level EMI pays the loan off early; nothing is owed after that
+    balance_before = np.maximum(balance_before, 0.0)
+    interest = balance_before * rate
+    principal = np.minimum(payment - interest, balance_before)
+
+    # The final payment settles whatever is left
+    last = month == tenure[loan_index]
+    principal = np.where(last, balance_before, principal)
+    payment = interest + principal
+    balance = balance_before - principal
+
+    return {
+        'loan_index': loan_index,
+        'month': month,
+        'payment': payment,
+        'interest': interest,
+        'principal': principal,
+        'balance': balance,
+    }
+
+def rate_basis_points(interest_rate):
+    """Annual rates in percent with two decimals, as exact integers (8.20 -> 820)"""
+    return np.array([int(Decimal(str(rate)) * 100) for rate in np.atleast_1d(interest_rate)], dtype=np.int64)
+
+def exact_amortization_schedules(loan_amount_cents, rate_bps, tenure, monthly_payment_cents):
+    """Cent-exact schedules for many loans at once, using int64 arithmetic
+
+    Each month's interest is balance * rate / 1200 rounded half-up to the cent, exactly as
+    Decimal.quantize(ROUND_HALF_UP) would round it. Payments are the given (stored)
+    monthly repayment; the final payment, or an earlier one that covers the balance,
+    settles what is left, so the principal column always sums to the loan amount. All
+    amounts are in cents.
+    """
+    balance = np.asarray(loan_amount_cents, dtype=np.int64).copy()
+    rate_bps = np.asarray(rate_bps, dtype=np.int64)
+    tenure = np.asarray(tenure, dtype=np.int64)
+    monthly_payment_cents = np.asarray(monthly_payment_cents, dtype=np.int64)
+
+    offsets, loan_index, month = schedule_layout(tenure)
+    rows = len(loan_index)
+    payment = np.empty(rows, dtype=np.int64)
+    interest = np.empty(rows, dtype=np.int64)
+    principal = np.empty(rows, dtype=np.int64)
+    remaining = np.empty(rows, dtype=np.int64)
+
+    # One vectorized step per month across every loan still running
+    for step in range(int(tenure.max()) if len(tenure) else 0):
+        running = np.nonzero(tenure > step)[0]
+        open_balance = balance[running]
+        month_interest = (2 * open_balance * rate_bps[running] + 120000) // 240000
+        month_principal = monthly_payment_cents[running] - month_interest
+        settle = (tenure[running] == step + 1) | (month_principal > open_balance)
+        month_principal = np.where(settle, open_balance, month_principal)
+
+        position = offsets[running] + step
+        interest[position] = month_interest
+        principal[position] = month_principal
+        payment[position] = month_interest + month_principal
+        balance[running] = open_balance - month_principal
+        remaining[position] = balance[running]
+
+    return {
+        'loan_index': loan_index,
+        'month': month,
+        'payment': payment,
+        'interest': interest,
+        'principal': principal,
+        'balance': remaining,
+    }
+
+def loan_schedule_arrays(loans, exact=True):
+    """Schedules for Loan instances or dicts with loan_amount, interest_rate, tenure and monthly_repayment"""
+    def value(loan, field):
+        return loan[field] if isinstance(loan, dict) else getattr(loan, field)
+
+    loans = list(loans)
+    tenure = np.array([value(loan, 'tenure') for loan in loans], dtype=np.int64)
+    if not exact:
+        return amortization_schedules(
+            [float(value(loan, 'loan_amount')) for loan in loans],
+            [float(value(loan, 'interest_rate')) for loan in loans],
+            tenure,
+            [float(value(loan, 'monthly_repayment')) for loan in loans],
+        )
+    return exact_amortization_schedules(
+        [int(to_cents(value(loan, 'loan_amount')) * 100) for loan in loans],
+        rate_basis_points([value(loan, 'interest_rate') for loan in loans]),
+        tenure,
+        [int(to_cents(value(loan, 'monthly_repayment')) * 100) for loan in loans],
+    )
+
+def iter_schedule_rows(schedule, exact=True):
+    """Yield one dict per schedule row, with money as Decimal (exact) or float"""
+    money = (lambda cents: Decimal(int(cents)).scaleb(-2)) if exact else float
+    for index in range(len(schedule['month'])):
+        yield {
+            'month': int(schedule['month'][index]),
+            'payment': money(schedule['payment'][index]),
+            'interest': money(schedule['interest'][index]),
+            'principal': money(schedule['principal'][index]),
+            'balance': money(schedule['balance'][index]),
+        }
+
+
+def stream_schedule_json(header, rows, rows_per_chunk=100):
+    """Stream {**header, "schedule": [rows...]} as compact JSON, a block of rows at a time"""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    yield encoder.encode(header)[:-1] + (',' if header else '') + '"schedule":['
+    rows = iter(rows)
+    separator = ''
+    while True:
+        block = list(islice(rows, rows_per_chunk))
+        if not block:
+            break
+        yield separator + ','.join(encoder.encode(row) for row in block)
+        separator = ','
+    yield ']}'
@@ -5,4 +5,5 @@ class CreditAppConfig(AppConfig):
     name = 'credit_app'
     
     def ready(self):
+        import credit_app.signals
         import credit_app.tasks 
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""Async versions of the eligibility and loan lookup views
+
+Served under /api/async/ and meant for the ASGI entry point (credit_system.asgi). Each
+request runs its ORM calls on its own thread, so one ASGI worker keeps many requests in
+flight while they wait on the database. Response bodies match the DRF views byte for byte.
+"""
+import json
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from .fast_serializers import field_map, use_field_maps
+from .metrics import request_phase
+from .models import Customer, Loan
+from .pagination import LoanCursorPagination
+from .renderers import FastJSONRenderer
+from .routers import reads_from_replica
+from .serializers import (
+    LoanDetailSerializer, LoanEligibilityResponseSerializer, LoanEligibilitySerializer, LoanListSerializer, astream_ndjson
+)
+from .utils import LOAN_LIST_COLUMNS, check_loan_eligibility, customer_loan_rows
+from .views import serialize_loan_rows
+
+renderer = FastJSONRenderer()
+
+def json_response(data, status=200):
+    """Render data the way a DRF Response with the JSON renderer does"""
+    with request_phase('render'):
+        content = renderer.render(data)
+    return HttpResponse(content, status=status, content_type=renderer.media_type)
+
+def method_not_allowed(request, allowed):
+    response = json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    response['Allow'] = ', '.join(allowed)
+    return response
+
+@csrf_exempt
+@reads_from_replica
+async def check_eligibility(request):
+    """Check loan eligibility for a customer"""
+    if request.method != 'POST':
+        return method_not_allowed(request, ['POST', 'OPTIONS'])
+    try:
+        data = json.loads(request.body) if request.body else {}
+    except ValueError as error:
+        return json_response({'detail': f'JSON parse error - {error}'}, status=400)
+
+    serializer = LoanEligibilitySerializer(data=data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=400)
+
+    # One thread hop for the score cache lookup and, on a miss, the customer and
+    # credit profile query
+    eligibility_data = await sync_to_async(check_loan_eligibility)(
+        serializer.validated_data['customer_id'],
+        serializer.validated_data['loan_amount'],
+        serializer.validated_data['interest_rate'],
+        serializer.validated_data['tenure']
+    )
+    return json_response(LoanEligibilityResponseSerializer(eligibility_data).data)
+
+@reads_from_replica
+async def view_loan(request, loan_id):
+    """View loan details by loan ID"""
+    if request.method not in ('GET', 'HEAD'):
+        return method_not_allowed(request, ['GET', 'HEAD', 'OPTIONS'])
+    if use_field_maps():
+        loan_map = field_map(LoanDetailSerializer)
+        row = await Loan.objects.filter(loan_id=loan_id).values(*loan_map.lookups).afirst()
+        if row is None:
+            return json_response({'error': 'Loan not found'}, status=404)
+        return json_response(loan_map.represent(row))
+    try:
+        loan = await Loan.objects.select_related('customer').aget(loan_id=loan_id)
+    except Loan.DoesNotExist:
+        return json_response({'error': 'Loan not found'}, status=404)
+    return json_response(LoanDetailSerializer(loan).data)
+
+@reads_from_replica
+async def view_customer_loans(request, customer_id):
+    """View all loans for a customer, with the parameters of the sync view"""
+    if request.method not in ('GET', 'HEAD'):
+        return method_not_allowed(request, ['GET', 'HEAD', 'OPTIONS'])
+    if not await Customer.objects.filter(customer_id=customer_id).aexists():
+        return json_response({'error': 'Customer not found'}, status=404)
+
+    fields = request.GET.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    unknown = sorted(set(fields or []) - set(LOAN_LIST_COLUMNS))
+    if unknown:
+        return json_response({'error': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+
+    loans = customer_loan_rows(customer_id, fields)
+    loan_map = field_map(LoanListSerializer, fields) if use_field_maps() else None
+
+    if request.GET.get('mode') == 'ndjson':
+        # Bound to the read database now: the stream is consumed after the view returns
+        return StreamingHttpResponse(
+            astream_ndjson(loan_map or LoanListSerializer(fields=fields), loans.using(loans.db).aiterator(chunk_size=2000)),
+            content_type='application/x-ndjson'
+        )
+
+    if 'cursor' in request.GET or 'limit' in request.GET:
+        paginator = LoanCursorPagination()
+        try:
+            page = await sync_to_async(paginator.paginate_queryset)(loans, Request(request))
+        except NotFound as error:
+            return json_response({'detail': error.detail}, status=error.status_code)
+        return json_response(paginator.get_paginated_response(serialize_loan_rows(page, fields, loan_map)).data)
+
+    rows = [row async for row in loans]
+    return json_response(serialize_loan_rows(rows, fields, loan_map))
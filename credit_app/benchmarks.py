@@ -0,0 +1,565 @@
+import asyncio
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import numpy as np
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.conf import settings
+from django.db.models import Max
+from rest_framework.renderers import JSONRenderer
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from .amortization import amortization_schedules, exact_amortization_schedules, monthly_installments
+from .bulk_load import copy_load_customers, copy_load_loans
+from .fast_serializers import field_map
+from .ingestion import ingest_customers, ingest_loans
+from .loan_book import changed_customer_ids, get_loan_book, refresh_loan_book
+from .models import Customer, Loan
+from .renderers import FastJSONRenderer, orjson
+from .rules import current_ruleset
+from .score_cache import get_score_cache
+from .serializers import LoanDetailSerializer, LoanListSerializer
+from .synthetic import generate_synthetic_data
+from .utils import (
+    calculate_approved_limit, calculate_approved_limits, calculate_monthly_installment, check_loan_eligibility,
+    get_corrected_interest_rate_legacy, is_loan_approved_legacy, score_from_aggregates_legacy
+)
+
+@contextmanager
+def rolled_back():
+    """Run a benchmark inside a transaction that is always rolled back"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+def measure(func, *args, **kwargs):
+    """Return (result, seconds, query count) for a single call"""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, elapsed, len(queries)
+
+def result_row(suite, case, items, seconds, queries=None):
+    return {
+        'suite': suite,
+        'case': case,
+        'items': items,
+        'seconds': seconds,
+        'per_item_ms': seconds * 1000 / items if items else 0.0,
+        'queries': queries,
+        'queries_per_item': queries / items if items and queries is not None else None,
+    }
+
+def create_benchmark_portfolio(customers, loans_per_customer, seed=0):
+    """Insert a synthetic portfolio and return the new customer IDs"""
+    rng = random.Random(seed)
+    today = date.today()
+    first_phone = (Customer.objects.aggregate(Max('phone_number'))['phone_number__max'] or 6000000000) + 1
+
+    new_customers = []
+    for index in range(customers):
+        monthly_salary = Decimal(rng.randrange(20000, 200000, 1000))
+        new_customers.append(Customer(
+            first_name='Bench',
+            last_name=f'Customer{index}',
+            age=rng.randint(21, 65),
+            phone_number=first_phone + index,
+            monthly_salary=monthly_salary,
+            approved_limit=round(36 * monthly_salary / 100000) * 100000,
+        ))
+    Customer.objects.bulk_create(new_customers)
+    customer_ids = list(
+        Customer.objects.filter(phone_number__gte=first_phone).order_by('customer_id').values_list('customer_id', flat=True)
+    )
+
+    loans = []
+    for customer_id in customer_ids:
+        for _ in range(loans_per_customer):
+            tenure = rng.randint(6, 120)
+            start_date = today - timedelta(days=rng.randint(0, 3650))
+            loans.append(Loan(
+                customer_id=customer_id,
+                loan_amount=Decimal(rng.randrange(10000, 500000, 10000)),
+                tenure=tenure,
+                interest_rate=Decimal(rng.randint(600, 1800)) / 100,
+                monthly_repayment=Decimal(rng.randint(1000, 20000)),
+                emis_paid_on_time=rng.randint(0, tenure),
+                start_date=start_date,
+                end_date=start_date + timedelta(days=30 * tenure),
+            ))
+    Loan.objects.bulk_create(loans, batch_size=5000)
+    return customer_ids
+
+def random_applications(customer_ids, count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            'customer_id': rng.choice(customer_ids),
+            'loan_amount': rng.randrange(10000, 1000000, 5000),
+            'interest_rate': rng.randint(500, 2000) / 100,
+            'tenure': rng.choice([6, 12, 24, 36, 48, 60]),
+        }
+        for _ in range(count)
+    ]
+
+def benchmark_eligibility(customers=200, loans_per_customer=5, items=1000, seed=0, **options):
+    """Compare per-application cost of the single and batch eligibility endpoints"""
+    client = Client()
+    rows = []
+    with rolled_back():
+        customer_ids = create_benchmark_portfolio(customers, loans_per_customer, seed)
+        applications = random_applications(customer_ids, items, seed)
+
+        def post_each():
+            for application in applications:
+                client.post('/api/check-eligibility', data=json.dumps(application), content_type='application/json')
+
+        _, seconds, queries = measure(post_each)
+        rows.append(result_row('eligibility', 'single endpoint', items, seconds, queries))
+
+        _, seconds, queries = measure(
+            client.post, '/api/check-eligibility/batch', data=json.dumps(applications), content_type='application/json'
+        )
+        rows.append(result_row('eligibility', 'batch endpoint', items, seconds, queries))
+    return rows
+
+def benchmark_amortization(items=100000, seed=0, **options):
+    """Time EMI and full schedule generation for a synthetic portfolio of items loans"""
+    rng = np.random.default_rng(seed)
+    loan_amount = rng.integers(10000, 5000000, items).astype(np.float64)
+    rate_bps = rng.integers(500, 2400, items)
+    tenure = rng.integers(6, 120, items)
+    interest_rate = rate_bps / 100
+    rows = []
+
+    sample = min(items, 10000)
+    scalar_inputs = [(Decimal(int(a)), Decimal(int(r)) / 100, int(t)) for a, r, t in zip(loan_amount[:sample], rate_bps, tenure)]
+    start = time.perf_counter()
+    for amount, rate, months in scalar_inputs:
+        calculate_monthly_installment(amount, rate, months)
+    rows.append(result_row('amortization', 'scalar Decimal EMIs', sample, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    emis = monthly_installments(loan_amount, interest_rate, tenure)
+    rows.append(result_row('amortization', 'vectorized EMIs', items, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    schedule = amortization_schedules(loan_amount, interest_rate, tenure, emis)
+    rows.append(result_row('amortization', f"float schedules ({len(schedule['month'])} rows)", items, time.perf_counter() - start))
+
+    payment_cents = np.round(emis * 100).astype(np.int64)
+    start = time.perf_counter()
+    schedule = exact_amortization_schedules((loan_amount * 100).astype(np.int64), rate_bps, tenure, payment_cents)
+    rows.append(result_row('amortization', f"exact schedules ({len(schedule['month'])} rows)", items, time.perf_counter() - start))
+    return rows
+
+def benchmark_ingestion(customers=None, items=20000, seed=0, **options):
+    """Compare the ORM loader with the staging-table loader on synthetic xlsx and CSV files of items loans"""
+    customers = customers or max(1, items // 5)
+    first_customer_id = (Customer.objects.aggregate(Max('source_customer_id'))['source_customer_id__max'] or 0) + 1
+    first_phone = (Customer.objects.aggregate(Max('phone_number'))['phone_number__max'] or 7000000000) + 1
+    loaders = {
+        'orm': (ingest_customers, ingest_loans),
+        'copy': (copy_load_customers, copy_load_loans),
+    }
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format in ['xlsx', 'csv']:
+            generate_synthetic_data(
+                customers, items, seed=seed, output=file_format, directory=directory,
+                first_customer_id=first_customer_id, first_phone=first_phone
+            )
+            paths = [os.path.join(directory, f'{name}.{file_format}') for name in ('customer_data', 'loan_data')]
+            for name, (load_customers, load_loans) in loaders.items():
+                with rolled_back():
+                    def load():
+                        load_customers(paths[0], 5000)
+                        return load_loans(paths[1], 5000)
+
+                    stats, seconds, queries = measure(load)
+                    rows.append(result_row(
+                        'ingestion', f'{name} loader ({file_format}, {stats.created} loans)', customers + items, seconds, queries
+                    ))
+    return rows
+
+@contextmanager
+def simulated_db_latency(seconds):
+    """Delay every query by seconds, standing in for the network round trip to a remote database"""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    if not seconds:
+        yield
+        return
+    install(None, connection)
+    connection_created.connect(install)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        for wrapper in connections.all(initialized_only=True):
+            if delay in wrapper.execute_wrappers:
+                wrapper.execute_wrappers.remove(delay)
+
+def wsgi_request(application, method, path, body=b''):
+    """Send one request through a WSGI application in-process; returns the status code"""
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': 'localhost',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+    }
+    status = []
+    response = application(environ, lambda status_line, headers: status.append(int(status_line[:3])))
+    for _ in response:
+        pass
+    response.close()
+    return status[0]
+
+async def asgi_request(application, method, path, body=b''):
+    """Send one request through an ASGI application in-process; returns the status code"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # The client never disconnects; the handler cancels this wait when it is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+async def run_asgi_requests(application, requests, concurrency):
+    """Send requests with at most concurrency of them in flight; returns the status codes"""
+    pending = iter(requests)
+    statuses = []
+
+    async def worker():
+        for method, path, body in pending:
+            statuses.append(await asgi_request(application, method, path, body))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return statuses
+
+def benchmark_async(customers=200, loans_per_customer=5, items=2000, concurrency=32, db_latency_ms=0, seed=0, **options):
+    """Compare one WSGI worker serving requests in turn with one ASGI worker keeping many in flight
+
+    Requests are an even mix of eligibility checks, loan lookups and customer loan lists.
+    The handlers run in-process with their own database connections, so the portfolio is
+    committed for the run and deleted afterwards. db_latency_ms adds a delay to every
+    query of both handlers to model a database on another host.
+    """
+    customer_ids = create_benchmark_portfolio(customers, loans_per_customer, seed)
+    try:
+        loan_ids = list(Loan.objects.filter(customer_id__in=customer_ids).values_list('loan_id', flat=True))
+        rng = random.Random(seed)
+        applications = random_applications(customer_ids, items, seed)
+        requests = []
+        for index, application in enumerate(applications):
+            kind = index % 3
+            if kind == 0:
+                requests.append(('POST', 'check-eligibility', json.dumps(application).encode()))
+            elif kind == 1:
+                requests.append(('GET', f'view-loan/{rng.choice(loan_ids)}', b''))
+            else:
+                requests.append(('GET', f"view-loans/{application['customer_id']}", b''))
+
+        rows = []
+        with simulated_db_latency(db_latency_ms / 1000):
+            wsgi = WSGIHandler()
+            start = time.perf_counter()
+            statuses = [wsgi_request(wsgi, method, f'/api/{path}', body) for method, path, body in requests]
+            rows.append(result_row('async', 'sync views, WSGI, 1 in flight', items, time.perf_counter() - start))
+            check_statuses(statuses)
+
+            asgi = ASGIHandler()
+            async_requests = [(method, f'/api/async/{path}', body) for method, path, body in requests]
+            for in_flight in sorted({1, concurrency}):
+                start = time.perf_counter()
+                statuses = asyncio.run(run_asgi_requests(asgi, async_requests, in_flight))
+                rows.append(result_row('async', f'async views, ASGI, {in_flight} in flight', items, time.perf_counter() - start))
+                check_statuses(statuses)
+        return rows
+    finally:
+        Customer.objects.filter(customer_id__in=customer_ids).delete()
+
+def check_statuses(statuses):
+    failed = [status for status in statuses if status != 200]
+    if failed:
+        raise RuntimeError(f'{len(failed)} benchmark requests failed, e.g. with status {failed[0]}')
+
+def benchmark_serialization(items=20000, seed=0, **options):
+    """Time the loan list and loan detail payloads through DRF serializers, field maps and orjson
+
+    Runs in memory on synthetic rows, so it measures serialization and rendering only.
+    """
+    rng = random.Random(seed)
+    customer = Customer(customer_id=1, first_name='Bench', last_name='Customer', phone_number=9000000000, age=40)
+    list_rows = []
+    loans = []
+    for loan_id in range(1, items + 1):
+        loan = Loan(
+            loan_id=loan_id,
+            customer=customer,
+            loan_amount=Decimal(rng.randrange(10000, 500000, 10000)),
+            interest_rate=Decimal(rng.randint(600, 1800)) / 100,
+            monthly_repayment=Decimal(rng.randint(100000, 2000000)) / 100,
+            tenure=rng.randint(6, 120),
+        )
+        loans.append(loan)
+        list_rows.append({
+            'loan_id': loan.loan_id,
+            'loan_amount': loan.loan_amount,
+            'interest_rate': loan.interest_rate,
+            'monthly_repayment': loan.monthly_repayment,
+            'repayments_left': rng.randint(0, loan.tenure),
+        })
+    detail_rows = [
+        {
+            'loan_id': loan.loan_id, 'customer__customer_id': 1, 'customer__first_name': 'Bench',
+            'customer__last_name': 'Customer', 'customer__phone_number': 9000000000, 'customer__age': 40,
+            'loan_amount': loan.loan_amount, 'interest_rate': loan.interest_rate,
+            'monthly_repayment': loan.monthly_repayment, 'tenure': loan.tenure,
+        }
+        for loan in loans
+    ]
+    stdlib = JSONRenderer()
+    fast = FastJSONRenderer()
+    orjson_case = 'orjson' if orjson is not None else 'orjson not installed, stdlib'
+    list_map = field_map(LoanListSerializer)
+    detail_map = field_map(LoanDetailSerializer)
+    cases = [
+        ('loan list, DRF serializer', lambda: stdlib.render(LoanListSerializer(list_rows, many=True).data)),
+        ('loan list, field map', lambda: stdlib.render(list_map.represent_many(list_rows))),
+        (f'loan list, field map + {orjson_case}', lambda: fast.render(list_map.represent_many(list_rows))),
+        ('loan detail, DRF serializer', lambda: [stdlib.render(LoanDetailSerializer(loan).data) for loan in loans]),
+        ('loan detail, field map', lambda: [stdlib.render(detail_map.represent(row)) for row in detail_rows]),
+        (f'loan detail, field map + {orjson_case}', lambda: [fast.render(detail_map.represent(row)) for row in detail_rows]),
+    ]
+    rows = []
+    with override_settings(READ_SERIALIZATION='orjson'):
+        outputs = {}
+        for case, run in cases:
+            start = time.perf_counter()
+            outputs[case] = run()
+            rows.append(result_row('serialization', case, items, time.perf_counter() - start))
+    if len({repr(output) for case, output in outputs.items() if case.startswith('loan list')}) != 1:
+        raise RuntimeError('Serialization paths produced different loan list bytes')
+    if len({repr(output) for case, output in outputs.items() if case.startswith('loan detail')}) != 1:
+        raise RuntimeError('Serialization paths produced different loan detail bytes')
+    return rows
+
+def benchmark_rules(items=200000, seed=0, **options):
+    """Time credit scoring and approval decisions through the hard-coded branches and the compiled ruleset
+
+    Runs in memory on synthetic loan histories and applications, under the default
+    ruleset, and checks both paths reach the same decisions. The ruleset is fetched once,
+    as the eligibility code does per request. Each case reports the best of three runs.
+    """
+    rng = random.Random(seed)
+    histories = []
+    for _ in range(items):
+        approved_limit = Decimal(rng.randrange(100000, 10000000, 100000))
+        loan_count = rng.choice([0, rng.randint(1, 3), rng.randint(1, 15)])
+        total_tenure = rng.randint(loan_count * 6, loan_count * 120) if loan_count else 0
+        histories.append(({
+            'loan_count': loan_count,
+            'total_tenure': total_tenure,
+            'total_emis_paid_on_time': rng.randint(0, total_tenure),
+            'current_year_loan_count': rng.randint(0, loan_count),
+            'total_loan_amount': approved_limit * Decimal(rng.randint(0, 150)) / 100,
+            'active_loan_amount': approved_limit * Decimal(rng.randint(0, 110)) / 100,
+        }, approved_limit))
+    applications = [
+        (
+            rng.uniform(0, 100),
+            Decimal(rng.randint(500, 2000)) / 100,
+            Decimal(rng.randint(1000, 100000)),
+            Decimal(rng.randrange(20000, 200000, 1000)),
+        )
+        for _ in range(items)
+    ]
+
+    def decide(corrected_interest_rate, loan_approved):
+        decisions = []
+        for credit_score, rate, total_emis, salary in applications:
+            corrected_rate = corrected_interest_rate(credit_score, rate)
+            decisions.append((corrected_rate, loan_approved(credit_score, corrected_rate, total_emis, salary)))
+        return decisions
+
+    rows = []
+    outputs = []
+    with override_settings(CREDIT_RULES_FILE=''):
+        ruleset = current_ruleset()
+        cases = [
+            ('credit score, if/elif branches', lambda: [score_from_aggregates_legacy(*history) for history in histories]),
+            ('credit score, compiled ruleset', lambda: [ruleset.credit_score(*history) for history in histories]),
+            ('rate + approval, if/elif branches', lambda: decide(get_corrected_interest_rate_legacy, is_loan_approved_legacy)),
+            ('rate + approval, compiled ruleset', lambda: decide(ruleset.corrected_interest_rate, ruleset.approves_loan)),
+        ]
+        for case, run in cases:
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                output = run()
+                timings.append(time.perf_counter() - start)
+            outputs.append(output)
+            rows.append(result_row('rules', case, items, min(timings)))
+    if outputs[0] != outputs[1] or outputs[2] != outputs[3]:
+        raise RuntimeError('The compiled default ruleset disagreed with the hard-coded rules')
+    return rows
+
+def benchmark_registration(items=2000, seed=0, **options):
+    """Compare per-registration cost of the single and batch registration endpoints
+
+    Also times the approved limit computation alone, row by row and vectorized, best of three.
+    """
+    rng = random.Random(seed)
+    client = Client()
+    first_phone = (Customer.objects.aggregate(Max('phone_number'))['phone_number__max'] or 6000000000) + 1
+    registrations = [
+        {
+            'first_name': 'Bench',
+            'last_name': f'Registrant{index}',
+            'age': rng.randint(21, 65),
+            'monthly_income': rng.randrange(2000000, 20000000) / 100,
+            'phone_number': first_phone + index,
+        }
+        for index in range(2 * items)
+    ]
+    rows = []
+    with rolled_back():
+        def post_each():
+            return [
+                client.post('/api/register', data=json.dumps(registration), content_type='application/json').status_code
+                for registration in registrations[:items]
+            ]
+
+        statuses, seconds, queries = measure(post_each)
+        rows.append(result_row('registration', 'single endpoint', items, seconds, queries))
+        if any(status != 201 for status in statuses):
+            raise RuntimeError('Single registrations failed')
+
+        def post_batches():
+            batch_size = settings.REGISTRATION_BATCH_MAX_SIZE
+            return [
+                client.post('/api/register/batch', data=json.dumps(registrations[start:start + batch_size]), content_type='application/json')
+                for start in range(items, 2 * items, batch_size)
+            ]
+
+        responses, seconds, queries = measure(post_batches)
+        rows.append(result_row('registration', 'batch endpoint', items, seconds, queries))
+        if any(response.status_code != 200 or response.json()['failed'] for response in responses):
+            raise RuntimeError('Batch registrations failed')
+
+    salaries = [Decimal(str(registration['monthly_income'])) for registration in registrations]
+    outputs = []
+    for case, run in [
+        ('approved limits, per row', lambda: [calculate_approved_limit(salary) for salary in salaries]),
+        ('approved limits, vectorized', lambda: calculate_approved_limits(salaries)),
+    ]:
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            output = run()
+            timings.append(time.perf_counter() - start)
+        outputs.append(output)
+        rows.append(result_row('registration', case, len(salaries), min(timings)))
+    if outputs[0] != outputs[1]:
+        raise RuntimeError('Vectorized approved limits differ from the per-row formula')
+    return rows
+
+def benchmark_loan_book(customers=200, loans_per_customer=5, items=5000, seed=0, **options):
+    """Compare check_loan_eligibility on the database path with the in-process loan book snapshot
+
+    Also reports the snapshot's load and no-change refresh times over every customer in
+    the database, and its memory per customer.
+    """
+    rows = []
+    with rolled_back():
+        customer_ids = create_benchmark_portfolio(customers, loans_per_customer, seed)
+        applications = [
+            (application['customer_id'], Decimal(application['loan_amount']), Decimal(str(application['interest_rate'])), application['tenure'])
+            for application in random_applications(customer_ids, items, seed)
+        ]
+        score_cache = get_score_cache()
+
+        def check_uncached():
+            results = []
+            for application in applications:
+                score_cache.clear()
+                results.append(check_loan_eligibility(*application))
+            return results
+
+        def check_all():
+            return [check_loan_eligibility(*application) for application in applications]
+
+        outputs = []
+        with override_settings(LOAN_BOOK_SNAPSHOT=False):
+            # Build the credit profiles first, so the database path takes its steady-state route
+            check_all()
+            output, seconds, queries = measure(check_uncached)
+            outputs.append(output)
+            rows.append(result_row('loan_book', 'database, score cache miss', items, seconds, queries))
+            output, seconds, queries = measure(check_all)
+            outputs.append(output)
+            rows.append(result_row('loan_book', 'database, score cache hit', items, seconds, queries))
+
+        with override_settings(LOAN_BOOK_SNAPSHOT=True, LOAN_BOOK_MAX_STALENESS_SECONDS=3600):
+            book, seconds, queries = measure(get_loan_book)
+            per_customer = book.nbytes / len(book) if len(book) else 0
+            rows.append(result_row('loan_book', f'snapshot load, {per_customer:.0f} bytes/customer', len(book), seconds, queries))
+            # The benchmark's own rows fall inside the watermark overlap, so they are re-read
+            changed = len(changed_customer_ids(book.watermark - timedelta(seconds=settings.LOAN_BOOK_WATERMARK_OVERLAP_SECONDS)))
+            _, seconds, queries = measure(refresh_loan_book, book)
+            rows.append(result_row('loan_book', f'snapshot refresh, {changed} customers changed', len(book), seconds, queries))
+            output, seconds, queries = measure(check_all)
+            outputs.append(output)
+            rows.append(result_row('loan_book', 'snapshot', items, seconds, queries))
+    if any(output != outputs[0] for output in outputs):
+        raise RuntimeError('The loan book snapshot disagreed with the database path')
+    return rows
+
+BENCHMARKS = {
+    'amortization': benchmark_amortization,
+    'async': benchmark_async,
+    'eligibility': benchmark_eligibility,
+    'ingestion': benchmark_ingestion,
+    'loan_book': benchmark_loan_book,
+    'registration': benchmark_registration,
+    'rules': benchmark_rules,
+    'serialization': benchmark_serialization,
+}
+
+def format_result_row(row):
+    queries = f"{row['queries']} queries ({row['queries_per_item']:.2f}/item)" if row['queries'] is not None else ''
+    return (
+        f"{row['suite']:<14} {row['case']:<36} {row['items']:>8} items  {row['seconds']:>9.3f}s  "
+        f"{row['per_item_ms']:>9.3f} ms/item  {queries}"
+    )
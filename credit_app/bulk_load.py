@@ -0,0 +1,207 @@
+import csv
+from decimal import Decimal
+import io
+from django.db import connection, transaction
+from django.utils import timezone
+from .ingestion import (
+    CUSTOMER_COLUMNS, DEFAULT_CUSTOMER_AGE, LOAN_COLUMNS, REQUIRED_CUSTOMER_FIELDS, REQUIRED_LOAN_FIELDS,
+    IngestionStats, chunked, iter_source_rows, record_created_events, reset_customer_sequence, to_date, to_decimal
+)
+from .models import Customer, Loan, OutboxEvent
+from .portfolio import mark_new_portfolio_customers, mark_portfolio_stale
+from .profiles import rebuild_credit_profiles
+
+CUSTOMER_STAGING_COLUMNS = [
+    ('row_number', 'integer'),
+    ('excel_customer_id', 'bigint'),
+    ('first_name', 'text'),
+    ('last_name', 'text'),
+    ('age', 'integer'),
+    ('phone_number', 'bigint'),
+    ('monthly_salary', 'numeric(12, 2)'),
+    ('approved_limit', 'numeric(12, 2)'),
+    ('current_debt', 'numeric(12, 2)'),
+]
+LOAN_STAGING_COLUMNS = [
+    ('row_number', 'integer'),
+    ('excel_customer_id', 'bigint'),
+    ('excel_loan_id', 'bigint'),
+    ('loan_amount', 'numeric(12, 2)'),
+    ('tenure', 'integer'),
+    ('interest_rate', 'numeric(5, 2)'),
+    ('monthly_repayment', 'numeric(12, 2)'),
+    ('emis_paid_on_time', 'integer'),
+    ('start_date', 'date'),
+    ('end_date', 'date'),
+]
+
+# The first row for each phone number that is not already registered; the unique
+# constraints on phone_number and source_customer_id catch concurrent writers
+MERGE_CUSTOMERS_SQL = """
+    INSERT INTO customers (
+        first_name, last_name, age, phone_number, monthly_salary, approved_limit, current_debt,
+        source_customer_id, created_at, updated_at
+    )
+    SELECT s.first_name, s.last_name, s.age, s.phone_number, s.monthly_salary, s.approved_limit, s.current_debt,
+           s.excel_customer_id, %s, %s
+    FROM customer_staging s
+    JOIN (SELECT phone_number, MIN(row_number) AS first_row FROM customer_staging GROUP BY phone_number) f
+      ON f.first_row = s.row_number
+    WHERE NOT EXISTS (SELECT 1 FROM customers c WHERE c.phone_number = s.phone_number)
+    ORDER BY s.row_number
+    ON CONFLICT DO NOTHING
+    RETURNING customer_id
+"""
+
+# Workbook customer IDs, matched by source ID or, for customers ingested before source
+# IDs were recorded, by position (see build_customer_id_map)
+SOURCE_ID_MAP_SQL = 'SELECT source_customer_id AS excel_customer_id, customer_id FROM customers WHERE source_customer_id IS NOT NULL'
+POSITION_MAP_SQL = 'SELECT ROW_NUMBER() OVER (ORDER BY customer_id) AS excel_customer_id, customer_id FROM customers'
+
+# Loans already stored under the same customer and workbook loan ID are left as they are.
+# Rows without a loan ID pair one to one with stored loans without one of the same customer,
+# amount, tenure and start date, as in ingest_loans, and only the rows left over are inserted.
+MERGE_LOANS_SQL = """
+    INSERT INTO loans (
+        customer_id, loan_amount, tenure, interest_rate, monthly_repayment, emis_paid_on_time,
+        start_date, end_date, source_loan_id, created_at, updated_at
+    )
+    SELECT m.customer_id, s.loan_amount, s.tenure, s.interest_rate, s.monthly_repayment, s.emis_paid_on_time,
+           s.start_date, s.end_date, s.excel_loan_id, %s, %s
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (
+            PARTITION BY excel_customer_id, excel_loan_id, loan_amount, tenure, start_date ORDER BY row_number
+        ) AS copy_number
+        FROM loan_staging
+    ) s
+    JOIN ({customer_map}) m ON m.excel_customer_id = s.excel_customer_id
+    WHERE s.excel_loan_id IS NOT NULL OR s.copy_number > (
+        SELECT COUNT(*) FROM loans l
+        WHERE l.customer_id = m.customer_id AND l.source_loan_id IS NULL AND l.loan_amount = s.loan_amount
+          AND l.tenure = s.tenure AND l.start_date = s.start_date
+    )
+    ORDER BY s.row_number
+    ON CONFLICT DO NOTHING
+    RETURNING loan_id
+"""
+
+LOADED_CUSTOMERS_SQL = """
+    SELECT DISTINCT m.customer_id
+    FROM loan_staging s
+    JOIN ({customer_map}) m ON m.excel_customer_id = s.excel_customer_id
+"""
+
+def customer_staging_row(row_number, record):
+    if record['first_name'] is None or record['last_name'] is None:
+        raise ValueError('Missing name')
+    return (
+        row_number,
+        int(record['excel_customer_id']),
+        str(record['first_name']),
+        str(record['last_name']),
+        int(record.get('age') or DEFAULT_CUSTOMER_AGE),
+        int(record['phone_number']),
+        to_decimal(record['monthly_salary']),
+        to_decimal(record['approved_limit']),
+        to_decimal(record.get('current_debt'), Decimal('0')),
+    )
+
+def loan_staging_row(row_number, record):
+    return (
+        row_number,
+        int(record['excel_customer_id']),
+        int(record['excel_loan_id']) if record.get('excel_loan_id') is not None else None,
+        to_decimal(record['loan_amount']),
+        int(record['tenure']),
+        to_decimal(record['interest_rate']),
+        to_decimal(record['monthly_repayment']),
+        int(record['emis_paid_on_time'] or 0),
+        to_date(record['start_date']),
+        to_date(record['end_date']),
+    )
+
+def create_staging_table(cursor, table, columns):
+    cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    cursor.execute(f"CREATE TEMPORARY TABLE {table} ({', '.join(f'{name} {kind}' for name, kind in columns)})")
+
+def write_staging_rows(cursor, table, columns, rows):
+    """Append rows to a staging table with COPY FROM STDIN on PostgreSQL, executemany elsewhere"""
+    names = [name for name, _ in columns]
+    if connection.vendor == 'postgresql':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        options = 'FORMAT csv'
+        text_columns = [name for name, kind in columns if kind == 'text']
+        if text_columns:
+            # Empty text cells are empty strings, not NULL
+            options += f", FORCE_NOT_NULL ({', '.join(text_columns)})"
+        cursor.copy_expert(f"COPY {table} ({', '.join(names)}) FROM STDIN WITH ({options})", buffer)
+    else:
+        placeholders = ', '.join(['%s'] * len(names))
+        cursor.executemany(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({placeholders})", rows)
+
+def stage_file(cursor, stats, rows, table, columns, build_row, chunk_size):
+    """Validate source rows and stream the good ones into a staging table; returns rows staged"""
+    staged = 0
+    for chunk_number, chunk in enumerate(chunked(rows, chunk_size), start=1):
+        stats.chunks += 1
+        stats.rows_read += len(chunk)
+        valid = []
+        for row_number, record in chunk:
+            try:
+                valid.append(build_row(row_number, record))
+            except (TypeError, ValueError, ArithmeticError) as e:
+                stats.record_error(chunk_number, e, row_number)
+        if valid:
+            write_staging_rows(cursor, table, columns, valid)
+            staged += len(valid)
+    return staged
+
+def copy_load_customers(file_path, chunk_size):
+    """Load customers through a staging table and one set-based insert, in a single transaction"""
+    stats = IngestionStats('customers')
+    rows = iter_source_rows(file_path, CUSTOMER_COLUMNS, REQUIRED_CUSTOMER_FIELDS)
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        create_staging_table(cursor, 'customer_staging', CUSTOMER_STAGING_COLUMNS)
+        staged = stage_file(cursor, stats, rows, 'customer_staging', CUSTOMER_STAGING_COLUMNS, customer_staging_row, chunk_size)
+        # Exactly the rows this load inserted, not those other writers committed meanwhile
+        cursor.execute(MERGE_CUSTOMERS_SQL, [now, now])
+        created_ids = [row[0] for row in cursor.fetchall()]
+        stats.created = len(created_ids)
+        cursor.execute('DROP TABLE customer_staging')
+        reset_customer_sequence()
+        if stats.created:
+            mark_new_portfolio_customers()
+            record_created_events(OutboxEvent.TOPIC_CUSTOMER, Customer.objects.all(), created_ids)
+    stats.skipped = staged - stats.created
+    return stats.finish()
+
+def copy_load_loans(file_path, chunk_size, profile_batch_size=1000):
+    """Load loans through a staging table, mapping workbook customer IDs in SQL
+
+    Loans for unknown customers, and loans already stored under their workbook loan ID,
+    are skipped. The credit profiles of every customer that received loans are rebuilt in
+    the same transaction.
+    """
+    stats = IngestionStats('loans')
+    rows = iter_source_rows(file_path, LOAN_COLUMNS, REQUIRED_LOAN_FIELDS)
+    has_source_ids = Customer.objects.filter(source_customer_id__isnull=False).exists()
+    customer_map = SOURCE_ID_MAP_SQL if has_source_ids else POSITION_MAP_SQL
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        create_staging_table(cursor, 'loan_staging', LOAN_STAGING_COLUMNS)
+        staged = stage_file(cursor, stats, rows, 'loan_staging', LOAN_STAGING_COLUMNS, loan_staging_row, chunk_size)
+        cursor.execute(MERGE_LOANS_SQL.format(customer_map=customer_map), [now, now])
+        created_ids = [row[0] for row in cursor.fetchall()]
+        stats.created = len(created_ids)
+        cursor.execute(LOADED_CUSTOMERS_SQL.format(customer_map=customer_map))
+        customer_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute('DROP TABLE loan_staging')
+        for batch in chunked(customer_ids, profile_batch_size):
+            rebuild_credit_profiles(batch)
+        mark_portfolio_stale(customer_ids)
+        record_created_events(OutboxEvent.TOPIC_LOAN, Loan.objects.all(), created_ids)
+    stats.skipped = staged - stats.created
+    return stats.finish()
@@ -0,0 +1,105 @@
+"""Serialize .values() rows for the read endpoints without DRF field objects
+
+A FieldMap is compiled once from a DRF serializer class. Each field becomes an output
+name, the .values() lookup it reads and a converter doing what the field's
+to_representation does, so the output is the same as the serializer's. Building a
+ModelSerializer and its fields on every request, and the model instances it reads, is
+where most of the CPU time of the loan views went.
+"""
+from decimal import Decimal
+import decimal
+from functools import lru_cache
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from .metrics import request_phase
+from .renderers import PlainJSONDict, PlainJSONList
+
+def decimal_converter(field):
+    """Converter matching DecimalField.to_representation for string output"""
+    exponent = Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if type(value) is not Decimal:
+            value = Decimal(str(value).strip())
+        return format(value.quantize(exponent, rounding, context), 'f')
+    return convert
+
+def field_converter(field):
+    """Return (converter, plain) for a field; plain converters only return strings and ints
+
+    The common field types get a fast converter, others the field's own to_representation.
+    """
+    method = type(field).to_representation
+    if method is serializers.IntegerField.to_representation:
+        return int, True
+    if method is serializers.CharField.to_representation:
+        return str, True
+    if (
+        method is serializers.DecimalField.to_representation
+        and field.decimal_places is not None
+        and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        and not field.localize
+        and not field.normalize_output
+    ):
+        return decimal_converter(field), True
+    return field.to_representation, False
+
+class FieldMap:
+    """Precompiled (output name, lookup, converter) entries for one serializer"""
+
+    def __init__(self, serializer, fields=None, prefix=''):
+        self.entries = []
+        self.lookups = []
+        self.plain = True
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if field.source == '*' or isinstance(field, (serializers.ListSerializer, serializers.SerializerMethodField)):
+                raise ValueError(f'{type(serializer).__name__}.{name} cannot be read from .values() rows')
+            lookup = prefix + field.source.replace('.', '__')
+            if isinstance(field, serializers.BaseSerializer):
+                # Nested serializers read the related row's columns through the join; their
+                # entry has no lookup and converts the whole row
+                nested = FieldMap(field, prefix=lookup + '__')
+                self.entries.append((name, None, nested.to_representation))
+                self.lookups.extend(nested.lookups)
+                self.plain = self.plain and nested.plain
+            else:
+                convert, plain = field_converter(field)
+                self.entries.append((name, lookup, convert))
+                self.lookups.append(lookup)
+                self.plain = self.plain and plain
+
+    def to_representation(self, row):
+        return {
+            name: convert(row) if lookup is None else (None if (value := row[lookup]) is None else convert(value))
+            for name, lookup, convert in self.entries
+        }
+
+    def represent(self, row):
+        """Serialize one row, timed as serializer time in request metrics"""
+        with request_phase('serialize'):
+            data = self.to_representation(row)
+        return PlainJSONDict(data) if self.plain else data
+
+    def represent_many(self, rows):
+        with request_phase('serialize'):
+            data = [self.to_representation(row) for row in rows]
+        return PlainJSONList(data) if self.plain else data
+
+@lru_cache(maxsize=None)
+def compiled_field_map(serializer_class, fields=None):
+    return FieldMap(serializer_class(), fields)
+
+def field_map(serializer_class, fields=None):
+    """Cached FieldMap for a serializer class and an optional subset of its fields"""
+    return compiled_field_map(serializer_class, frozenset(fields) if fields is not None else None)
+
+def use_field_maps():
+    """Whether the read endpoints serialize through field maps (READ_SERIALIZATION is not 'drf')"""
+    return settings.READ_SERIALIZATION != 'drf'
@@ -0,0 +1,70 @@
+from functools import wraps
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+def request_fingerprint(data):
+    """SHA-256 of a request body, independent of key order"""
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+def replay_response(record, request_hash):
+    if record.request_hash != request_hash:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} was already used with a different request body'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(record.response_body, status=record.response_status, headers={REPLAYED_HEADER: 'true'})
+
+def idempotent(endpoint):
+    """Make a DRF view safe to retry with an Idempotency-Key header
+
+    The key is claimed in the same transaction as the view's writes, so it is only
+    consumed if they commit. A concurrent request with the same key waits on the unique
+    constraint until the first one finishes, then gets its stored response replayed.
+    Reusing a key with a different body returns 422. 5xx responses are not stored.
+    Requests without the header are passed straight through. Apply below @api_view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            request_hash = request_fingerprint(request.data)
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        record = IdempotencyKey.objects.create(endpoint=endpoint, key=key, request_hash=request_hash)
+                except IntegrityError:
+                    return replay_response(IdempotencyKey.objects.get(endpoint=endpoint, key=key), request_hash)
+
+                response = view(request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True)
+                    return response
+                record.response_status = response.status_code
+                record.response_body = response.data
+                record.save(update_fields=['response_status', 'response_body'])
+                return response
+        return wrapper
+    return decorator
+
+def purge_idempotency_keys(max_age):
+    """Delete keys older than max_age (a timedelta); returns the number deleted"""
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - max_age).delete()
+    return deleted
@@ -0,0 +1,681 @@
+from collections import defaultdict
+from datetime import datetime, date
+from decimal import Decimal
+from itertools import islice
+import csv
+import gzip
+import hashlib
+import os
+import time
+import openpyxl
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Customer, IngestionManifest, Loan, OutboxEvent
+from .outbox import record_events
+from .portfolio import mark_new_portfolio_customers, mark_portfolio_stale
+from .profiles import rebuild_credit_profiles, record_new_loans
+from .score_cache import invalidate_credit_scores
+
+# Bundled workbooks in the data directory
+DATA_FILES = {
+    'customers': 'customer_data.xlsx',
+    'loans': 'loan_data.xlsx',
+}
+
+CUSTOMER_COLUMNS = {
+    'customer id': 'excel_customer_id',
+    'first name': 'first_name',
+    'last name': 'last_name',
+    'age': 'age',
+    'phone number': 'phone_number',
+    'monthly salary': 'monthly_salary',
+    'approved limit': 'approved_limit',
+    'current debt': 'current_debt',
+}
+REQUIRED_CUSTOMER_FIELDS = ['excel_customer_id', 'first_name', 'last_name', 'phone_number', 'monthly_salary', 'approved_limit']
+
+LOAN_COLUMNS = {
+    'customer id': 'excel_customer_id',
+    'loan id': 'excel_loan_id',
+    'loan amount': 'loan_amount',
+    'tenure': 'tenure',
+    'interest rate': 'interest_rate',
+    'monthly payment': 'monthly_repayment',
+    'emis paid on time': 'emis_paid_on_time',
+    'date of approval': 'start_date',
+    'end date': 'end_date',
+}
+REQUIRED_LOAN_FIELDS = ['excel_customer_id', 'loan_amount', 'tenure', 'interest_rate', 'monthly_repayment', 'emis_paid_on_time', 'start_date', 'end_date']
+
+# Fields compared against existing rows to decide whether a source row changed
+CUSTOMER_SOURCE_FIELDS = ['first_name', 'last_name', 'age', 'phone_number', 'monthly_salary', 'approved_limit', 'current_debt']
+LOAN_SOURCE_FIELDS = ['loan_amount', 'tenure', 'interest_rate', 'monthly_repayment', 'emis_paid_on_time', 'start_date', 'end_date']
+
+DEFAULT_CUSTOMER_AGE = 30
+MAX_RECORDED_ERRORS = 100
+MANIFEST_COUNTERS = ['rows_read', 'created', 'updated', 'unchanged', 'skipped', 'error_count']
+
+def chunk_digest(chunk):
+    """SHA-256 of a chunk's source rows"""
+    return hashlib.sha256(repr([record for _, record in chunk]).encode()).hexdigest()
+
+class IngestionStats:
+    """Running counters for an ingestion run, continuing a manifest's totals when resuming
+
+    known_chunks maps the first row of each chunk of an earlier feed to its digest; a
+    chunk with the same rows is counted as unchanged without touching the database.
+    progress, if given, is called with the stats as each chunk finishes.
+    """
+
+    def __init__(self, label, manifest=None, known_chunks=None, progress=None):
+        self.label = label
+        self.rows_read = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.chunks = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+        self.manifest = manifest
+        self.known_chunks = known_chunks or {}
+        self.progress = progress
+        if manifest is not None:
+            for counter in MANIFEST_COUNTERS:
+                setattr(self, counter, getattr(manifest, counter))
+
+    def skip_unchanged_chunk(self, chunk):
+        """Count and checkpoint a chunk identical to the same rows of an earlier feed"""
+        if self.manifest is None or self.known_chunks.get(str(chunk[0][0])) != chunk_digest(chunk):
+            return False
+        self.unchanged += len(chunk)
+        self.checkpoint(chunk)
+        return True
+
+    def checkpoint(self, chunk, fully_applied=True):
+        """Record progress on the manifest; call inside the chunk's transaction
+
+        Only chunks whose every row was applied get a digest, so rows that failed or were
+        skipped are retried by the next feed.
+        """
+        if self.manifest is None:
+            return
+        self.manifest.last_row = chunk[-1][0]
+        if fully_applied:
+            self.manifest.chunk_hashes = dict(self.manifest.chunk_hashes, **{str(chunk[0][0]): chunk_digest(chunk)})
+        for counter in MANIFEST_COUNTERS:
+            setattr(self.manifest, counter, getattr(self, counter))
+        self.manifest.save(update_fields=['last_row', 'chunk_hashes', 'updated_at'] + MANIFEST_COUNTERS)
+
+    def outcome(self):
+        return self.error_count, self.skipped
+
+    def record_error(self, chunk, error, row=None):
+        self.error_count += 1
+        if len(self.errors) < MAX_RECORDED_ERRORS:
+            entry = {'chunk': chunk, 'error': str(error)}
+            if row is not None:
+                entry['row'] = row
+            self.errors.append(entry)
+
+    def report(self):
+        """Pass the counters so far to the progress callback"""
+        if self.progress is not None:
+            self.progress(self)
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+        self.report()
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'rows_read': self.rows_read,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'skipped': self.skipped,
+            'chunks': self.chunks,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'elapsed': self.elapsed,
+        }
+
+    def summary(self):
+        message = (
+            f"Successfully ingested {self.created} {self.label} "
+            f"({self.rows_read} rows in {self.elapsed:.2f}s, {self.rows_per_second:.0f} rows/s, "
+            f"{self.chunks} chunks, {self.updated} updated, {self.unchanged} unchanged, "
+            f"{self.skipped} skipped, {self.error_count} errors)"
+        )
+        for error in self.errors:
+            location = f"chunk {error['chunk']}" + (f", row {error['row']}" if 'row' in error else '')
+            message += f"\n  {location}: {error['error']}"
+        return message
+
+def map_header(header, columns, required, file_path):
+    """Return {field: column index} for the known columns of a header row"""
+    positions = {}
+    for index, title in enumerate(header):
+        field = columns.get(str(title).strip().lower()) if title is not None else None
+        if field:
+            positions[field] = index
+    missing = [field for field in required if field not in positions]
+    if missing:
+        raise ValueError(f"Missing columns in {file_path}: {', '.join(missing)}")
+    return positions
+
+def select_rows(rows, positions, min_row=2, max_row=None):
+    """Yield (row_number, record) for data rows numbered from 2, as in a sheet"""
+    for row_number, row in enumerate(rows, start=2):
+        if row_number < min_row:
+            continue
+        if max_row is not None and row_number > max_row:
+            return
+        if not row or row[0] is None:
+            continue
+        yield row_number, {field: row[index] if index < len(row) else None for field, index in positions.items()}
+
+def iter_sheet_rows(file_path, columns, required, min_row=2, max_row=None):
+    """Stream (row_number, record) pairs from the first sheet, keyed by header name"""
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
+        positions = map_header(header, columns, required, file_path)
+        for row_number, row in enumerate(sheet.iter_rows(min_row=min_row, max_row=max_row, values_only=True), start=min_row):
+            if not row or row[0] is None:
+                continue
+            yield row_number, {field: row[index] if index < len(row) else None for field, index in positions.items()}
+    finally:
+        workbook.close()
+
+def iter_csv_rows(file_path, columns, required, min_row=2, max_row=None):
+    """Stream (row_number, record) pairs from a CSV or gzipped CSV file; empty cells are None"""
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rt', newline='') as source:
+        reader = csv.reader(source)
+        positions = map_header(next(reader, []), columns, required, file_path)
+        rows = ([value if value != '' else None for value in row] for row in reader)
+        yield from select_rows(rows, positions, min_row, max_row)
+
+def iter_parquet_rows(file_path, columns, required, min_row=2, max_row=None, batch_size=65536):
+    """Stream (row_number, record) pairs from a Parquet file (needs pyarrow)"""
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError(f'Reading {file_path} needs pyarrow (pip install pyarrow)')
+    parquet_file = pyarrow.parquet.ParquetFile(file_path)
+    positions = map_header(parquet_file.schema_arrow.names, columns, required, file_path)
+
+    def rows():
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+    yield from select_rows(rows(), positions, min_row, max_row)
+
+def iter_source_rows(file_path, columns, required, min_row=2, max_row=None):
+    """Stream (row_number, record) pairs from an xlsx, CSV, gzipped CSV or Parquet file"""
+    name = file_path.lower()
+    if name.endswith(('.csv', '.csv.gz')):
+        return iter_csv_rows(file_path, columns, required, min_row, max_row)
+    if name.endswith('.parquet'):
+        return iter_parquet_rows(file_path, columns, required, min_row, max_row)
+    return iter_sheet_rows(file_path, columns, required, min_row, max_row)
+
+def count_sheet_rows(file_path):
+    """Return the last row number of the first sheet, including the header"""
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        sheet = workbook.active
+        if sheet.max_row:
+            return sheet.max_row
+        # No dimension record in the file, so the rows have to be counted
+        return sum(1 for _ in sheet.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+def count_source_rows(file_path):
+    """Return the number of data rows in a file, or None for Parquet files without pyarrow
+
+    Workbooks are counted from their dimension record and CSV files by reading them once.
+    """
+    name = file_path.lower()
+    if name.endswith(('.csv', '.csv.gz')):
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(file_path, 'rt', newline='') as source:
+            return max(sum(1 for _ in csv.reader(source)) - 1, 0)
+    if name.endswith('.parquet'):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            return None
+        return pyarrow.parquet.ParquetFile(file_path).metadata.num_rows
+    return max(count_sheet_rows(file_path) - 1, 0)
+
+def plan_row_ranges(last_row, rows_per_range, first_row=2):
+    """Split data rows into inclusive (min_row, max_row) ranges"""
+    return [
+        (start, min(start + rows_per_range - 1, last_row))
+        for start in range(first_row, last_row + 1, rows_per_range)
+    ]
+
+def chunked(iterable, size):
+    """Yield lists of at most size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def to_decimal(value, default=None):
+    if value is None or value == '':
+        if default is None:
+            raise ValueError("Missing numeric value")
+        return default
+    return Decimal(str(value))
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        return datetime.strptime(value.strip()[:10], '%Y-%m-%d').date()
+    raise ValueError(f"Invalid date: {value!r}")
+
+def build_customer(record):
+    return Customer(
+        first_name=record['first_name'],
+        last_name=record['last_name'],
+        age=int(record.get('age') or DEFAULT_CUSTOMER_AGE),
+        phone_number=int(record['phone_number']),
+        monthly_salary=to_decimal(record['monthly_salary']),
+        approved_limit=to_decimal(record['approved_limit']),
+        current_debt=to_decimal(record.get('current_debt'), Decimal('0')),
+        source_customer_id=int(record['excel_customer_id']),
+    )
+
+def build_loan(record, customer_id):
+    return Loan(
+        customer_id=customer_id,
+        loan_amount=to_decimal(record['loan_amount']),
+        tenure=int(record['tenure']),
+        interest_rate=to_decimal(record['interest_rate']),
+        monthly_repayment=to_decimal(record['monthly_repayment']),
+        emis_paid_on_time=int(record['emis_paid_on_time'] or 0),
+        start_date=to_date(record['start_date']),
+        end_date=to_date(record['end_date']),
+        source_loan_id=int(record['excel_loan_id']) if record.get('excel_loan_id') is not None else None,
+    )
+
+def changed_fields(instance, incoming, fields):
+    return [field for field in fields if getattr(instance, field) != getattr(incoming, field)]
+
+def insert_new_rows(model, instances, batch_size):
+    """Insert instances with ON CONFLICT DO NOTHING; returns the primary keys of the rows inserted
+
+    Unlike bulk_create(ignore_conflicts=True), this tells the caller's rows apart from
+    conflicting ones another writer inserted concurrently.
+    """
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = f"({', '.join(['%s'] * len(fields))})"
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, instances) or batch_size)
+    ids = []
+    with connection.cursor() as cursor:
+        for batch in chunked(instances, batch_size):
+            params = [
+                field.get_db_prep_save(field.pre_save(instance, True), connection)
+                for instance in batch for field in fields
+            ]
+            cursor.execute(
+                f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f'ON CONFLICT DO NOTHING RETURNING {connection.ops.quote_name(model._meta.pk.column)}',
+                params
+            )
+            ids.extend(row[0] for row in cursor.fetchall())
+    return ids
+
+def record_created_events(topic, queryset, ids, batch_size=1000):
+    """Record created events for the rows of queryset an insert returned the primary keys of"""
+    for batch in chunked(sorted(ids), batch_size):
+        record_events(topic, OutboxEvent.TYPE_CREATED, queryset.filter(pk__in=batch).order_by('pk'))
+
+def ingest_customers(file_path, chunk_size, min_row=2, max_row=None, manifest=None, known_chunks=None, progress=None):
+    """Upsert customers from a data file in bulk chunks, keyed by the workbook customer ID
+
+    New customers are inserted unless their phone number is already registered; known
+    ones are updated only when a field differs. With a manifest, each chunk's progress
+    commits with its writes.
+    """
+    stats = IngestionStats('customers', manifest, known_chunks, progress)
+    rows = iter_source_rows(file_path, CUSTOMER_COLUMNS, REQUIRED_CUSTOMER_FIELDS, min_row, max_row)
+
+    for chunk_number, chunk in enumerate(chunked(rows, chunk_size), start=1):
+        # Progress after the previous chunk; finish() reports the last one
+        if chunk_number > 1:
+            stats.report()
+        stats.chunks += 1
+        stats.rows_read += len(chunk)
+        if stats.skip_unchanged_chunk(chunk):
+            continue
+        outcome = stats.outcome()
+        customers = {}
+        phones = set()
+        for row_number, record in chunk:
+            try:
+                customer = build_customer(record)
+            except (TypeError, ValueError, ArithmeticError) as e:
+                stats.record_error(chunk_number, e, row_number)
+                continue
+            if customer.source_customer_id in customers or customer.phone_number in phones:
+                stats.skipped += 1
+                continue
+            customers[customer.source_customer_id] = customer
+            phones.add(customer.phone_number)
+
+        try:
+            with transaction.atomic():
+                known = Customer.objects.in_bulk(list(customers), field_name='source_customer_id')
+                new_phones = [customer.phone_number for source_id, customer in customers.items() if source_id not in known]
+                registered = set(Customer.objects.filter(phone_number__in=new_phones).values_list('phone_number', flat=True))
+
+                new_customers, changed, unchanged, skipped = [], [], 0, 0
+                for source_id, customer in customers.items():
+                    existing = known.get(source_id)
+                    if existing is None:
+                        if customer.phone_number in registered:
+                            skipped += 1
+                        else:
+                            new_customers.append(customer)
+                    elif changed_fields(existing, customer, CUSTOMER_SOURCE_FIELDS):
+                        for field in CUSTOMER_SOURCE_FIELDS:
+                            setattr(existing, field, getattr(customer, field))
+                        existing.updated_at = timezone.now()
+                        changed.append(existing)
+                    else:
+                        unchanged += 1
+
+                # ON CONFLICT skips phone numbers or source IDs inserted concurrently by another
+                # writer, whose rows already have their own created events
+                created_ids = insert_new_rows(Customer, new_customers, chunk_size)
+                Customer.objects.bulk_update(changed, CUSTOMER_SOURCE_FIELDS + ['updated_at'], batch_size=chunk_size)
+                record_created_events(OutboxEvent.TOPIC_CUSTOMER, Customer.objects.all(), created_ids)
+                record_events(OutboxEvent.TOPIC_CUSTOMER, OutboxEvent.TYPE_UPDATED, changed)
+                invalidate_credit_scores(customer.customer_id for customer in changed)
+                mark_portfolio_stale(customer.customer_id for customer in changed)
+                if created_ids:
+                    mark_new_portfolio_customers()
+                stats.created += len(created_ids)
+                # Lost to a concurrent writer
+                stats.skipped += len(new_customers) - len(created_ids)
+                stats.updated += len(changed)
+                stats.unchanged += unchanged
+                stats.skipped += skipped
+                stats.checkpoint(chunk, fully_applied=stats.outcome() == outcome)
+        except Exception as e:
+            stats.record_error(chunk_number, e)
+            continue
+
+    return stats.finish()
+
+def build_customer_id_map():
+    """Map Excel customer IDs to database customer IDs, loaded once per run"""
+    source_ids = Customer.objects.filter(source_customer_id__isnull=False).values_list('source_customer_id', 'customer_id')
+    customer_map = dict(source_ids.iterator())
+    if customer_map:
+        return customer_map
+    # Customers ingested before source IDs were recorded are matched by position, as they always were
+    customer_ids = Customer.objects.order_by('customer_id').values_list('customer_id', flat=True)
+    return {position: customer_id for position, customer_id in enumerate(customer_ids.iterator(), start=1)}
+
+def loan_identity(loan):
+    """What identifies a loan stored without a source loan ID"""
+    return (loan.customer_id, loan.loan_amount, loan.tenure, loan.start_date)
+
+def loans_without_source_ids(customer_ids):
+    """Stored loans without a source loan ID, grouped by loan_identity in loan_id order"""
+    stored = defaultdict(list)
+    for loan in Loan.objects.filter(customer_id__in=customer_ids, source_loan_id__isnull=True).order_by('loan_id'):
+        stored[loan_identity(loan)].append(loan)
+    return stored
+
+def adopt_legacy_loans(loans, customer_ids):
+    """Match loans ingested before source loan IDs were recorded to incoming rows
+
+    A stored loan without a source ID is the same loan as an incoming row with the same
+    customer, amount, tenure and start date. Returns {(customer_id, source_loan_id): loan}.
+    """
+    legacy = loans_without_source_ids(customer_ids)
+    adopted = {}
+    for key, incoming in loans.items():
+        candidates = legacy.get(loan_identity(incoming))
+        if candidates:
+            loan = candidates.pop(0)
+            loan.source_loan_id = incoming.source_loan_id
+            adopted[key] = loan
+    return adopted
+
+def match_unkeyed_loans(loans, customer_ids, exclude=()):
+    """Pair incoming rows without a loan ID with stored loans without one, as adopt_legacy_loans does
+
+    Each stored loan pairs with at most one row, so a file holding the same loan twice keeps
+    both. Loans in exclude, already adopted by keyed rows, are left out. Returns a list of
+    (incoming, stored loan or None).
+    """
+    stored = loans_without_source_ids(customer_ids)
+    for candidates in stored.values():
+        candidates[:] = [loan for loan in candidates if loan.loan_id not in exclude]
+    pairs = []
+    for incoming in loans:
+        candidates = stored.get(loan_identity(incoming))
+        pairs.append((incoming, candidates.pop(0) if candidates else None))
+    return pairs
+
+def ingest_loans(
+    file_path, chunk_size, min_row=2, max_row=None, customer_map=None, manifest=None, known_chunks=None, progress=None
+):
+    """Upsert loans from a data file in bulk chunks, keyed by customer and workbook loan ID
+
+    Rows without a loan ID are matched to stored loans without one on customer, amount,
+    tenure and start date, and inserted only when none is left. Known loans are updated
+    only when a field differs, and the affected credit profiles are rebuilt. With a
+    manifest, each chunk's progress commits with its writes.
+    """
+    stats = IngestionStats('loans', manifest, known_chunks, progress)
+    if customer_map is None:
+        customer_map = build_customer_id_map()
+    rows = iter_source_rows(file_path, LOAN_COLUMNS, REQUIRED_LOAN_FIELDS, min_row, max_row)
+
+    for chunk_number, chunk in enumerate(chunked(rows, chunk_size), start=1):
+        # Progress after the previous chunk; finish() reports the last one
+        if chunk_number > 1:
+            stats.report()
+        stats.chunks += 1
+        stats.rows_read += len(chunk)
+        if stats.skip_unchanged_chunk(chunk):
+            continue
+        outcome = stats.outcome()
+        keyed = {}
+        unkeyed = []
+        for row_number, record in chunk:
+            try:
+                customer_id = customer_map.get(int(record['excel_customer_id']))
+                if customer_id is None:
+                    stats.skipped += 1
+                    continue
+                loan = build_loan(record, customer_id)
+            except (TypeError, ValueError, ArithmeticError) as e:
+                stats.record_error(chunk_number, e, row_number)
+                continue
+            if loan.source_loan_id is None:
+                unkeyed.append(loan)
+            elif (customer_id, loan.source_loan_id) in keyed:
+                stats.skipped += 1
+            else:
+                keyed[(customer_id, loan.source_loan_id)] = loan
+
+        try:
+            with transaction.atomic():
+                customer_ids = {customer_id for customer_id, _ in keyed} | {loan.customer_id for loan in unkeyed}
+                known = {
+                    (loan.customer_id, loan.source_loan_id): loan
+                    for loan in Loan.objects.filter(
+                        customer_id__in=customer_ids, source_loan_id__in={source_id for _, source_id in keyed}
+                    )
+                }
+                adopted = adopt_legacy_loans({key: loan for key, loan in keyed.items() if key not in known}, customer_ids)
+
+                matched = match_unkeyed_loans(unkeyed, customer_ids, exclude={loan.loan_id for loan in adopted.values()})
+                pairs = [(loan, existing, False) for loan, existing in matched] + [
+                    (loan, known.get(key) or adopted.get(key), key in adopted) for key, loan in keyed.items()
+                ]
+
+                new_loans, changed, unchanged = [], [], 0
+                for loan, existing, adopting in pairs:
+                    if existing is None:
+                        new_loans.append(loan)
+                    elif adopting or changed_fields(existing, loan, LOAN_SOURCE_FIELDS):
+                        for field in LOAN_SOURCE_FIELDS:
+                            setattr(existing, field, getattr(loan, field))
+                        existing.updated_at = timezone.now()
+                        changed.append(existing)
+                    else:
+                        unchanged += 1
+                Loan.objects.bulk_create(new_loans, batch_size=chunk_size)
+                record_new_loans(new_loans)
+                record_events(OutboxEvent.TOPIC_LOAN, OutboxEvent.TYPE_CREATED, new_loans)
+                if changed:
+                    Loan.objects.bulk_update(changed, LOAN_SOURCE_FIELDS + ['source_loan_id', 'updated_at'], batch_size=chunk_size)
+                    rebuild_credit_profiles({loan.customer_id for loan in changed})
+                    record_events(OutboxEvent.TOPIC_LOAN, OutboxEvent.TYPE_UPDATED, changed)
+                mark_portfolio_stale({loan.customer_id for loan in new_loans + changed})
+                stats.created += len(new_loans)
+                stats.updated += len(changed)
+                stats.unchanged += unchanged
+                stats.checkpoint(chunk, fully_applied=stats.outcome() == outcome)
+        except Exception as e:
+            stats.record_error(chunk_number, e)
+            continue
+
+    return stats.finish()
+
+def file_checksum(file_path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ingest_file(label, file_path, chunk_size, force=False, progress=None):
+    """Ingest customers or loans incrementally, tracked by a manifest keyed on the file hash
+
+    A file already ingested completely is skipped unless force is set. A run interrupted
+    part-way resumes after the last committed chunk, with its original chunk size. Chunks
+    identical to the same rows of the last completed feed are skipped; force compares
+    every row with the database instead. Returns (stats, manifest), with stats None when
+    the file was skipped. progress is passed on to the loader.
+    """
+    manifest, _ = IngestionManifest.objects.get_or_create(
+        label=label,
+        file_hash=file_checksum(file_path),
+        defaults={'file_path': file_path, 'file_size': os.path.getsize(file_path), 'chunk_size': chunk_size},
+    )
+    if manifest.status == IngestionManifest.STATUS_COMPLETED:
+        if not force:
+            return None, manifest
+        manifest.chunk_size = chunk_size
+        manifest.last_row = 1
+        manifest.chunk_hashes = {}
+        for counter in MANIFEST_COUNTERS:
+            setattr(manifest, counter, 0)
+    manifest.file_path = file_path
+    manifest.status = IngestionManifest.STATUS_RUNNING
+    manifest.completed_at = None
+    manifest.save()
+
+    known_chunks = None
+    if not force:
+        previous = (
+            IngestionManifest.objects.filter(
+                label=label, status=IngestionManifest.STATUS_COMPLETED, chunk_size=manifest.chunk_size
+            )
+            .exclude(pk=manifest.pk)
+            .order_by('-completed_at')
+            .first()
+        )
+        known_chunks = previous.chunk_hashes if previous else None
+
+    ingest = ingest_customers if label == 'customers' else ingest_loans
+    stats = ingest(
+        file_path, manifest.chunk_size, min_row=manifest.last_row + 1, manifest=manifest, known_chunks=known_chunks,
+        progress=progress
+    )
+    manifest.status = IngestionManifest.STATUS_COMPLETED
+    manifest.row_count = manifest.rows_read
+    manifest.completed_at = timezone.now()
+    manifest.save(update_fields=['status', 'row_count', 'completed_at', 'updated_at'])
+    return stats, manifest
+
+def format_skipped_file(manifest):
+    return (
+        f"Skipped {manifest.label}: {manifest.file_path} is unchanged since it was ingested at "
+        f"{manifest.completed_at:%Y-%m-%d %H:%M} ({manifest.row_count} rows)"
+    )
+
+def reset_customer_sequence():
+    """Move the customers sequence past explicitly inserted IDs (PostgreSQL only)"""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT setval(pg_get_serial_sequence('customers', 'customer_id'), COALESCE(MAX(customer_id), 1)) FROM customers;")
+
+
+def combine_range_results(label, results, started_at=None):
+    """Merge per-range ingestion results into run totals"""
+    totals = {
+        'label': label,
+        'rows_read': sum(result['rows_read'] for result in results),
+        'created': sum(result['created'] for result in results),
+        'updated': sum(result['updated'] for result in results),
+        'unchanged': sum(result['unchanged'] for result in results),
+        'skipped': sum(result['skipped'] for result in results),
+        'error_count': sum(result['error_count'] for result in results),
+        'ranges': [
+            {key: result[key] for key in ('min_row', 'max_row', 'rows_read', 'created', 'skipped', 'error_count', 'elapsed')}
+            for result in sorted(results, key=lambda result: result['min_row'])
+        ],
+        'errors': [error for result in results for error in result['errors']][:MAX_RECORDED_ERRORS],
+    }
+    elapsed = time.time() - started_at if started_at else max((result['elapsed'] for result in results), default=0.0)
+    totals['elapsed'] = elapsed
+    totals['rows_per_second'] = totals['rows_read'] / elapsed if elapsed > 0 else 0.0
+    return totals
+
+def format_range_summary(totals):
+    message = (
+        f"Successfully ingested {totals['created']} {totals['label']} across {len(totals['ranges'])} ranges "
+        f"({totals['rows_read']} rows in {totals['elapsed']:.2f}s, {totals['rows_per_second']:.0f} rows/s, "
+        f"{totals['updated']} updated, {totals['unchanged']} unchanged, "
+        f"{totals['skipped']} skipped, {totals['error_count']} errors)"
+    )
+    for result in totals['ranges']:
+        message += (
+            f"\n  rows {result['min_row']}-{result['max_row']}: {result['created']} created, "
+            f"{result['skipped']} skipped, {result['error_count']} errors in {result['elapsed']:.2f}s"
+        )
+    for error in totals['errors']:
+        location = f"rows {error['range']} chunk {error['chunk']}" + (f", row {error['row']}" if 'row' in error else '')
+        message += f"\n  {location}: {error['error']}"
+    return message
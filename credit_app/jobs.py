@@ -0,0 +1,132 @@
+"""Long-running ingestion and rescoring jobs behind /api/jobs
+
+enqueue_job records a Job and queues the run_background_job task once the row is
+committed, with the job ID as the Celery task ID. The task reports progress after every
+ingestion chunk or rescoring shard, both on the Job row, which /api/jobs/<id> reads, and
+as PROGRESS task state for Celery monitoring tools. A job that raises is marked failed
+with a structured error and the exception re-raised, so its task ends in FAILURE.
+"""
+import os
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .ingestion import DATA_FILES, count_source_rows, format_skipped_file, ingest_file, reset_customer_sequence
+from .models import Customer, Job
+from .rescoring import changed_customers_filter, plan_customer_shards, run_rescoring
+
+def job_data_file(file_name):
+    """Path of a file in JOB_DATA_DIR; raises ValueError for missing files or names outside it"""
+    root = os.path.realpath(settings.JOB_DATA_DIR)
+    path = os.path.realpath(os.path.join(root, file_name))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError('Files must be inside the data directory')
+    if not os.path.isfile(path):
+        raise ValueError(f'No such data file: {file_name}')
+    return path
+
+def enqueue_job(kind, params):
+    """Create a queued job and start its task when the current transaction commits"""
+    from .tasks import run_background_job
+    job = Job.objects.create(kind=kind, params=params)
+    # A worker picking the task up before the commit would not find the job
+    transaction.on_commit(lambda: run_background_job.apply_async((str(job.id),), task_id=str(job.id)))
+    return job
+
+class JobProgress:
+    """Record a running job's progress on its row and, on a worker, in the Celery task state"""
+
+    def __init__(self, job, task=None):
+        self.job = job
+        # Eager tasks have no result backend to report to
+        self.task = task if task is not None and not task.request.is_eager else None
+
+    def update(self, rows_processed, errors=None, error_count=None):
+        self.job.rows_processed = rows_processed
+        if errors is not None:
+            self.job.errors = errors
+        if error_count is not None:
+            self.job.error_count = error_count
+        self.job.save(update_fields=['rows_total', 'rows_processed', 'errors', 'error_count', 'updated_at'])
+        if self.task is not None:
+            self.task.update_state(state='PROGRESS', meta={
+                'rows_total': self.job.rows_total,
+                'rows_processed': self.job.rows_processed,
+                'error_count': self.job.error_count,
+            })
+
+def run_ingest_job(job, progress):
+    """Ingest the customer file, the loan file or both, counting rows across them"""
+    labels = ['customers', 'loans'] if job.params['type'] == 'all' else [job.params['type']]
+    files = [job_data_file(job.params.get('file') or DATA_FILES[label]) for label in labels]
+    totals = [count_source_rows(path) for path in files]
+    job.rows_total = None if None in totals else sum(totals)
+    progress.update(0)
+
+    chunk_size = job.params.get('chunk_size') or settings.INGEST_CHUNK_SIZE
+    done_rows, done_errors, done_error_count = 0, [], 0
+    results = {}
+    for label, path, total in zip(labels, files, totals):
+        def report(stats):
+            progress.update(
+                done_rows + stats.rows_read,
+                done_errors + [dict(error, label=label) for error in stats.errors],
+                done_error_count + stats.error_count,
+            )
+
+        stats, manifest = ingest_file(label, path, chunk_size, job.params.get('force', False), progress=report)
+        if stats is None:
+            results[label] = {'skipped': format_skipped_file(manifest)}
+            done_rows += total if total is not None else manifest.row_count
+            progress.update(done_rows)
+            continue
+        if label == 'customers':
+            reset_customer_sequence()
+        result = stats.as_dict()
+        del result['errors']
+        result['rows_per_second'] = stats.rows_per_second
+        results[label] = result
+        done_rows += stats.rows_read
+        done_errors = job.errors
+        done_error_count = job.error_count
+    return results
+
+def run_rescore_job(job, progress):
+    """Rescore every customer, or those changed since params['since'], shard by shard"""
+    since = parse_datetime(job.params['since']) if job.params.get('since') else None
+    customers = Customer.objects.all()
+    if since is not None:
+        customers = customers.filter(changed_customers_filter(since)).distinct()
+    job.rows_total = customers.count()
+    progress.update(0)
+
+    # Shards run in turn inside the task: a worker process cannot fork a pool or wait on a group
+    shards = plan_customer_shards(job.params.get('shard_size') or settings.RESCORE_SHARD_SIZE, since)
+    scored = run_rescoring(shards, backend='serial', since=since, progress=progress.update)
+    return {'customers_scored': scored, 'shards': len(shards)}
+
+JOB_RUNNERS = {
+    Job.KIND_INGEST: run_ingest_job,
+    Job.KIND_RESCORE: run_rescore_job,
+}
+
+def run_job(job_id, task=None):
+    """Run a queued job to completion, recording its status, progress and result"""
+    job = Job.objects.get(pk=job_id)
+    job.status = Job.STATUS_RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at', 'updated_at'])
+    try:
+        result = JOB_RUNNERS[job.kind](job, JobProgress(job, task))
+    except Exception as error:
+        job.status = Job.STATUS_FAILED
+        job.errors = job.errors + [{'type': type(error).__name__, 'message': str(error)}]
+        job.error_count += 1
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'errors', 'error_count', 'finished_at', 'updated_at'])
+        raise
+    job.status = Job.STATUS_SUCCEEDED
+    job.result = result
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'finished_at', 'updated_at'])
+    return result
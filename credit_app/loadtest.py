@@ -0,0 +1,256 @@
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from django.db import connection
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve
+from .models import Customer, Loan
+
+# Relative weights of each endpoint in a synthetic mix
+DEFAULT_MIX = {
+    'check_eligibility': 45,
+    'view_customer_loans': 20,
+    'view_loan': 15,
+    'create_loan': 10,
+    'register_customer': 5,
+    'check_eligibility_batch': 3,
+    'view_loan_schedule': 2,
+}
+
+def load_request_log(path):
+    """Read API calls from a JSONL file; returns (requests, lines skipped)
+
+    Each line is {"method": "POST", "path": "/api/create-loan", "body": {...}, "headers": {...}},
+    with body and headers optional. Lines without a method and path are skipped.
+    """
+    requests = []
+    skipped = 0
+    with open(path) as log:
+        for line in log:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(entry, dict) or not entry.get('method') or not entry.get('path'):
+                skipped += 1
+                continue
+            requests.append({
+                'method': entry['method'].upper(),
+                'path': entry['path'],
+                'body': entry.get('body'),
+                'headers': entry.get('headers') or {},
+            })
+    return requests, skipped
+
+def parse_mix(value):
+    """Parse 'check_eligibility=5,view_loan=1' into a weights dict"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f'Unknown endpoint in mix: {name.strip()}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def synthetic_requests(count, mix=None, seed=0):
+    """Generate a request mix over the existing customers and loans
+
+    Amounts, rates and tenures follow the ranges of the ingested loan workbook. Register
+    calls use phone numbers above the current maximum so they do not collide.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    customer_ids = list(Customer.objects.values_list('customer_id', flat=True))
+    loan_ids = list(Loan.objects.values_list('loan_id', flat=True))
+    if not customer_ids:
+        raise ValueError('No customers to generate requests for; ingest or generate data first')
+    next_phone = (Customer.objects.aggregate(Max('phone_number'))['phone_number__max'] or 6000000000) + 1
+
+    def application():
+        return {
+            'customer_id': rng.choice(customer_ids),
+            'loan_amount': rng.randrange(50000, 1000000, 5000),
+            'interest_rate': rng.randint(800, 1800) / 100,
+            'tenure': rng.choice([6, 12, 24, 36, 48, 60, 120]),
+        }
+
+    def build(name):
+        nonlocal next_phone
+        if name == 'register_customer':
+            next_phone += 1
+            return 'POST', '/api/register', {
+                'first_name': 'Load',
+                'last_name': 'Test',
+                'age': rng.randint(21, 65),
+                'monthly_income': rng.randrange(20000, 200000, 1000),
+                'phone_number': next_phone,
+            }
+        if name == 'check_eligibility':
+            return 'POST', '/api/check-eligibility', application()
+        if name == 'check_eligibility_batch':
+            return 'POST', '/api/check-eligibility/batch', [application() for _ in range(50)]
+        if name == 'create_loan':
+            return 'POST', '/api/create-loan', application()
+        if name == 'view_customer_loans':
+            return 'GET', f'/api/view-loans/{rng.choice(customer_ids)}', None
+        if not loan_ids:
+            return 'GET', f'/api/view-loans/{rng.choice(customer_ids)}', None
+        if name == 'view_loan_schedule':
+            return 'GET', f'/api/view-loan/{rng.choice(loan_ids)}/schedule', None
+        return 'GET', f'/api/view-loan/{rng.choice(loan_ids)}', None
+
+    requests = []
+    for name in rng.choices(list(mix), weights=list(mix.values()), k=count):
+        method, path, body = build(name)
+        requests.append({'method': method, 'path': path, 'body': body, 'headers': {}})
+    return requests
+
+def endpoint_name(path):
+    try:
+        return resolve(path.split('?')[0]).url_name
+    except Resolver404:
+        return 'unknown'
+
+class InProcessTarget:
+    """Send requests through the Django test client, counting queries per request
+
+    Server errors are recorded as 500 responses instead of being raised.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def send(self, request):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+        extra = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in request['headers'].items()}
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if request['method'] == 'GET':
+                response = client.get(request['path'], **extra)
+            else:
+                response = client.generic(
+                    request['method'], request['path'], json.dumps(request['body']),
+                    content_type='application/json', **extra
+                )
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(queries)
+
+    def close(self):
+        connection.close()
+
+class HttpTarget:
+    """Send requests to a running server over HTTP"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def send(self, request):
+        data = json.dumps(request['body']).encode() if request['body'] is not None else None
+        headers = dict(request['headers'], **({'Content-Type': 'application/json'} if data else {}))
+        http_request = urllib.request.Request(
+            self.base_url + request['path'], data=data, headers=headers, method=request['method']
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            status = error.code
+        return status, time.perf_counter() - start, None
+
+    def close(self):
+        pass
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+def summarize(samples, wall_seconds):
+    """Latency percentiles (ms), throughput and queries per request for a list of samples"""
+    latencies = sorted(sample['seconds'] * 1000 for sample in samples)
+    queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample['status'] >= 500),
+        'status_codes': {str(code): count for code, count in sorted(Counter(sample['status'] for sample in samples).items())},
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': sum(latencies) / len(latencies) if latencies else 0.0,
+        'throughput_rps': len(samples) / wall_seconds if wall_seconds > 0 else 0.0,
+        'queries_per_request': sum(queries) / len(queries) if queries else None,
+    }
+
+def run_load_test(requests, target, concurrency=1):
+    """Send the requests with the given number of concurrent workers and summarize per endpoint"""
+    samples = []
+    samples_lock = threading.Lock()
+    chunks = [requests[index::concurrency] for index in range(concurrency)]
+
+    def worker(chunk):
+        try:
+            for request in chunk:
+                status, seconds, queries = target.send(request)
+                with samples_lock:
+                    samples.append({
+                        'endpoint': endpoint_name(request['path']),
+                        'status': status,
+                        'seconds': seconds,
+                        'queries': queries,
+                    })
+        finally:
+            if concurrency > 1:
+                target.close()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker(chunks[0])
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, chunks))
+    wall_seconds = time.perf_counter() - start
+
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample['endpoint']].append(sample)
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'target': getattr(target, 'base_url', 'in-process'),
+        'concurrency': concurrency,
+        'wall_seconds': wall_seconds,
+        'overall': summarize(samples, wall_seconds),
+        'endpoints': {name: summarize(group, wall_seconds) for name, group in sorted(by_endpoint.items())},
+    }
+
+def format_summary_row(name, summary, baseline=None):
+    queries = summary['queries_per_request']
+    row = (
+        f"{name:<26} {summary['requests']:>7} req  {summary['errors']:>4} err  "
+        f"p50 {summary['p50_ms']:>8.2f}  p95 {summary['p95_ms']:>8.2f}  p99 {summary['p99_ms']:>8.2f} ms  "
+        f"{summary['throughput_rps']:>8.1f} req/s"
+        + (f"  {queries:>6.2f} q/req" if queries is not None else '')
+    )
+    if baseline and baseline.get('p95_ms'):
+        row += f"  p95 {(summary['p95_ms'] / baseline['p95_ms'] - 1) * 100:+.0f}%"
+    return row
@@ -0,0 +1,223 @@
+"""In-process loan book snapshot answering eligibility checks without a database round trip
+
+With LOAN_BOOK_SNAPSHOT on, check_loan_eligibility reads a customer's salary, approved
+limit and credit score inputs from a per-process snapshot: numpy columns sorted by
+customer ID, searched with a binary search, at a few dozen bytes per customer. The
+snapshot is loaded on first use, or at worker start by credit_system.wsgi and asgi.
+
+Once the snapshot is older than LOAN_BOOK_MAX_STALENESS_SECONDS, the next lookup
+refreshes it from updated_at watermarks. Customers whose row, loans or credit profile
+changed since the previous refresh are re-read; the window is widened by
+LOAN_BOOK_WATERMARK_OVERLAP_SECONDS to catch transactions that were still committing.
+Answers therefore lag writes by at most the staleness bound plus one refresh.
+
+Deleted customers are dropped using the outbox's customer delete events from the same window.
+With OUTBOX_ENABLED off, a customer count that no longer matches reloads everything
+instead. A new day also reloads everything, since the active loan sums depend on the date.
+Customers the snapshot does not hold yet fall back to the database path, as do all checks
+while the process has no snapshot for today and another thread is loading one.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Customer, CustomerCreditProfile, Loan, OutboxEvent
+from .utils import credit_score_aggregates
+
+# Money columns are stored as int64 cents, the rest as int32 counts
+MONEY_COLUMNS = ['monthly_salary', 'approved_limit', 'total_loan_amount', 'active_loan_amount', 'active_monthly_repayment']
+COUNT_COLUMNS = ['loan_count', 'total_tenure', 'total_emis_paid_on_time', 'current_year_loan_count']
+
+def cents_int(value):
+    """A money value, or 0 for None, as an int of cents, truncating fractions of a cent"""
+    return int((value or 0) * 100)
+
+def from_cents(cents):
+    """The Decimal amount for an int of cents"""
+    return Decimal(int(cents)).scaleb(-2)
+
+class LoanBook:
+    """Eligibility inputs for a set of customers as columns sorted by customer ID
+
+    The arrays are never modified once built: a refresh merges into a new book, so
+    lookups running meanwhile see one consistent snapshot.
+    """
+
+    def __init__(self, customer_ids, columns, as_of, watermark):
+        self.customer_ids = customer_ids
+        self.columns = columns
+        self.as_of = as_of
+        # Rows changed after this time may be missing from the snapshot
+        self.watermark = watermark
+        self.refreshed_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    @property
+    def nbytes(self):
+        return self.customer_ids.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    def index_of(self, customer_id):
+        index = int(np.searchsorted(self.customer_ids, customer_id))
+        if index < len(self.customer_ids) and self.customer_ids[index] == customer_id:
+            return index
+        return None
+
+    def entry(self, customer_id, ruleset):
+        """Eligibility inputs in the shape of utils.build_credit_score_entry, or None for customers not held"""
+        index = self.index_of(customer_id)
+        if index is None:
+            return None
+        columns = self.columns
+        aggregates = {name: int(columns[name][index]) for name in COUNT_COLUMNS}
+        for name in ('total_loan_amount', 'active_loan_amount', 'active_monthly_repayment'):
+            aggregates[name] = from_cents(columns[name][index])
+        return {
+            'credit_score': ruleset.credit_score(aggregates, from_cents(columns['approved_limit'][index])),
+            'ruleset_version': ruleset.version,
+            'active_monthly_repayment': aggregates['active_monthly_repayment'],
+            'monthly_salary': from_cents(columns['monthly_salary'][index]),
+            'valid_through': self.as_of,
+        }
+
+    def merge(self, other, watermark, removed=()):
+        """Return a new book with other's rows replacing or added to this one's, less the removed customer IDs"""
+        keep = ~np.isin(self.customer_ids, other.customer_ids) & ~np.isin(self.customer_ids, list(removed))
+        customer_ids = np.concatenate([self.customer_ids[keep], other.customer_ids])
+        order = np.argsort(customer_ids, kind='stable')
+        columns = {
+            name: np.concatenate([column[keep], other.columns[name]])[order] for name, column in self.columns.items()
+        }
+        return LoanBook(customer_ids[order], columns, self.as_of, watermark)
+
+def load_loan_book(today, watermark, customer_ids=None, batch_size=1000):
+    """Build a LoanBook for all customers, or the given ones, from the customers and loans tables"""
+    expressions = credit_score_aggregates(today)
+    if customer_ids is None:
+        batches = [(Customer.objects.all(), Loan.objects.all())]
+    else:
+        customer_ids = sorted(customer_ids)
+        batches = [
+            (Customer.objects.filter(customer_id__in=batch), Loan.objects.filter(customer_id__in=batch))
+            for batch in (customer_ids[start:start + batch_size] for start in range(0, len(customer_ids), batch_size))
+        ]
+
+    customers = []
+    aggregates = {}
+    for customer_rows, loan_rows in batches:
+        customers.extend(customer_rows.values_list('customer_id', 'monthly_salary', 'approved_limit').iterator())
+        for row in loan_rows.values('customer_id').annotate(**expressions).iterator():
+            aggregates[row.pop('customer_id')] = row
+    customers.sort()
+
+    size = len(customers)
+    columns = {name: np.zeros(size, dtype=np.int64) for name in MONEY_COLUMNS}
+    columns.update({name: np.zeros(size, dtype=np.int32) for name in COUNT_COLUMNS})
+    for index, (customer_id, monthly_salary, approved_limit) in enumerate(customers):
+        columns['monthly_salary'][index] = cents_int(monthly_salary)
+        columns['approved_limit'][index] = cents_int(approved_limit)
+        row = aggregates.get(customer_id)
+        if row is None:
+            continue
+        for name in COUNT_COLUMNS:
+            columns[name][index] = row[name] or 0
+        for name in ('total_loan_amount', 'active_loan_amount', 'active_monthly_repayment'):
+            columns[name][index] = cents_int(row[name])
+    customer_id_column = np.fromiter((customer[0] for customer in customers), dtype=np.int64, count=size)
+    return LoanBook(customer_id_column, columns, today, watermark)
+
+def changed_customer_ids(since):
+    """IDs of customers whose row, loans or credit profile were written at or after since"""
+    changed = set(Customer.objects.filter(updated_at__gte=since).values_list('customer_id', flat=True))
+    changed.update(Loan.objects.filter(updated_at__gte=since).values_list('customer_id', flat=True))
+    # Profiles are rewritten when a loan is edited or deleted
+    changed.update(CustomerCreditProfile.objects.filter(updated_at__gte=since).values_list('customer_id', flat=True))
+    return changed
+
+def deleted_customer_ids(since):
+    """IDs of customers deleted at or after since, from the outbox's delete events"""
+    return set(
+        OutboxEvent.objects.filter(
+            topic=OutboxEvent.TOPIC_CUSTOMER, event_type=OutboxEvent.TYPE_DELETED, created_at__gte=since
+        ).values_list('key', flat=True)
+    )
+
+def refresh_loan_book(book=None, today=None):
+    """Return book brought up to date, reloading it completely when there is none or the day changed"""
+    today = today or date.today()
+    watermark = timezone.now()
+    if book is None or book.as_of != today:
+        return load_loan_book(today, watermark)
+    since = book.watermark - timedelta(seconds=settings.LOAN_BOOK_WATERMARK_OVERLAP_SECONDS)
+    changed = changed_customer_ids(since)
+    deleted = deleted_customer_ids(since) if settings.OUTBOX_ENABLED else set()
+    if changed or deleted:
+        refreshed = book.merge(load_loan_book(today, watermark, changed), watermark, removed=deleted)
+    else:
+        refreshed = LoanBook(book.customer_ids, book.columns, today, watermark)
+    if not settings.OUTBOX_ENABLED and len(refreshed) != Customer.objects.count():
+        # Customers were deleted, and there are no delete events to say which
+        return load_loan_book(today, watermark)
+    return refreshed
+
+_loan_book = None
+_loan_book_lock = threading.Lock()
+
+def get_loan_book(today=None):
+    """Return this process's snapshot, refreshing it first if it is past the staleness bound
+
+    While one thread refreshes, the others keep answering from the previous snapshot. While
+    one loads the first snapshot or a new day's, the others get None and use the database.
+    """
+    global _loan_book
+    today = today or date.today()
+    book = _loan_book
+    current = book is not None and book.as_of == today
+    if current and time.monotonic() - book.refreshed_at < settings.LOAN_BOOK_MAX_STALENESS_SECONDS:
+        return book
+    if not _loan_book_lock.acquire(blocking=False):
+        return book if current else None
+    try:
+        if _loan_book is book:
+            _loan_book = refresh_loan_book(book, today)
+        return _loan_book
+    finally:
+        _loan_book_lock.release()
+
+def loan_book_entry(customer_id, ruleset, today=None):
+    """Eligibility inputs for a customer from the snapshot, or None if it does not hold them"""
+    book = get_loan_book(today)
+    return book.entry(customer_id, ruleset) if book is not None else None
+
+def preload_loan_book():
+    """Load the snapshot at worker start when LOAN_BOOK_SNAPSHOT is on"""
+    if settings.LOAN_BOOK_SNAPSHOT:
+        get_loan_book()
+        # Do not hand the loading connection to a forked or threaded worker
+        connections.close_all()
+
+def loan_book_metric_lines():
+    book = _loan_book
+    if book is None:
+        return []
+    return [
+        '# TYPE credit_loan_book_customers gauge',
+        f'credit_loan_book_customers {len(book)}',
+        '# TYPE credit_loan_book_bytes gauge',
+        f'credit_loan_book_bytes {book.nbytes}',
+        '# TYPE credit_loan_book_age_seconds gauge',
+        f'credit_loan_book_age_seconds {time.monotonic() - book.refreshed_at:.3f}',
+    ]
+
+@receiver(setting_changed)
+def reset_loan_book(setting, **kwargs):
+    global _loan_book
+    if setting.startswith('LOAN_BOOK_'):
+        _loan_book = None
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from credit_app.benchmarks import BENCHMARKS, format_result_row
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against synthetic data that is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suites',
+            nargs='*',
+            help=f"Benchmark suites to run: {', '.join(sorted(BENCHMARKS))} (defaults to all)"
+        )
+        parser.add_argument('--customers', type=int, help='Synthetic customers to create')
+        parser.add_argument('--loans-per-customer', type=int, help='Synthetic loans per customer')
+        parser.add_argument('--items', type=int, help='Items (applications, loans, rows) per case; each suite has its own default')
+        parser.add_argument('--seed', type=int, help='Random seed for synthetic data')
+        parser.add_argument('--concurrency', type=int, help='Requests kept in flight by the async suite')
+        parser.add_argument('--db-latency-ms', type=float, help='Delay added to every query by the async suite, modelling a remote database')
+
+    def handle(self, *args, **options):
+        suites = options.pop('suites') or sorted(BENCHMARKS)
+        options = {key: value for key, value in options.items() if value is not None}
+        unknown = [suite for suite in suites if suite not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark suites: {', '.join(unknown)}")
+
+        for suite in suites:
+            self.stdout.write(f'Running {suite} benchmark...')
+            for row in BENCHMARKS[suite](**options):
+                self.stdout.write(format_result_row(row))
+
+        self.stdout.write(self.style.SUCCESS(f'Completed {len(suites)} benchmark suites'))
@@ -1,19 +1,70 @@
-from django.core.management.base import BaseCommand
-from credit_app.models import Customer
-from credit_app.utils import calculate_credit_score
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+from credit_app.models import CustomerCreditScore
+from credit_app.rescoring import rescore_portfolio
 
 class Command(BaseCommand):
-    help = 'Calculate and display credit scores for all customers'
+    help = 'Calculate and store credit scores for all customers, sharded by customer ID'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=['process', 'celery', 'serial'],
+            default='process',
+            help='Run shards on a local process pool, on the Celery workers, or in this process'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Process pool size (defaults to the number of CPUs)'
+        )
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            default=None,
+            help='Customer IDs per shard (defaults to RESCORE_SHARD_SIZE)'
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            default=None,
+            help='Only rescore customers whose data changed at or after this ISO date or datetime'
+        )
+
+    def parse_since(self, value):
+        since = parse_datetime(value)
+        if since is None and parse_date(value) is not None:
+            since = datetime.combine(parse_date(value), time.min)
+        if since is None:
+            raise CommandError(f'Invalid --since value: {value}')
+        return timezone.make_aware(since) if timezone.is_naive(since) else since
 
     def handle(self, *args, **options):
-        customers = Customer.objects.all()
+        since = self.parse_since(options['since']) if options['since'] else None
+        started_at = timezone.now()
+        scored, seconds = rescore_portfolio(
+            shard_size=options['shard_size'] or settings.RESCORE_SHARD_SIZE,
+            backend=options['backend'],
+            workers=options['workers'],
+            since=since,
+        )
         
-        for customer in customers:
-            score = calculate_credit_score(customer)
-            self.stdout.write(
-                f"Customer {customer.customer_id} ({customer.name}): Credit Score = {score}"
+        if options['verbosity'] >= 2:
+            scores = (
+                CustomerCreditScore.objects.filter(scored_at__gte=started_at)
+                .select_related('customer')
+                .order_by('customer_id')
             )
+            for score in scores.iterator():
+                self.stdout.write(
+                    f"Customer {score.customer_id} ({score.customer.name}): Credit Score = {score.credit_score}"
+                )
         
+        rate = scored / seconds if seconds > 0 else 0.0
         self.stdout.write(
-            self.style.SUCCESS(f'Calculated scores for {customers.count()} customers')
-        )
\ No newline at end of file
+            self.style.SUCCESS(f'Calculated scores for {scored} customers in {seconds:.2f}s ({rate:.0f} customers/s)')
+        )
@@ -0,0 +1,43 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from credit_app.outbox import dispatch_outbox
+
+class Command(BaseCommand):
+    help = 'Publish customer and loan outbox events to the sink configured by OUTBOX_SINK'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--follow',
+            action='store_true',
+            help='Keep dispatching until interrupted instead of exiting once the outbox is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Seconds to wait when the outbox is empty, with --follow (defaults to OUTBOX_DISPATCH_SECONDS)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Events published per transaction (defaults to OUTBOX_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval'] if options['interval'] is not None else settings.OUTBOX_DISPATCH_SECONDS
+        total = 0
+        try:
+            while True:
+                published = dispatch_outbox(options['batch_size'])
+                total += published
+                if published:
+                    self.stdout.write(f'Published {published} outbox events')
+                if not options['follow']:
+                    break
+                if not published:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Published {total} outbox events in total'))
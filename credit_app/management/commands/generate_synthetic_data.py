@@ -0,0 +1,57 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from credit_app.synthetic import generate_synthetic_data
+
+class Command(BaseCommand):
+    help = 'Generate seeded synthetic customers and loans into the database or to CSV, xlsx or Parquet files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000, help='Number of customers to generate')
+        parser.add_argument('--loans', type=int, default=50000, help='Number of loans to generate')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed and counts give the same data')
+        parser.add_argument(
+            '--output',
+            choices=['db', 'csv', 'xlsx', 'parquet'],
+            default='db',
+            help='Load into the database (COPY on PostgreSQL) or write customer_data and loan_data files'
+        )
+        parser.add_argument('--path', default='data/synthetic', help='Directory for file output')
+        parser.add_argument('--gzip', action='store_true', help='Gzip CSV output')
+
+    def handle(self, *args, **options):
+        if options['customers'] < 0 or options['loans'] < 0:
+            raise CommandError('--customers and --loans must not be negative')
+        verbose = options['verbosity'] >= 2
+
+        def progress(label, done, total):
+            if verbose:
+                self.stdout.write(f'{label}: {done}/{total}')
+
+        started = time.monotonic()
+        try:
+            result = generate_synthetic_data(
+                options['customers'],
+                options['loans'],
+                seed=options['seed'],
+                output=options['output'],
+                directory=options['path'],
+                compress=options['gzip'],
+                progress=progress,
+            )
+        except (ValueError, RuntimeError) as error:
+            raise CommandError(str(error))
+        seconds = time.monotonic() - started
+
+        rows = result['customers'] + result['loans']
+        rate = rows / seconds if seconds > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {result['customers']} customers and {result['loans']} loans in {seconds:.2f}s ({rate:.0f} rows/s)"
+        ))
+        if options['output'] == 'db':
+            self.stdout.write(
+                f"Customer IDs {result['first_customer_id']}-{result['last_customer_id']}. "
+                'Run rebuild_credit_profiles, calculate_scores and refresh_portfolio to refresh derived data.'
+            )
+        else:
+            for path in result['paths']:
+                self.stdout.write(f'Wrote {path}')
@@ -1,8 +1,9 @@
-from django.core.management.base import BaseCommand
-from credit_app.tasks import ingest_customer_data, ingest_loan_data
+from django.core.management.base import BaseCommand, CommandError
+from credit_app.ingestion import format_range_summary
+from credit_app.tasks import copy_load_data, ingest_customer_data, ingest_loan_data, parallel_ingestion
 
 class Command(BaseCommand):
-    help = 'Ingest customer and loan data from Excel files'
+    help = 'Ingest customer and loan data from Excel, CSV or Parquet files'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -12,16 +13,76 @@ class Command(BaseCommand):
             default='all',
             help='Type of data to ingest'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Rows written per bulk insert transaction (defaults to INGEST_CHUNK_SIZE)'
+        )
+        parser.add_argument(
+            '--loader',
+            choices=['orm', 'copy'],
+            default='orm',
+            help='Insert through the ORM in chunks, or stage the file (COPY on PostgreSQL) and merge it with SQL'
+        )
+        parser.add_argument(
+            '--customers-file',
+            default=None,
+            help='Customer xlsx, .csv, .csv.gz or .parquet file (defaults to data/customer_data.xlsx)'
+        )
+        parser.add_argument(
+            '--loans-file',
+            default=None,
+            help='Loan xlsx, .csv, .csv.gz or .parquet file (defaults to data/loan_data.xlsx)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-read files whose contents were already ingested completely'
+        )
+        parser.add_argument(
+            '--parallel',
+            action='store_true',
+            help='Split each workbook into row ranges and ingest them on the Celery workers (xlsx only)'
+        )
+        parser.add_argument(
+            '--range-rows',
+            type=int,
+            default=None,
+            help='Rows per parallel task (defaults to INGEST_RANGE_ROWS)'
+        )
 
     def handle(self, *args, **options):
         data_type = options['type']
+        chunk_size = options['chunk_size']
+        files = {'customers': options['customers_file'], 'loans': options['loans_file']}
+        
+        if options['parallel'] and options['loader'] == 'copy':
+            raise CommandError('--parallel only works with the ORM loader')
+        
+        if options['loader'] == 'copy':
+            for label in ['customers', 'loans']:
+                if data_type in [label, 'all']:
+                    self.stdout.write(f'Loading {label} data through a staging table...')
+                    self.stdout.write(self.style.SUCCESS(copy_load_data(label, files[label], chunk_size)))
+            return
+        
+        if options['parallel']:
+            # Customers must be committed before loans can be mapped to them, so the two
+            # workbooks run as consecutive chords
+            for label in ['customers', 'loans']:
+                if data_type in [label, 'all']:
+                    self.stdout.write(f'Dispatching parallel {label} ingestion...')
+                    result = parallel_ingestion(label, options['range_rows'], chunk_size, files[label]).apply_async()
+                    self.stdout.write(self.style.SUCCESS(format_range_summary(result.get())))
+            return
         
         if data_type in ['customers', 'all']:
             self.stdout.write('Ingesting customer data...')
-            result = ingest_customer_data()
+            result = ingest_customer_data(chunk_size, files['customers'], options['force'])
             self.stdout.write(self.style.SUCCESS(result))
         
         if data_type in ['loans', 'all']:
             self.stdout.write('Ingesting loan data...')
-            result = ingest_loan_data()
+            result = ingest_loan_data(chunk_size, files['loans'], options['force'])
             self.stdout.write(self.style.SUCCESS(result))
\ No newline at end of file
@@ -0,0 +1,86 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from credit_app.benchmarks import rolled_back
+from credit_app.loadtest import (
+    DEFAULT_MIX, HttpTarget, InProcessTarget, format_summary_row, load_request_log, parse_mix, run_load_test,
+    synthetic_requests
+)
+
+class Command(BaseCommand):
+    help = 'Replay recorded or synthetic API requests and report latency percentiles per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests-file',
+            help='JSONL file of {"method", "path", "body", "headers"} records to replay'
+        )
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            default=None,
+            help='Number of synthetic requests to generate over the existing customers and loans'
+        )
+        parser.add_argument(
+            '--mix',
+            default=None,
+            help=f"Synthetic endpoint weights, e.g. check_eligibility=5,view_loan=1 (endpoints: {', '.join(DEFAULT_MIX)})"
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for synthetic requests')
+        parser.add_argument('--concurrency', type=int, default=1, help='Concurrent workers sending requests')
+        parser.add_argument(
+            '--url',
+            default=None,
+            help='Base URL of a running server (e.g. http://localhost:8000); defaults to in-process'
+        )
+        parser.add_argument(
+            '--rollback',
+            action='store_true',
+            help='Roll back all writes afterwards (in-process with --concurrency 1 only)'
+        )
+        parser.add_argument('--output', default=None, help='Write the results as JSON to this path')
+        parser.add_argument('--compare', default=None, help='Earlier JSON results to show p95 changes against')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1')
+        if options['rollback'] and (options['url'] or concurrency > 1):
+            raise CommandError('--rollback only works in-process with --concurrency 1')
+        if not options['requests_file'] and not options['synthetic']:
+            raise CommandError('Pass --requests-file, --synthetic or both')
+        
+        requests = []
+        if options['requests_file']:
+            replayed, skipped = load_request_log(options['requests_file'])
+            self.stdout.write(f'Loaded {len(replayed)} requests from {options["requests_file"]} ({skipped} lines skipped)')
+            requests.extend(replayed)
+        if options['synthetic']:
+            try:
+                mix = parse_mix(options['mix']) if options['mix'] else None
+                requests.extend(synthetic_requests(options['synthetic'], mix, options['seed']))
+            except ValueError as e:
+                raise CommandError(str(e))
+        if not requests:
+            raise CommandError('No requests to send')
+        
+        target = HttpTarget(options['url']) if options['url'] else InProcessTarget()
+        self.stdout.write(f'Sending {len(requests)} requests with concurrency {concurrency}...')
+        if options['rollback']:
+            with rolled_back():
+                results = run_load_test(requests, target, concurrency)
+        else:
+            results = run_load_test(requests, target, concurrency)
+        
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as previous:
+                baseline = json.load(previous)
+        for name, summary in results['endpoints'].items():
+            self.stdout.write(format_summary_row(name, summary, baseline.get('endpoints', {}).get(name)))
+        self.stdout.write(format_summary_row('overall', results['overall'], baseline.get('overall')))
+        
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        self.stdout.write(self.style.SUCCESS(f"Completed {results['overall']['requests']} requests in {results['wall_seconds']:.2f}s"))
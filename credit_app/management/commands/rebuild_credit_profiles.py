@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from credit_app.profiles import rebuild_all_credit_profiles, verify_credit_profiles
+
+class Command(BaseCommand):
+    help = 'Rebuild every customer credit profile from the loans table and verify the result'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Customers rebuilt per transaction'
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Only compare stored profiles with the loans table, without rebuilding'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        if not options['verify_only']:
+            rebuilt = rebuild_all_credit_profiles(batch_size)
+            self.stdout.write(f'Rebuilt {rebuilt} credit profiles')
+        
+        mismatches = verify_credit_profiles(batch_size)
+        for customer_id, fields in mismatches[:50]:
+            self.stdout.write(f"Customer {customer_id}: {', '.join(fields)}")
+        
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} credit profiles do not match the loans table')
+        self.stdout.write(self.style.SUCCESS('All credit profiles match the loans table'))
\ No newline at end of file
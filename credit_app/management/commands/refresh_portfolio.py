@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from credit_app.portfolio import refresh_portfolio_shards
+
+class Command(BaseCommand):
+    help = 'Recompute the portfolio rollups behind /api/portfolio/summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every shard, not only stale ones'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        refreshed = refresh_portfolio_shards(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {refreshed} portfolio shards in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from credit_app.registration import import_registrations
+
+class Command(BaseCommand):
+    help = 'Register customers from an xlsx, .csv, .csv.gz or .parquet file through the batch registration path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='File with first name, last name, age, monthly income and phone number columns')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Registrations validated and inserted together (defaults to REGISTRATION_BATCH_MAX_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or settings.REGISTRATION_BATCH_MAX_SIZE
+        try:
+            created, failures = import_registrations(options['file'], batch_size)
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        for row_number, errors in failures:
+            messages = '; '.join(f"{field}: {' '.join(str(message) for message in field_errors)}" for field, field_errors in errors.items())
+            self.stdout.write(f'Row {row_number}: {messages}')
+        self.stdout.write(self.style.SUCCESS(f'Registered {created} customers, rejected {len(failures)} rows'))
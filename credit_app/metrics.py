@@ -0,0 +1,251 @@
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+import logging
+import random
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from .score_cache import get_score_cache
+
+logger = logging.getLogger('credit_app.slow_requests')
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# (metric name, help text, buckets) for each per-request measurement
+HISTOGRAMS = {
+    'duration': ('credit_http_request_duration_seconds', 'Wall time of sampled requests', DURATION_BUCKETS),
+    'db_queries': ('credit_http_request_db_queries', 'Database queries per sampled request', QUERY_COUNT_BUCKETS),
+    'db': ('credit_http_request_db_duration_seconds', 'Time spent in database queries per sampled request', DURATION_BUCKETS),
+    'serialize': ('credit_http_request_serializer_duration_seconds', 'Time spent building serializer .data per sampled request', DURATION_BUCKETS),
+    'render': ('credit_http_request_render_duration_seconds', 'Time spent rendering the response body per sampled request', DURATION_BUCKETS),
+}
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus data model"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+class MetricsRegistry:
+    """Per-process request counters and histograms, keyed by view name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.histograms = {}
+
+    def record_request(self, view, status_code):
+        key = (view, str(status_code))
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def observe(self, view, measurements):
+        with self._lock:
+            for name, value in measurements.items():
+                histogram = self.histograms.get((name, view))
+                if histogram is None:
+                    histogram = self.histograms[(name, view)] = Histogram(HISTOGRAMS[name][2])
+                histogram.observe(value)
+
+    def render(self, extra_lines=()):
+        """Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP credit_http_requests_total Requests handled, by view and status code',
+                '# TYPE credit_http_requests_total counter',
+            ]
+            for (view, status_code), count in sorted(self.requests.items()):
+                lines.append(f'credit_http_requests_total{{view="{view}",status="{status_code}"}} {count}')
+            for name, (metric, help_text, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for (histogram_name, view), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bound, count in histogram.cumulative_counts():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{metric}_bucket{{view="{view}",le="{le}"}} {count}')
+                    lines.append(f'{metric}_sum{{view="{view}"}} {histogram.sum!r}')
+                    lines.append(f'{metric}_count{{view="{view}"}} {histogram.count}')
+        lines.extend(extra_lines)
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class RequestTimings:
+    """Measurements collected while one sampled request is handled"""
+
+    def __init__(self, capture_sql):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.phases = {}
+        self.capture_sql = capture_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper counting and timing every query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.db_queries += 1
+            self.db_seconds += elapsed
+            if self.capture_sql:
+                self.queries.append((elapsed, sql))
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+_current_timings = ContextVar('credit_request_timings', default=None)
+
+@contextmanager
+def request_phase(name):
+    """Add the time spent in the block to the current sampled request's phase total"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_phase(name, time.perf_counter() - start)
+
+def wrap_connections(stack, timings):
+    """Install timings as the execute wrapper of this thread's database connections"""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timings))
+
+def view_name(request):
+    """URL name of the credit_app view that handled the request, or None to skip it"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.func.__module__.startswith('credit_app.') or match.url_name == 'metrics':
+        return None
+    return match.url_name
+
+class RequestMetricsMiddleware:
+    """Record wall time, DB queries and time, serializer and render time for credit_app views
+
+    Every request is counted; a METRICS_SAMPLE_RATE fraction is timed into histograms.
+    Sampled requests slower than SLOW_REQUEST_THRESHOLD_MS (0 disables) are logged to
+    credit_app.slow_requests with their SQL. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            response = self.get_response(request)
+            self.record(request, response)
+            return response
+
+        timings = RequestTimings(capture_sql=settings.SLOW_REQUEST_THRESHOLD_MS > 0)
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                wrap_connections(stack, timings)
+                response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        self.record(request, response, timings, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            response = await self.get_response(request)
+            self.record(request, response)
+            return response
+
+        timings = RequestTimings(capture_sql=settings.SLOW_REQUEST_THRESHOLD_MS > 0)
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # Connections are per thread: wrap the ones of the thread that runs this
+                # request's ORM calls
+                await sync_to_async(wrap_connections)(stack, timings)
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    await sync_to_async(stack.close)()
+        finally:
+            _current_timings.reset(token)
+        self.record(request, response, timings, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, timings=None, duration=None):
+        view = view_name(request)
+        if view is None:
+            return
+        registry.record_request(view, response.status_code)
+        if timings is None:
+            return
+        registry.observe(view, {
+            'duration': duration,
+            'db_queries': timings.db_queries,
+            'db': timings.db_seconds,
+            'serialize': timings.phases.get('serialize', 0.0),
+            'render': timings.phases.get('render', 0.0),
+        })
+        slow_threshold = settings.SLOW_REQUEST_THRESHOLD_MS / 1000
+        if slow_threshold > 0 and duration >= slow_threshold:
+            log_slow_request(request, view, response, duration, timings)
+
+    def process_template_response(self, request, response):
+        timings = _current_timings.get()
+        if timings is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: timings.add_phase('render', time.perf_counter() - start))
+        return response
+
+def log_slow_request(request, view, response, duration, timings):
+    lines = [
+        f'{request.method} {request.get_full_path()} ({view}) -> {response.status_code} in {duration * 1000:.1f} ms: '
+        f'{timings.db_queries} queries in {timings.db_seconds * 1000:.1f} ms, '
+        f"serializer {timings.phases.get('serialize', 0.0) * 1000:.1f} ms, "
+        f"render {timings.phases.get('render', 0.0) * 1000:.1f} ms"
+    ]
+    lines.extend(f'  [{elapsed * 1000:.1f} ms] {sql}' for elapsed, sql in timings.queries)
+    logger.warning('\n'.join(lines))
+
+def score_cache_metric_lines():
+    stats = get_score_cache().stats()
+    lines = []
+    for name in ('hits', 'misses', 'invalidations'):
+        lines.append(f'# TYPE credit_score_cache_{name}_total counter')
+        lines.append(f'credit_score_cache_{name}_total {stats[name]}')
+    if 'size' in stats:
+        lines.append('# TYPE credit_score_cache_entries gauge')
+        lines.append(f"credit_score_cache_entries {stats['size']}")
+    return lines
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='source_customer_id',
+            field=models.IntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0002_customer_source_customer_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCreditProfile',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_profile', serialize=False, to='credit_app.customer')),
+                ('loan_count', models.IntegerField(default=0)),
+                ('total_tenure', models.IntegerField(default=0)),
+                ('total_emis_paid_on_time', models.IntegerField(default=0)),
+                ('total_loan_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('loans_by_start_year', models.JSONField(default=dict)),
+                ('active_loan_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('active_monthly_repayment', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('active_until', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'customer_credit_profiles',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0003_customer_credit_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('endpoint', models.CharField(max_length=100)),
+                ('request_hash', models.CharField(max_length=64)),
+                ('response_status', models.IntegerField(blank=True, null=True)),
+                ('response_body', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'idempotency_keys',
+                'constraints': [models.UniqueConstraint(fields=('endpoint', 'key'), name='unique_idempotency_key_per_endpoint')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0004_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'end_date'], include=('loan_amount', 'monthly_repayment'), name='loans_customer_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'start_date'], name='loans_customer_start_date_idx'),
+        ),
+        # The composite indexes lead with customer_id, so the FK index is redundant
+        migrations.AlterField(
+            model_name='loan',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='credit_app.customer'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0005_loan_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCreditScore',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_score', serialize=False, to='credit_app.customer')),
+                ('credit_score', models.FloatField()),
+                ('scored_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'customer_credit_scores',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0006_customer_credit_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=20)),
+                ('file_path', models.CharField(max_length=500)),
+                ('file_hash', models.CharField(max_length=64)),
+                ('file_size', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='running', max_length=20)),
+                ('chunk_size', models.IntegerField()),
+                ('last_row', models.IntegerField(default=1)),
+                ('chunk_hashes', models.JSONField(default=dict)),
+                ('row_count', models.IntegerField(default=0)),
+                ('rows_read', models.IntegerField(default=0)),
+                ('created', models.IntegerField(default=0)),
+                ('updated', models.IntegerField(default=0)),
+                ('unchanged', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ingestion_manifests',
+            },
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='source_loan_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='loan',
+            constraint=models.UniqueConstraint(fields=('customer', 'source_loan_id'), name='unique_source_loan_per_customer'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingestionmanifest',
+            constraint=models.UniqueConstraint(fields=('label', 'file_hash'), name='unique_ingestion_manifest_per_file'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0007_incremental_ingestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customercreditscore',
+            name='ruleset_version',
+            field=models.CharField(blank=True, db_default='', default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='ruleset_version',
+            field=models.CharField(blank=True, db_default='', default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0008_ruleset_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioShard',
+            fields=[
+                ('shard_start', models.IntegerField(primary_key=True, serialize=False)),
+                ('shard_end', models.IntegerField()),
+                ('stale', models.BooleanField(default=True)),
+                ('customer_count', models.IntegerField(default=0)),
+                ('over_limit_customers', models.IntegerField(default=0)),
+                ('approved_limit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('current_debt', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('refreshed_on', models.DateField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'portfolio_shards',
+            },
+        ),
+        migrations.CreateModel(
+            name='PortfolioLoanRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_year', models.IntegerField()),
+                ('rate_band', models.CharField(max_length=20)),
+                ('active', models.BooleanField()),
+                ('loan_count', models.IntegerField()),
+                ('loan_amount', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('monthly_repayment', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('total_tenure', models.BigIntegerField()),
+                ('emis_paid_on_time', models.BigIntegerField()),
+                ('shard', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='loan_rollups', to='credit_app.portfolioshard')),
+            ],
+            options={
+                'db_table': 'portfolio_loan_rollups',
+                'constraints': [models.UniqueConstraint(fields=('shard', 'start_year', 'rate_band', 'active'), name='unique_portfolio_loan_rollup_bucket')],
+            },
+        ),
+    ]
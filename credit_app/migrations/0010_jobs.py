@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:11
+
+import django.core.serializers.json
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0009_portfolio_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('ingest', 'Ingest'), ('rescore', 'Rescore')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('params', models.JSONField(default=dict)),
+                ('rows_total', models.BigIntegerField(blank=True, null=True)),
+                ('rows_processed', models.BigIntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('errors', models.JSONField(default=list)),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'jobs',
+            },
+        ),
+    ]
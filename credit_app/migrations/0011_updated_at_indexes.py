@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0010_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['updated_at'], name='customers_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customercreditprofile',
+            index=models.Index(fields=['updated_at'], name='credit_profiles_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['updated_at'], name='loans_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:21
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0011_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxCheckpoint',
+            fields=[
+                ('consumer', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'outbox_checkpoints',
+            },
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('topic', models.CharField(choices=[('customer', 'Customer'), ('loan', 'Loan')], max_length=20)),
+                ('key', models.BigIntegerField()),
+                ('event_type', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=20)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sequence', models.BigIntegerField(blank=True, null=True, unique=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'outbox_events',
+                'indexes': [models.Index(condition=models.Q(('published_at__isnull', True)), fields=['id'], name='outbox_unpublished_idx'), models.Index(fields=['published_at'], name='outbox_published_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0012_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('event_type', 'deleted')), fields=['created_at'], name='outbox_deleted_created_at_idx'),
+        ),
+    ]
@@ -1,6 +1,14 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+import uuid
+
+CENT = Decimal('0.01')
+
+def to_cents(value):
+    """Round a money amount the way a decimal_places=2 column stores it"""
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
 
 class Customer(models.Model):
     customer_id = models.AutoField(primary_key=True)
@@ -11,6 +19,7 @@ class Customer(models.Model):
     monthly_salary = models.DecimalField(max_digits=12, decimal_places=2)
     approved_limit = models.DecimalField(max_digits=12, decimal_places=2)
     current_debt = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    source_customer_id = models.IntegerField(null=True, blank=True, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -23,10 +32,15 @@ class Customer(models.Model):
 
     class Meta:
         db_table = 'customers'
+        indexes = [
+            # Rows changed since a watermark, read by the loan book snapshot refresh
+            models.Index(fields=['updated_at'], name='customers_updated_at_idx'),
+        ]
 
 class Loan(models.Model):
     loan_id = models.AutoField(primary_key=True)
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans')
+    # Lookups by customer use the composite indexes in Meta, which lead with customer_id
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans', db_index=False)
     loan_amount = models.DecimalField(max_digits=12, decimal_places=2)
     tenure = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(600)])
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
@@ -34,6 +48,11 @@ class Loan(models.Model):
     emis_paid_on_time = models.IntegerField(default=0)
     start_date = models.DateField()
     end_date = models.DateField()
+    # Loan ID from the source workbook; only unique per customer there
+    source_loan_id = models.IntegerField(null=True, blank=True)
+    # Version of the approval ruleset that approved the loan; blank for ingested loans, which
+    # the staging loader inserts with raw SQL and so relies on the database default
+    ruleset_version = models.CharField(max_length=64, blank=True, default='', db_default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -45,4 +64,284 @@ class Loan(models.Model):
         return max(0, self.tenure - self.emis_paid_on_time)
 
     class Meta:
-        db_table = 'loans'
\ No newline at end of file
+        db_table = 'loans'
+        indexes = [
+            # Active loans of a customer (end_date >= today); the included columns let the
+            # active EMI and amount sums be answered from the index on PostgreSQL
+            models.Index(
+                fields=['customer', 'end_date'],
+                include=['loan_amount', 'monthly_repayment'],
+                name='loans_customer_end_date_idx',
+            ),
+            # Loans a customer started in a given year
+            models.Index(fields=['customer', 'start_date'], name='loans_customer_start_date_idx'),
+            # Rows changed since a watermark, read by the loan book snapshot refresh
+            models.Index(fields=['updated_at'], name='loans_updated_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'source_loan_id'], name='unique_source_loan_per_customer'),
+        ]
+
+class CustomerCreditProfile(models.Model):
+    customer = models.OneToOneField(Customer, primary_key=True, on_delete=models.CASCADE, related_name='credit_profile')
+    loan_count = models.IntegerField(default=0)
+    total_tenure = models.IntegerField(default=0)
+    total_emis_paid_on_time = models.IntegerField(default=0)
+    total_loan_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    loans_by_start_year = models.JSONField(default=dict)
+    active_loan_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    active_monthly_repayment = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # Earliest end date among active loans; the active sums must be recomputed once it has passed
+    active_until = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Credit profile for customer {self.customer_id}"
+
+    def is_stale(self, today):
+        return self.active_until is not None and self.active_until < today
+
+    def add_loan(self, loan, today):
+        """Fold a newly created loan into the running totals"""
+        self.loan_count += 1
+        self.total_tenure += loan.tenure
+        self.total_emis_paid_on_time += loan.emis_paid_on_time
+        self.total_loan_amount += to_cents(loan.loan_amount)
+        year = str(loan.start_date.year)
+        self.loans_by_start_year[year] = self.loans_by_start_year.get(year, 0) + 1
+        if loan.end_date >= today:
+            self.active_loan_amount += to_cents(loan.loan_amount)
+            self.active_monthly_repayment += to_cents(loan.monthly_repayment)
+            self.active_until = min(self.active_until or loan.end_date, loan.end_date)
+
+    def credit_score_inputs(self, today):
+        """Return the same inputs as utils.get_credit_score_inputs"""
+        return {
+            'loan_count': self.loan_count,
+            'total_tenure': self.total_tenure,
+            'total_emis_paid_on_time': self.total_emis_paid_on_time,
+            'current_year_loan_count': self.loans_by_start_year.get(str(today.year), 0),
+            'total_loan_amount': self.total_loan_amount,
+            'active_loan_amount': self.active_loan_amount,
+            'active_monthly_repayment': self.active_monthly_repayment,
+        }
+
+    class Meta:
+        db_table = 'customer_credit_profiles'
+        indexes = [
+            models.Index(fields=['updated_at'], name='credit_profiles_updated_at_idx'),
+        ]
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100)
+    # SHA-256 of the request body, so a reused key with a different payload is rejected
+    request_hash = models.CharField(max_length=64)
+    response_status = models.IntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key}"
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['endpoint', 'key'], name='unique_idempotency_key_per_endpoint'),
+        ]
+
+class CustomerCreditScore(models.Model):
+    customer = models.OneToOneField(Customer, primary_key=True, on_delete=models.CASCADE, related_name='credit_score')
+    credit_score = models.FloatField()
+    ruleset_version = models.CharField(max_length=64, blank=True, default='', db_default='')
+    scored_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Credit score {self.credit_score} for customer {self.customer_id}"
+
+    class Meta:
+        db_table = 'customer_credit_scores'
+
+class IngestionManifest(models.Model):
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [(STATUS_RUNNING, 'Running'), (STATUS_COMPLETED, 'Completed')]
+
+    label = models.CharField(max_length=20)
+    file_path = models.CharField(max_length=500)
+    # SHA-256 of the file contents, so a re-feed of the same file is recognised
+    file_hash = models.CharField(max_length=64)
+    file_size = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    chunk_size = models.IntegerField()
+    # Last sheet row whose chunk committed; a resumed run starts after it
+    last_row = models.IntegerField(default=1)
+    # {first row of chunk: SHA-256 of its source rows}, so a later feed can skip identical chunks
+    chunk_hashes = models.JSONField(default=dict)
+    row_count = models.IntegerField(default=0)
+    rows_read = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    unchanged = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.label} {self.file_path} ({self.status})"
+
+    class Meta:
+        db_table = 'ingestion_manifests'
+        constraints = [
+            models.UniqueConstraint(fields=['label', 'file_hash'], name='unique_ingestion_manifest_per_file'),
+        ]
+
+class PortfolioShard(models.Model):
+    """Customer totals for one customer ID range, refreshed by credit_app.portfolio"""
+    shard_start = models.IntegerField(primary_key=True)
+    shard_end = models.IntegerField()
+    # Set by any write to the range's customers or loans; cleared when the shard is recomputed
+    stale = models.BooleanField(default=True)
+    customer_count = models.IntegerField(default=0)
+    # Customers whose active loans add up to more than their approved limit
+    over_limit_customers = models.IntegerField(default=0)
+    approved_limit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    current_debt = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    # Active/ended splits are as of this date
+    refreshed_on = models.DateField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Portfolio shard {self.shard_start}-{self.shard_end}"
+
+    class Meta:
+        db_table = 'portfolio_shards'
+
+class PortfolioLoanRollup(models.Model):
+    """Loan totals of one shard for a start year, interest-rate band and active flag"""
+    # Rollups are replaced per shard through the unique constraint's index, which leads with shard
+    shard = models.ForeignKey(PortfolioShard, on_delete=models.CASCADE, related_name='loan_rollups', db_index=False)
+    start_year = models.IntegerField()
+    rate_band = models.CharField(max_length=20)
+    active = models.BooleanField()
+    loan_count = models.IntegerField()
+    loan_amount = models.DecimalField(max_digits=18, decimal_places=2)
+    monthly_repayment = models.DecimalField(max_digits=18, decimal_places=2)
+    total_tenure = models.BigIntegerField()
+    emis_paid_on_time = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Loans of shard {self.shard_id}, {self.start_year}, rate {self.rate_band}"
+
+    class Meta:
+        db_table = 'portfolio_loan_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shard', 'start_year', 'rate_band', 'active'], name='unique_portfolio_loan_rollup_bucket'
+            ),
+        ]
+
+class Job(models.Model):
+    """A long-running ingestion or rescoring run started over the API, see credit_app.jobs"""
+    KIND_INGEST = 'ingest'
+    KIND_RESCORE = 'rescore'
+    KIND_CHOICES = [(KIND_INGEST, 'Ingest'), (KIND_RESCORE, 'Rescore')]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'), (STATUS_RUNNING, 'Running'), (STATUS_SUCCEEDED, 'Succeeded'), (STATUS_FAILED, 'Failed')
+    ]
+
+    # Also the Celery task ID, so the job and its task state share a key
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    params = models.JSONField(default=dict)
+    # Null while unknown, e.g. for Parquet files without pyarrow
+    rows_total = models.BigIntegerField(null=True, blank=True)
+    rows_processed = models.BigIntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    # [{"chunk", "row", "error", ...}] for rejected rows, or one {"type", "message"} if the job failed
+    errors = models.JSONField(default=list)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+    @property
+    def throughput(self):
+        """Rows per second from the start to the last progress update"""
+        if self.started_at is None:
+            return None
+        elapsed = ((self.finished_at or self.updated_at) - self.started_at).total_seconds()
+        return self.rows_processed / elapsed if elapsed > 0 else None
+
+    @property
+    def eta_seconds(self):
+        """Seconds left at the current throughput, or None when there is no estimate"""
+        if self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED):
+            return 0.0
+        throughput = self.throughput
+        if self.status != self.STATUS_RUNNING or self.rows_total is None or not throughput:
+            return None
+        return max(self.rows_total - self.rows_processed, 0) / throughput
+
+    class Meta:
+        db_table = 'jobs'
+
+class OutboxEvent(models.Model):
+    """A customer or loan write, recorded in the writing transaction, see credit_app.outbox"""
+    TOPIC_CUSTOMER = 'customer'
+    TOPIC_LOAN = 'loan'
+    TOPIC_CHOICES = [(TOPIC_CUSTOMER, 'Customer'), (TOPIC_LOAN, 'Loan')]
+
+    TYPE_CREATED = 'created'
+    TYPE_UPDATED = 'updated'
+    TYPE_DELETED = 'deleted'
+    TYPE_CHOICES = [(TYPE_CREATED, 'Created'), (TYPE_UPDATED, 'Updated'), (TYPE_DELETED, 'Deleted')]
+
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=20, choices=TOPIC_CHOICES)
+    # customer_id or loan_id
+    key = models.BigIntegerField()
+    event_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Gap-free publish order, assigned by the dispatcher; consumers checkpoint on it
+    sequence = models.BigIntegerField(null=True, blank=True, unique=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.topic} {self.key} {self.event_type}"
+
+    class Meta:
+        db_table = 'outbox_events'
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_unpublished_idx'),
+            models.Index(fields=['published_at'], name='outbox_published_at_idx'),
+            # Deletions since the loan book snapshot's watermark, see credit_app.loan_book
+            models.Index(
+                fields=['created_at'], condition=models.Q(event_type='deleted'), name='outbox_deleted_created_at_idx'
+            ),
+        ]
+
+class OutboxCheckpoint(models.Model):
+    """Last event sequence a consumer has handled, or the dispatcher has assigned"""
+    consumer = models.CharField(max_length=100, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consumer} at {self.position}"
+
+    class Meta:
+        db_table = 'outbox_checkpoints'
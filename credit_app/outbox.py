@@ -0,0 +1,218 @@
+"""Transactional outbox of customer and loan writes for downstream consumers
+
+Every write path records an OutboxEvent in the transaction that makes the write: the
+model signals for single rows (registration, create-loan, admin edits and deletes), and
+registration batches, ingestion and the staging-table loaders for bulk writes. An event
+therefore exists if and only if its write committed.
+
+dispatch_outbox publishes unpublished events in id order to the sink configured by
+OUTBOX_SINK, a LocalEventSink in the process or a RedisStreamSink. Dispatchers take turns
+on a checkpoint row lock and give each event the next sequence number, so sequences are
+gap-free in publish order. The sink is written before the transaction marking the batch
+published commits: a failure in between publishes the batch again, so delivery is
+at-least-once and consumers deduplicate on the event id.
+
+consume_events hands a consumer the published events after its checkpoint and moves the
+checkpoint once the handler returns, redelivering the batch if it raises. Redis stream
+consumers can use consumer groups (XREADGROUP and XACK) instead.
+"""
+from collections import deque
+import json
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import redis
+from .models import OutboxCheckpoint, OutboxEvent
+
+# Fields carried in each topic's event payloads
+EVENT_FIELDS = {
+    OutboxEvent.TOPIC_CUSTOMER: [
+        'customer_id', 'first_name', 'last_name', 'age', 'phone_number', 'monthly_salary', 'approved_limit',
+        'current_debt', 'updated_at',
+    ],
+    OutboxEvent.TOPIC_LOAN: [
+        'loan_id', 'customer_id', 'loan_amount', 'tenure', 'interest_rate', 'monthly_repayment', 'emis_paid_on_time',
+        'start_date', 'end_date', 'updated_at',
+    ],
+}
+EVENT_KEYS = {OutboxEvent.TOPIC_CUSTOMER: 'customer_id', OutboxEvent.TOPIC_LOAN: 'loan_id'}
+
+# Checkpoint row holding the last sequence number the dispatchers assigned
+DISPATCHER = 'outbox-dispatcher'
+
+def record_events(topic, event_type, instances, batch_size=1000):
+    """Add outbox events for customers or loans written in the current transaction"""
+    if not settings.OUTBOX_ENABLED:
+        return
+    fields = EVENT_FIELDS[topic]
+    key = EVENT_KEYS[topic]
+    events = (
+        OutboxEvent(
+            topic=topic,
+            key=getattr(instance, key),
+            event_type=event_type,
+            payload={field: getattr(instance, field) for field in fields},
+        )
+        for instance in instances
+    )
+    OutboxEvent.objects.bulk_create(events, batch_size=batch_size)
+
+def event_message(event):
+    """The dict an event is published and delivered as"""
+    return {
+        'id': event.id,
+        'sequence': event.sequence,
+        'topic': event.topic,
+        'key': event.key,
+        'type': event.event_type,
+        'payload': event.payload,
+        'created_at': event.created_at.isoformat(),
+    }
+
+class LocalEventSink:
+    """Keep the last max_size published events in the process and pass each batch to handlers
+
+    handlers are dotted paths of callables taking a list of event messages. A handler
+    that raises fails the dispatch, so the batch is published again.
+    """
+
+    def __init__(self, handlers=(), max_size=10000, **options):
+        self.handlers = [import_string(handler) if isinstance(handler, str) else handler for handler in handlers]
+        self.events = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+
+    def publish(self, messages):
+        for handler in self.handlers:
+            handler(messages)
+        with self._lock:
+            self.events.extend(messages)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+class RedisStreamSink:
+    """Append events to one Redis stream per topic, e.g. credit:loan, trimmed to about maxlen entries"""
+
+    def __init__(self, url='', stream_prefix='credit', maxlen=1000000, **options):
+        self.client = redis.Redis.from_url(url)
+        self.stream_prefix = stream_prefix
+        self.maxlen = maxlen
+
+    def stream(self, topic):
+        return f'{self.stream_prefix}:{topic}'
+
+    def publish(self, messages):
+        pipeline = self.client.pipeline(transaction=False)
+        for message in messages:
+            fields = dict(message, payload=json.dumps(message['payload'], cls=DjangoJSONEncoder))
+            pipeline.xadd(self.stream(message['topic']), fields, maxlen=self.maxlen, approximate=True)
+        pipeline.execute()
+
+_event_sink = None
+_event_sink_lock = threading.Lock()
+
+def get_event_sink():
+    """Return the process-wide event sink configured by settings.OUTBOX_SINK"""
+    global _event_sink
+    if _event_sink is None:
+        with _event_sink_lock:
+            if _event_sink is None:
+                config = dict(settings.OUTBOX_SINK)
+                backend = import_string(config.pop('BACKEND'))
+                _event_sink = backend(**{key.lower(): value for key, value in config.items()})
+    return _event_sink
+
+@receiver(setting_changed)
+def reset_event_sink(setting, **kwargs):
+    global _event_sink
+    if setting == 'OUTBOX_SINK':
+        _event_sink = None
+
+def locked_checkpoint(consumer):
+    """Lock and return a consumer's checkpoint row, creating it at position 0; call inside a transaction"""
+    OutboxCheckpoint.objects.get_or_create(consumer=consumer)
+    return OutboxCheckpoint.objects.select_for_update().get(consumer=consumer)
+
+def contiguous_runs(ids):
+    """Split sorted IDs into (first, last) runs of consecutive values"""
+    runs = []
+    for id in ids:
+        if runs and runs[-1][1] == id - 1:
+            runs[-1][1] = id
+        else:
+            runs.append([id, id])
+    return runs
+
+def dispatch_outbox(batch_size=None, sink=None):
+    """Publish unpublished events to the sink in batches; returns the number published"""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    sink = sink or get_event_sink()
+    published = 0
+    while True:
+        with transaction.atomic():
+            checkpoint = locked_checkpoint(DISPATCHER)
+            events = list(OutboxEvent.objects.filter(published_at__isnull=True).order_by('id')[:batch_size])
+            if not events:
+                break
+            now = timezone.now()
+            for sequence, event in enumerate(events, start=checkpoint.position + 1):
+                event.sequence = sequence
+                event.published_at = now
+            # IDs are usually consecutive, so this is one UPDATE per batch
+            sequence = checkpoint.position + 1
+            for first, last in contiguous_runs([event.id for event in events]):
+                OutboxEvent.objects.filter(id__range=(first, last)).update(
+                    sequence=F('id') + (sequence - first), published_at=now
+                )
+                sequence += last - first + 1
+            checkpoint.position = events[-1].sequence
+            checkpoint.save()
+            # Last, so a failing sink leaves the batch unpublished
+            sink.publish([event_message(event) for event in events])
+        published += len(events)
+        if len(events) < batch_size:
+            break
+    return published
+
+def consume_events(consumer, handler, batch_size=None, topics=None):
+    """Pass the events published after consumer's checkpoint to handler, batch by batch
+
+    The checkpoint moves past a batch once handler returns; if it raises, the batch is
+    delivered again on the next call. Events of other topics are skipped. Returns the
+    number of events handled.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    handled = 0
+    while True:
+        with transaction.atomic():
+            checkpoint = locked_checkpoint(consumer)
+            events = list(OutboxEvent.objects.filter(sequence__gt=checkpoint.position).order_by('sequence')[:batch_size])
+            if not events:
+                break
+            messages = [event_message(event) for event in events if topics is None or event.topic in topics]
+            if messages:
+                handler(messages)
+            checkpoint.position = events[-1].sequence
+            checkpoint.save()
+        handled += len(messages)
+        if len(events) < batch_size:
+            break
+    return handled
+
+def purge_published_events(max_age, batch_size=10000):
+    """Delete events published longer than max_age (a timedelta) ago; returns the number deleted"""
+    cutoff = timezone.now() - max_age
+    deleted = 0
+    while True:
+        ids = list(OutboxEvent.objects.filter(published_at__lt=cutoff).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = OutboxEvent.objects.filter(id__in=ids).delete()
+        deleted += count
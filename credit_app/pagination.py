@@ -0,0 +1,12 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+class LoanCursorPagination(CursorPagination):
+    """Keyset pagination on loan_id; page cost does not grow with the page number"""
+    ordering = 'loan_id'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+
+    @property
+    def max_page_size(self):
+        return settings.VIEW_LOANS_MAX_PAGE_SIZE
@@ -0,0 +1,240 @@
+"""Portfolio rollups behind /api/portfolio/summary
+
+Customers are split into customer ID ranges of PORTFOLIO_SHARD_SIZE. Each range has a
+PortfolioShard row with its customer totals, and PortfolioLoanRollup rows with its loan
+totals by start year, interest-rate band and whether the loan is active. Writes to
+customers and loans mark their shard stale: the model signals for single rows, and the
+ingestion and staging loaders for bulk writes. refresh_portfolio_shards recomputes the
+stale shards, and every shard on its first run of a new day, because the active/ended
+split and the over-limit counts depend on the date.
+
+The summary sums rollup rows, so it costs a few queries over tables whose size depends on
+the number of shards and buckets, not on the size of the loan book.
+"""
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Case, CharField, Count, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from .models import Customer, Loan, PortfolioLoanRollup, PortfolioShard
+from .routers import use_primary
+
+def shard_start(customer_id, shard_size):
+    """First customer ID of the shard holding customer_id"""
+    return (customer_id - 1) // shard_size * shard_size + 1
+
+def rate_bands():
+    """Return [(label, upper bound or None)] for PORTFOLIO_RATE_BANDS, e.g. ('8-10', 10) and ('16+', None)"""
+    edges = [Decimal(edge) for edge in settings.PORTFOLIO_RATE_BANDS]
+    lowers = [Decimal('0')] + edges
+    bands = [(f'{lower.normalize():f}-{upper.normalize():f}', upper) for lower, upper in zip(lowers, edges)]
+    bands.append((f'{edges[-1].normalize():f}+', None))
+    return bands
+
+def rate_band_labels():
+    return [label for label, _ in rate_bands()]
+
+def rate_band_expression():
+    """SQL expression labelling a loan with its interest-rate band"""
+    bands = rate_bands()
+    return Case(
+        *[When(interest_rate__lt=upper, then=Value(label)) for label, upper in bands[:-1]],
+        default=Value(bands[-1][0]),
+        output_field=CharField(),
+    )
+
+def stale_shards_filter(today):
+    return Q(stale=True) | Q(refreshed_on__isnull=True) | Q(refreshed_on__lt=today)
+
+def mark_portfolio_stale(customer_ids):
+    """Flag the shards holding these customers for the next refresh
+
+    Shards already stale are written too: a refresh in progress holds the row, so the
+    write waits for it and marks the shard again after it commits.
+    """
+    shard_size = settings.PORTFOLIO_SHARD_SIZE
+    starts = sorted({shard_start(customer_id, shard_size) for customer_id in customer_ids})
+    if len(starts) > 1:
+        # Locked in shard order, so two writers spanning the same shards cannot deadlock
+        shards = PortfolioShard.objects.select_for_update().filter(shard_start__in=starts).order_by('shard_start')
+        list(shards.values_list('shard_start', flat=True))
+    if starts:
+        PortfolioShard.objects.filter(shard_start__in=starts).update(stale=True)
+
+def mark_new_portfolio_customers():
+    """Flag the shard new customers are added to when their IDs are not at hand (bulk inserts)
+
+    Customer IDs come from a sequence, so new customers land in the last shard or in
+    ranges past it, which the next refresh adds.
+    """
+    last = PortfolioShard.objects.aggregate(last=Max('shard_start'))['last']
+    if last is not None:
+        PortfolioShard.objects.filter(shard_start=last).update(stale=True)
+
+def sync_portfolio_shards(shard_size):
+    """Add stale shards for customer ID ranges without one, and drop shards out of range or of another size"""
+    bounds = Customer.objects.aggregate(first=Min('customer_id'), last=Max('customer_id'))
+    if bounds['first'] is None:
+        PortfolioShard.objects.all().delete()
+        return
+    first = shard_start(bounds['first'], shard_size)
+    PortfolioShard.objects.filter(
+        ~Q(shard_end=F('shard_start') + shard_size - 1) | Q(shard_start__lt=first) | Q(shard_start__gt=bounds['last'])
+    ).delete()
+    existing = set(PortfolioShard.objects.values_list('shard_start', flat=True))
+    PortfolioShard.objects.bulk_create(
+        [
+            PortfolioShard(shard_start=start, shard_end=start + shard_size - 1)
+            for start in range(first, bounds['last'] + 1, shard_size)
+            if start not in existing
+        ],
+        ignore_conflicts=True,
+    )
+
+def refresh_portfolio_shard(start, today):
+    """Recompute one shard's customer totals and loan rollups; call inside a transaction
+
+    The shard row stays locked until commit, so a write marking it stale meanwhile waits
+    and leaves it stale for the next refresh (see mark_portfolio_stale).
+    """
+    shard = PortfolioShard.objects.select_for_update().filter(shard_start=start).first()
+    if shard is None:
+        return False
+    buckets = (
+        Loan.objects.filter(customer_id__gte=shard.shard_start, customer_id__lte=shard.shard_end)
+        .values(
+            start_year=ExtractYear('start_date'),
+            rate_band=rate_band_expression(),
+            active=Case(When(end_date__gte=today, then=Value(True)), default=Value(False), output_field=BooleanField()),
+        )
+        .annotate(
+            loan_count=Count('loan_id'),
+            loan_amount=Sum('loan_amount'),
+            monthly_repayment=Sum('monthly_repayment'),
+            total_tenure=Sum('tenure'),
+            emis_paid_on_time=Sum('emis_paid_on_time'),
+        )
+    )
+    PortfolioLoanRollup.objects.filter(shard=shard).delete()
+    PortfolioLoanRollup.objects.bulk_create([PortfolioLoanRollup(shard=shard, **bucket) for bucket in buckets])
+
+    customers = Customer.objects.filter(customer_id__range=(shard.shard_start, shard.shard_end))
+    totals = customers.aggregate(
+        customer_count=Count('customer_id'), approved_limit=Sum('approved_limit'), current_debt=Sum('current_debt')
+    )
+    shard.over_limit_customers = (
+        customers.annotate(active_loan_amount=Sum('loans__loan_amount', filter=Q(loans__end_date__gte=today)))
+        .filter(active_loan_amount__gt=F('approved_limit'))
+        .count()
+    )
+    shard.customer_count = totals['customer_count']
+    shard.approved_limit = totals['approved_limit'] or 0
+    shard.current_debt = totals['current_debt'] or 0
+    shard.stale = False
+    shard.refreshed_on = today
+    shard.refreshed_at = timezone.now()
+    shard.save()
+    return True
+
+def refresh_portfolio_shards(full=False, today=None):
+    """Recompute stale shards, or every shard with full=True; returns the number refreshed
+
+    Each shard is refreshed in its own transaction.
+    """
+    # Rollups are computed from the primary: a lagging replica would store stale totals
+    use_primary()
+    today = today or date.today()
+    sync_portfolio_shards(settings.PORTFOLIO_SHARD_SIZE)
+    shards = PortfolioShard.objects.order_by('shard_start')
+    if not full:
+        shards = shards.filter(stale_shards_filter(today))
+    refreshed = 0
+    for start in list(shards.values_list('shard_start', flat=True)):
+        with transaction.atomic():
+            refreshed += refresh_portfolio_shard(start, today)
+    return refreshed
+
+def on_time_ratio(row):
+    return row['emis_paid_on_time'] / row['total_tenure'] if row['total_tenure'] else None
+
+def summarize_portfolio(rate_band=None, start_year_min=None, start_year_max=None, status='all', today=None):
+    """Portfolio totals from the rollups, by interest-rate band and start year
+
+    Loan figures honour the filters; customer figures cover the whole portfolio. Reports
+    the oldest shard refresh time and how many shards are waiting for a refresh.
+    """
+    today = today or date.today()
+    rollups = PortfolioLoanRollup.objects.all()
+    if rate_band:
+        rollups = rollups.filter(rate_band__in=rate_band)
+    if start_year_min is not None:
+        rollups = rollups.filter(start_year__gte=start_year_min)
+    if start_year_max is not None:
+        rollups = rollups.filter(start_year__lte=start_year_max)
+    if status != 'all':
+        rollups = rollups.filter(active=status == 'active')
+
+    active = Q(active=True)
+    band_rows = {
+        row['rate_band']: row
+        # The filtered sums come first: once loan_amount names the total, it refers to that
+        for row in rollups.values('rate_band').annotate(
+            active_loan_amount=Sum('loan_amount', filter=active),
+            active_monthly_repayment=Sum('monthly_repayment', filter=active),
+            loan_count=Sum('loan_count'),
+            loan_amount=Sum('loan_amount'),
+        )
+    }
+    zero_band = {'loan_count': 0, 'loan_amount': 0, 'active_loan_amount': 0, 'active_monthly_repayment': 0}
+    by_rate_band = [
+        {'rate_band': label, **{key: band_rows.get(label, {}).get(key) or 0 for key in zero_band}}
+        for label in rate_band_labels()
+        if not rate_band or label in rate_band
+    ]
+
+    year_rows = list(
+        rollups.values('start_year')
+        .annotate(
+            loan_count=Sum('loan_count'),
+            loan_amount=Sum('loan_amount'),
+            total_tenure=Sum('total_tenure'),
+            emis_paid_on_time=Sum('emis_paid_on_time'),
+        )
+        .order_by('start_year')
+    )
+    by_start_year = [
+        {
+            'start_year': row['start_year'],
+            'loan_count': row['loan_count'],
+            'loan_amount': row['loan_amount'],
+            'on_time_ratio': on_time_ratio(row),
+        }
+        for row in year_rows
+    ]
+
+    loans = {key: sum(band[key] for band in by_rate_band) for key in zero_band}
+    loans['on_time_ratio'] = on_time_ratio({
+        'total_tenure': sum(row['total_tenure'] for row in year_rows),
+        'emis_paid_on_time': sum(row['emis_paid_on_time'] for row in year_rows),
+    })
+
+    shards = PortfolioShard.objects.aggregate(
+        customer_count=Sum('customer_count'),
+        over_limit_customers=Sum('over_limit_customers'),
+        approved_limit=Sum('approved_limit'),
+        current_debt=Sum('current_debt'),
+        refreshed_at=Min('refreshed_at'),
+        stale_shards=Count('shard_start', filter=stale_shards_filter(today)),
+    )
+    return {
+        'loans': loans,
+        'by_rate_band': by_rate_band,
+        'by_start_year': by_start_year,
+        'customers': {
+            key: shards[key] or 0 for key in ('customer_count', 'over_limit_customers', 'approved_limit', 'current_debt')
+        },
+        'refreshed_at': shards['refreshed_at'],
+        'stale_shards': shards['stale_shards'],
+    }
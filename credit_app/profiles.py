@@ -0,0 +1,163 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import ExtractYear
+from .models import Customer, CustomerCreditProfile, Loan
+from .routers import use_primary
+from .score_cache import invalidate_credit_scores
+
+PROFILE_FIELDS = [
+    'loan_count', 'total_tenure', 'total_emis_paid_on_time', 'total_loan_amount', 'loans_by_start_year',
+    'active_loan_amount', 'active_monthly_repayment', 'active_until',
+]
+
+def empty_profile_values():
+    return {
+        'loan_count': 0,
+        'total_tenure': 0,
+        'total_emis_paid_on_time': 0,
+        'total_loan_amount': Decimal('0'),
+        'loans_by_start_year': {},
+        'active_loan_amount': Decimal('0'),
+        'active_monthly_repayment': Decimal('0'),
+        'active_until': None,
+    }
+
+def compute_credit_profiles(customer_ids, today=None):
+    """Compute profile values from the loans table for a batch of customers (two queries)"""
+    today = today or date.today()
+    active = Q(end_date__gte=today)
+    values = {customer_id: empty_profile_values() for customer_id in customer_ids}
+
+    totals = (
+        Loan.objects.filter(customer_id__in=customer_ids)
+        .values('customer_id')
+        .annotate(
+            loan_count=Count('loan_id'),
+            total_tenure=Sum('tenure'),
+            total_emis_paid_on_time=Sum('emis_paid_on_time'),
+            total_loan_amount=Sum('loan_amount'),
+            active_loan_amount=Sum('loan_amount', filter=active),
+            active_monthly_repayment=Sum('monthly_repayment', filter=active),
+            active_until=Min('end_date', filter=active),
+        )
+    )
+    for row in totals:
+        profile = values[row.pop('customer_id')]
+        for field, value in row.items():
+            if value is not None:
+                profile[field] = value
+
+    years = (
+        Loan.objects.filter(customer_id__in=customer_ids)
+        .values('customer_id', year=ExtractYear('start_date'))
+        .annotate(count=Count('loan_id'))
+    )
+    for row in years:
+        values[row['customer_id']]['loans_by_start_year'][str(row['year'])] = row['count']
+
+    return values
+
+def rebuild_credit_profiles(customer_ids, today=None):
+    """Recompute and upsert the profiles of the given existing customers"""
+    # Computed from the primary: a lagging replica would store a stale profile there
+    use_primary()
+    customer_ids = list(Customer.objects.filter(customer_id__in=list(customer_ids)).values_list('customer_id', flat=True))
+    values = compute_credit_profiles(customer_ids, today)
+    profiles = [CustomerCreditProfile(customer_id=customer_id, **fields) for customer_id, fields in values.items()]
+    CustomerCreditProfile.objects.bulk_create(
+        # updated_at too, so rescoring and the loan book snapshot see rebuilt profiles as changed
+        profiles, update_conflicts=True, unique_fields=['customer'], update_fields=PROFILE_FIELDS + ['updated_at']
+    )
+    invalidate_credit_scores(customer_ids)
+    return profiles
+
+def iter_customer_id_batches(batch_size):
+    batch = []
+    for customer_id in Customer.objects.order_by('customer_id').values_list('customer_id', flat=True).iterator():
+        batch.append(customer_id)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def rebuild_all_credit_profiles(batch_size=1000, today=None):
+    """Rebuild every customer's profile in batches; returns the number of profiles written"""
+    rebuilt = 0
+    for customer_ids in iter_customer_id_batches(batch_size):
+        with transaction.atomic():
+            rebuilt += len(rebuild_credit_profiles(customer_ids, today))
+    return rebuilt
+
+def verify_credit_profiles(batch_size=1000, today=None):
+    """Compare every stored profile with one computed from the loans table
+
+    Returns a list of (customer_id, field names that differ) for each mismatching profile.
+    A missing profile is reported with the field list ['missing'] when the customer has
+    loans; customers without loans need no profile until their first loan.
+    """
+    today = today or date.today()
+    mismatches = []
+    for customer_ids in iter_customer_id_batches(batch_size):
+        expected = compute_credit_profiles(customer_ids, today)
+        stored = CustomerCreditProfile.objects.in_bulk(customer_ids)
+        for customer_id, fields in expected.items():
+            profile = stored.get(customer_id)
+            if profile is None:
+                if fields['loan_count']:
+                    mismatches.append((customer_id, ['missing']))
+                continue
+            differing = [field for field, value in fields.items() if getattr(profile, field) != value]
+            if differing:
+                mismatches.append((customer_id, differing))
+    return mismatches
+
+def record_new_loans(loans, today=None):
+    """Fold newly inserted loans into their customers' profiles
+
+    Must be called after the loans are saved, ideally in the same transaction. Customers
+    without a usable profile get one rebuilt from the loans table, which already
+    includes the new loans.
+    """
+    today = today or date.today()
+    loans_by_customer = defaultdict(list)
+    for loan in loans:
+        loans_by_customer[loan.customer_id].append(loan)
+    if not loans_by_customer:
+        return
+
+    with transaction.atomic():
+        profiles = CustomerCreditProfile.objects.select_for_update().in_bulk(list(loans_by_customer))
+        updated = []
+        to_rebuild = []
+        for customer_id, customer_loans in loans_by_customer.items():
+            profile = profiles.get(customer_id)
+            if profile is None or profile.is_stale(today):
+                to_rebuild.append(customer_id)
+                continue
+            for loan in customer_loans:
+                profile.add_loan(loan, today)
+            updated.append(profile)
+        CustomerCreditProfile.objects.bulk_update(updated, PROFILE_FIELDS)
+        invalidate_credit_scores(profile.customer_id for profile in updated)
+        if to_rebuild:
+            rebuild_credit_profiles(to_rebuild, today)
+
+def get_profile_credit_inputs(customer, today=None):
+    """Return credit score inputs from the customer's profile, rebuilding it if missing or stale
+
+    Callers should fetch the customer with select_related('credit_profile') so the common
+    case is answered by that single row.
+    """
+    today = today or date.today()
+    try:
+        profile = customer.credit_profile
+    except CustomerCreditProfile.DoesNotExist:
+        profile = None
+    if profile is None or profile.is_stale(today):
+        profile = rebuild_credit_profiles([customer.customer_id], today)[0]
+        customer.credit_profile = profile
+    return profile.credit_score_inputs(today)
@@ -0,0 +1,113 @@
+"""Batch customer registration behind /api/register/batch and the register_customers command
+
+A batch is validated row by row with the single endpoint's rules, except phone number
+uniqueness: numbers repeated within the batch are caught in memory and numbers already
+registered with one query for the whole batch. Approved limits are computed in one
+vectorized pass and the valid rows inserted with bulk_create, so the query count does
+not grow with the batch size.
+"""
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from .ingestion import chunked, iter_source_rows
+from .models import Customer, OutboxEvent
+from .outbox import record_events
+from .portfolio import mark_portfolio_stale
+from .serializers import CustomerRegistrationBatchItemSerializer, CustomerRegistrationResponseSerializer
+from .utils import calculate_approved_limits
+
+# Same wording as the single endpoint's unique phone number check
+PHONE_TAKEN = 'customer with this phone number already exists.'
+
+REGISTRATION_COLUMNS = {
+    'first name': 'first_name',
+    'last name': 'last_name',
+    'age': 'age',
+    'monthly income': 'monthly_income',
+    'monthly salary': 'monthly_income',
+    'phone number': 'phone_number',
+}
+REQUIRED_REGISTRATION_FIELDS = ['first_name', 'last_name', 'age', 'monthly_income', 'phone_number']
+
+def validate_registrations(rows):
+    """Return ({index: validated data}, {index: errors}) for a list of registration payloads"""
+    item_serializer = CustomerRegistrationBatchItemSerializer()
+    valid, errors = {}, {}
+    first_seen = {}
+    for index, row in enumerate(rows):
+        try:
+            data = item_serializer.run_validation(row)
+        except ValidationError as error:
+            errors[index] = error.detail
+            continue
+        phone_number = data['phone_number']
+        if phone_number in first_seen:
+            errors[index] = {'phone_number': [f'Duplicate of the phone number in row {first_seen[phone_number]}.']}
+            continue
+        first_seen[phone_number] = index
+        valid[index] = data
+    return valid, errors
+
+def reject_registered_phones(valid, errors):
+    """Move rows whose phone number is already registered from valid to errors, in one query"""
+    registered = set(
+        Customer.objects.filter(phone_number__in=[data['phone_number'] for data in valid.values()])
+        .values_list('phone_number', flat=True)
+    )
+    for index in [index for index, data in valid.items() if data['phone_number'] in registered]:
+        del valid[index]
+        errors[index] = {'phone_number': [PHONE_TAKEN]}
+
+def insert_registrations(valid):
+    """bulk_create customers for validated rows; returns {index: Customer}"""
+    indexes = list(valid)
+    limits = calculate_approved_limits(valid[index]['monthly_salary'] for index in indexes)
+    customers = [
+        Customer(approved_limit=approved_limit, **valid[index]) for index, approved_limit in zip(indexes, limits)
+    ]
+    with transaction.atomic():
+        Customer.objects.bulk_create(customers)
+        # bulk_create sends no post_save, so the portfolio shards and outbox are updated here
+        mark_portfolio_stale([customer.customer_id for customer in customers])
+        record_events(OutboxEvent.TOPIC_CUSTOMER, OutboxEvent.TYPE_CREATED, customers)
+    return dict(zip(indexes, customers))
+
+def register_customers(rows):
+    """Register a list of registration payloads; returns one result per row, in input order
+
+    Each result has the row's index and either the registered customer or its errors.
+    """
+    valid, errors = validate_registrations(rows)
+    created = {}
+    if valid:
+        reject_registered_phones(valid, errors)
+        try:
+            created = insert_registrations(valid) if valid else {}
+        except IntegrityError:
+            # A number was registered between the check and the insert; check again and
+            # retry once with what is left
+            reject_registered_phones(valid, errors)
+            created = insert_registrations(valid) if valid else {}
+
+    customers = CustomerRegistrationResponseSerializer(list(created.values()), many=True).data
+    represented = dict(zip(created, customers))
+    return [
+        {'index': index, 'customer': represented.get(index), 'errors': errors.get(index)}
+        for index in range(len(rows))
+    ]
+
+def import_registrations(file_path, batch_size):
+    """Register customers from an xlsx, CSV or Parquet file in batches
+
+    Columns are first name, last name, age, monthly income (or monthly salary) and phone
+    number. Returns (created count, [(row number, errors)]).
+    """
+    created, failures = 0, []
+    rows = iter_source_rows(file_path, REGISTRATION_COLUMNS, REQUIRED_REGISTRATION_FIELDS)
+    for batch in chunked(rows, batch_size):
+        results = register_customers([record for _, record in batch])
+        for (row_number, _), result in zip(batch, results):
+            if result['errors']:
+                failures.append((row_number, result['errors']))
+            else:
+                created += 1
+    return created, failures
@@ -0,0 +1,59 @@
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that produces the same bytes with orjson when READ_SERIALIZATION is 'orjson'
+
+    orjson is only used for compact, unescaped output of dicts, lists, strings, ints,
+    booleans and None. Payloads with other values (floats, which orjson formats
+    differently, Decimals, dates) and indented output go through the stdlib encoder, as
+    does everything when orjson is not installed.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or settings.READ_SERIALIZATION != 'orjson'
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+            or not plain_json(data)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like JSONRenderer so the output stays a strict JavaScript subset
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+class PlainJSONDict(dict):
+    """A dict known to hold only strings, ints and None, so plain_json does not walk it"""
+
+class PlainJSONList(list):
+    """A list known to hold only dicts of strings, ints and None, so plain_json does not walk it"""
+
+PLAIN_TYPES = frozenset([str, int, bool, type(None), PlainJSONDict, PlainJSONList])
+
+def plain_json(data):
+    """True when data holds only types orjson and the stdlib encoder render identically"""
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if type(value) in PLAIN_TYPES:
+            continue
+        if isinstance(value, dict):
+            if not all(isinstance(key, str) for key in value):
+                return False
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+        elif not isinstance(value, (str, int)):
+            return False
+    return True
@@ -0,0 +1,124 @@
+from celery import group
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import os
+import time
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from .models import Customer, CustomerCreditScore, Loan
+from .rules import current_ruleset
+from .utils import credit_score_aggregates
+
+def changed_customers_filter(since):
+    """Customers whose own row, loans or credit profile were written at or after since
+
+    Profiles are rewritten whenever a loan is edited or deleted, so this also catches
+    deletions. Scores that change only because time passed (a loan ending, a new year)
+    are picked up by full runs.
+    """
+    return (
+        Q(updated_at__gte=since)
+        | Q(loans__updated_at__gte=since)
+        | Q(credit_profile__updated_at__gte=since)
+    )
+
+def plan_customer_shards(shard_size, since=None):
+    """Split the customer ID space into inclusive (min_id, max_id) ranges"""
+    customers = Customer.objects.all()
+    if since is not None:
+        customers = customers.filter(changed_customers_filter(since))
+    bounds = customers.aggregate(first=Min('customer_id'), last=Max('customer_id'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (start, min(start + shard_size - 1, bounds['last']))
+        for start in range(bounds['first'], bounds['last'] + 1, shard_size)
+    ]
+
+def rescore_shard(min_id, max_id, since=None, today=None):
+    """Score the customers in an ID range with one grouped loan aggregate and upsert the scores
+
+    Returns the number of customers scored.
+    """
+    today = today or date.today()
+    customers = Customer.objects.filter(customer_id__range=(min_id, max_id))
+    if since is not None:
+        customers = customers.filter(changed_customers_filter(since)).distinct()
+    approved_limits = dict(customers.values_list('customer_id', 'approved_limit'))
+    if not approved_limits:
+        return 0
+
+    expressions = credit_score_aggregates(today)
+    aggregates = {customer_id: {key: 0 for key in expressions} for customer_id in approved_limits}
+    rows = (
+        Loan.objects.filter(customer_id__gte=min_id, customer_id__lte=max_id)
+        .values('customer_id')
+        .annotate(**expressions)
+    )
+    for row in rows:
+        customer_id = row.pop('customer_id')
+        if customer_id in aggregates:
+            aggregates[customer_id] = {key: value or 0 for key, value in row.items()}
+
+    ruleset = current_ruleset()
+    scored_at = timezone.now()
+    scores = [
+        CustomerCreditScore(
+            customer_id=customer_id,
+            credit_score=ruleset.credit_score(aggregates[customer_id], approved_limit),
+            ruleset_version=ruleset.version,
+            scored_at=scored_at,
+        )
+        for customer_id, approved_limit in approved_limits.items()
+    ]
+    CustomerCreditScore.objects.bulk_create(
+        scores, update_conflicts=True, unique_fields=['customer'], update_fields=['credit_score', 'ruleset_version', 'scored_at']
+    )
+    return len(scores)
+
+def _init_pool_worker():
+    import django
+    django.setup()
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+def _rescore_shard_in_pool(shard, since, today):
+    try:
+        return rescore_shard(*shard, since=since, today=today)
+    finally:
+        connections.close_all()
+
+def run_rescoring(shards, backend='process', workers=None, since=None, today=None, progress=None):
+    """Score every shard on the chosen backend (serial, process or celery); returns customers scored
+
+    On the serial backend, progress is called with the running total after each shard.
+    """
+    today = today or date.today()
+    if backend == 'serial' or not shards:
+        scored = 0
+        for shard in shards:
+            scored += rescore_shard(*shard, since=since, today=today)
+            if progress is not None:
+                progress(scored)
+        return scored
+
+    if backend == 'celery':
+        from .tasks import rescore_customer_shard
+        since_value = since.isoformat() if since is not None else None
+        result = group(
+            rescore_customer_shard.s(min_id, max_id, since_value, today.isoformat()) for min_id, max_id in shards
+        ).apply_async()
+        return sum(result.get())
+
+    workers = min(workers or os.cpu_count() or 1, len(shards))
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker) as pool:
+        return sum(pool.map(_rescore_shard_in_pool, shards, [since] * len(shards), [today] * len(shards)))
+
+def rescore_portfolio(shard_size=5000, backend='process', workers=None, since=None, today=None):
+    """Rescore all customers, or those changed since a datetime; returns (customers scored, seconds)"""
+    started = time.monotonic()
+    shards = plan_customer_shards(shard_size, since)
+    scored = run_rescoring(shards, backend, workers, since, today)
+    return scored, time.monotonic() - started
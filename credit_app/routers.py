@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import random
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'credit_read_primary'
+
+class ReplicaReads:
+    """Replica chosen for one request's reads, until the request writes"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.pinned = False
+
+_replica_reads = ContextVar('credit_replica_reads', default=None)
+
+class ReadReplicaRouter:
+    """Send reads inside @reads_from_replica views to a READ_REPLICAS alias, everything else to the primary
+
+    Reads go back to the primary for the rest of the request once it writes or calls
+    use_primary(), and inside atomic blocks, so read-modify-write code sees its own
+    transaction. Replicas are never migrated; they copy the primary's schema.
+    """
+
+    def db_for_read(self, model, **hints):
+        reads = _replica_reads.get()
+        if reads is None or reads.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return reads.alias
+
+    def db_for_write(self, model, **hints):
+        use_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.READ_REPLICAS:
+            return False
+        return None
+
+def use_primary():
+    """Send the rest of the current request's reads to the primary"""
+    reads = _replica_reads.get()
+    if reads is not None:
+        reads.pinned = True
+
+@contextmanager
+def replica_reads(request):
+    """Route reads in the block to one replica, unless there are none or the client is pinned"""
+    if not settings.READ_REPLICAS or PIN_COOKIE in request.COOKIES:
+        yield
+        return
+    token = _replica_reads.set(ReplicaReads(random.choice(settings.READ_REPLICAS)))
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+def reads_from_replica(view):
+    """Serve a read-only view from a read replica; works on sync and async views
+
+    Querysets evaluated after the view returns (streamed responses) must be bound with
+    .using(queryset.db) inside it. Apply below @api_view.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with replica_reads(request):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+def pins_primary(view):
+    """Keep the client's reads on the primary for REPLICA_PIN_SECONDS after a successful write
+
+    Sets a cookie that @reads_from_replica honours, so a client reads its own writes
+    while the replicas catch up. Apply below @api_view.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if settings.READ_REPLICAS and settings.REPLICA_PIN_SECONDS > 0 and 200 <= response.status_code < 300:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+    return wrapper
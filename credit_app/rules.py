@@ -0,0 +1,225 @@
+"""Versioned approval rules compiled into lookup tables
+
+The credit score weights, the score bands with their interest rate floors and the
+EMI-to-salary ceiling are data: DEFAULT_RULES, or the JSON file named by
+settings.CREDIT_RULES_FILE. A definition is compiled once into a Ruleset, where counts
+index precomputed point tables and credit scores are bisected into bands. The file is
+re-read when its modification time changes, checked at most every
+CREDIT_RULES_RELOAD_SECONDS, so workers pick up a new ruleset without a restart.
+
+Band lists are ordered by their inclusive upper bound, "max"; the last band has none
+and catches everything above.
+"""
+from bisect import bisect_left
+from decimal import Decimal
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# The rules the scoring and approval functions used to hard-code
+DEFAULT_RULES = {
+    'version': 'default-1',
+    'score': {
+        'new_customer_score': 50,
+        'on_time_weight': 40,
+        'loan_count_points': [
+            {'max': 2, 'points': 20},
+            {'max': 5, 'points': 15},
+            {'max': 10, 'points': 10},
+            {'points': 5},
+        ],
+        'current_year_points': [
+            {'max': 2, 'points': 20},
+            {'max': 4, 'points': 15},
+            {'points': 10},
+        ],
+        # Bounds are fractions of the customer's approved limit
+        'volume_points': [
+            {'max': '0.5', 'points': 20},
+            {'max': '1', 'points': 15},
+            {'points': 5},
+        ],
+        'over_limit_score': 0,
+        'min_score': 0,
+        'max_score': 100,
+    },
+    'approval': {
+        'max_emi_to_salary': '0.5',
+        'bands': [
+            {'max': 10, 'approve': False},
+            {'max': 30, 'min_interest_rate': '16.0'},
+            {'max': 50, 'min_interest_rate': '12.0'},
+            {},
+        ],
+    },
+}
+
+def to_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+def band_bounds(bands, name, convert):
+    """Return the converted upper bounds of a band list, checking they ascend and only the last is open"""
+    if not bands:
+        raise ValueError(f'{name} needs at least one band')
+    bounds = []
+    for index, band in enumerate(bands):
+        last = index == len(bands) - 1
+        if ('max' in band) == last:
+            raise ValueError(f'{name}: every band but the last needs a "max", and the last must not have one')
+        if not last:
+            bound = convert(band['max'])
+            if bounds and bound <= bounds[-1]:
+                raise ValueError(f'{name}: band bounds must ascend')
+            bounds.append(bound)
+    return bounds
+
+def count_table(bands, name):
+    """Compile count bands into (points per count up to the last bound, points above it)"""
+    bounds = band_bounds(bands, name, int)
+    if bounds[0] < 0:
+        raise ValueError(f'{name}: count bounds cannot be negative')
+    table = tuple(bands[bisect_left(bounds, count)]['points'] for count in range(bounds[-1] + 1))
+    return table, bands[-1]['points']
+
+class Ruleset:
+    """A compiled rule definition; build one with compile_rules"""
+
+    def __init__(self, definition):
+        self.definition = definition
+        self.version = str(definition['version'])
+        score = definition['score']
+        approval = definition['approval']
+
+        self.new_customer_score = score['new_customer_score']
+        self.on_time_weight = score['on_time_weight']
+        self.loan_count_table, self.loan_count_tail = count_table(score['loan_count_points'], 'loan_count_points')
+        self.loan_count_last = len(self.loan_count_table) - 1
+        self.current_year_table, self.current_year_tail = count_table(score['current_year_points'], 'current_year_points')
+        self.current_year_last = len(self.current_year_table) - 1
+        volume_bounds = band_bounds(score['volume_points'], 'volume_points', to_decimal)
+        self.volume_bands = tuple(
+            (fraction, band['points']) for fraction, band in zip(volume_bounds, score['volume_points'])
+        )
+        self.volume_tail = score['volume_points'][-1]['points']
+        self.over_limit_score = score['over_limit_score']
+        self.min_score = score['min_score']
+        self.max_score = score['max_score']
+
+        self.max_emi_to_salary = to_decimal(approval['max_emi_to_salary'])
+        self.score_bounds = tuple(band_bounds(approval['bands'], 'approval bands', float))
+        self.approves = tuple(band.get('approve', True) for band in approval['bands'])
+        self.rate_floors = tuple(
+            to_decimal(band['min_interest_rate']) if band.get('min_interest_rate') is not None else None
+            for band in approval['bands']
+        )
+
+    def __repr__(self):
+        return f'<Ruleset {self.version}>'
+
+    def credit_score(self, aggregates, approved_limit):
+        """Compute the credit score from pre-aggregated loan history"""
+        loan_count = aggregates['loan_count']
+        if not loan_count:
+            return self.new_customer_score
+
+        total_emis = aggregates['total_tenure']
+        on_time_ratio = aggregates['total_emis_paid_on_time'] / total_emis if total_emis > 0 else 0
+        current_year_loans = aggregates['current_year_loan_count']
+        total_loan_amount = aggregates['total_loan_amount']
+        volume_score = self.volume_tail
+        for fraction, points in self.volume_bands:
+            if total_loan_amount <= approved_limit * fraction:
+                volume_score = points
+                break
+
+        credit_score = (
+            on_time_ratio * self.on_time_weight
+            + (self.loan_count_table[loan_count] if loan_count <= self.loan_count_last else self.loan_count_tail)
+            + (self.current_year_table[current_year_loans] if current_year_loans <= self.current_year_last else self.current_year_tail)
+            + volume_score
+        )
+        if aggregates['active_loan_amount'] > approved_limit:
+            return self.over_limit_score
+        return min(self.max_score, max(self.min_score, credit_score))
+
+    def corrected_interest_rate(self, credit_score, requested_rate):
+        """Raise the requested rate to the floor of the score's band"""
+        floor = self.rate_floors[bisect_left(self.score_bounds, credit_score)]
+        if floor is None or requested_rate >= floor:
+            return requested_rate
+        return floor
+
+    def approves_loan(self, credit_score, corrected_rate, total_emis_after_loan, monthly_salary):
+        """Apply the score band and the EMI-to-salary ceiling"""
+        band = bisect_left(self.score_bounds, credit_score)
+        if not self.approves[band]:
+            return False
+        floor = self.rate_floors[band]
+        if floor is not None and corrected_rate < floor:
+            return False
+        return total_emis_after_loan <= monthly_salary * self.max_emi_to_salary
+
+def compile_rules(definition):
+    """Validate a rule definition and compile it, raising ValueError when it is malformed"""
+    try:
+        return Ruleset(definition)
+    except (KeyError, TypeError, ArithmeticError) as error:
+        raise ValueError(f'Invalid rule definition: {error!r}') from error
+
+def load_rules_file(path):
+    """Read and compile a JSON rule definition"""
+    with open(path, encoding='utf-8') as rules_file:
+        return compile_rules(json.load(rules_file))
+
+_ruleset = None
+_rules_mtime = None
+_next_check = 0.0
+_ruleset_lock = threading.Lock()
+
+def current_ruleset():
+    """Return the active Ruleset, re-reading CREDIT_RULES_FILE if it changed since the last check"""
+    if _ruleset is not None and time.monotonic() < _next_check:
+        return _ruleset
+    return reload_ruleset()
+
+def reload_ruleset(force=False):
+    """Check CREDIT_RULES_FILE now and recompile it if it changed (or always, with force)
+
+    A file that fails to load is logged and the previous ruleset kept, so a bad edit
+    cannot take running workers down; it is an error only when there is nothing to keep.
+    """
+    global _ruleset, _rules_mtime, _next_check
+    with _ruleset_lock:
+        path = settings.CREDIT_RULES_FILE
+        if not path:
+            if _ruleset is None or _rules_mtime is not None or force:
+                _ruleset = compile_rules(DEFAULT_RULES)
+                _rules_mtime = None
+        else:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if force or _ruleset is None or mtime != _rules_mtime:
+                    ruleset = load_rules_file(path)
+                    if _ruleset is not None and ruleset.version != _ruleset.version:
+                        logger.info('Loaded ruleset %s from %s, replacing %s', ruleset.version, path, _ruleset.version)
+                    _ruleset, _rules_mtime = ruleset, mtime
+            except (OSError, ValueError) as error:
+                if _ruleset is None:
+                    raise ImproperlyConfigured(f'Cannot load CREDIT_RULES_FILE {path}: {error}') from error
+                logger.error('Keeping ruleset %s, cannot load %s: %s', _ruleset.version, path, error)
+        _next_check = time.monotonic() + settings.CREDIT_RULES_RELOAD_SECONDS
+        return _ruleset
+
+@receiver(setting_changed)
+def reset_ruleset(setting, **kwargs):
+    global _ruleset, _rules_mtime
+    if setting in ('CREDIT_RULES_FILE', 'CREDIT_RULES_RELOAD_SECONDS'):
+        _ruleset = _rules_mtime = None
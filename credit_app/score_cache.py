@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from datetime import date
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+class BaseScoreCache:
+    """Per-customer cache of the inputs to an eligibility decision
+
+    Entries are dicts holding credit_score, the ruleset_version it was scored under,
+    active_monthly_repayment, monthly_salary and valid_through, the last date the score stays correct without any loan changing (the
+    last day of the earliest-ending active loan, or the end of the current year). Hit and
+    miss counters are kept per process.
+    """
+
+    def __init__(self, ttl=300, max_size=10000, **options):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._counter_lock = threading.Lock()
+
+    def get(self, customer_id, today=None, ruleset_version=None):
+        entry = self._get(customer_id)
+        if entry is not None and (
+            entry['valid_through'] < (today or date.today())
+            or (ruleset_version is not None and entry.get('ruleset_version') != ruleset_version)
+        ):
+            entry = None
+        with self._counter_lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, customer_id, entry):
+        self._set(customer_id, entry)
+
+    def invalidate(self, customer_id):
+        self.invalidate_many([customer_id])
+
+    def invalidate_many(self, customer_ids):
+        customer_ids = list(customer_ids)
+        if customer_ids:
+            self._delete_many(customer_ids)
+            with self._counter_lock:
+                self.invalidations += len(customer_ids)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        with self._counter_lock:
+            self.hits = self.misses = self.invalidations = 0
+
+class LocalScoreCache(BaseScoreCache):
+    """In-process LRU cache with TTL expiry"""
+
+    def __init__(self, ttl=300, max_size=10000, **options):
+        super().__init__(ttl, max_size, **options)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, customer_id):
+        with self._lock:
+            item = self._entries.get(customer_id)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at < time.monotonic():
+                del self._entries[customer_id]
+                return None
+            self._entries.move_to_end(customer_id)
+            return entry
+
+    def _set(self, customer_id, entry):
+        with self._lock:
+            self._entries[customer_id] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(customer_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _delete_many(self, customer_ids):
+        with self._lock:
+            for customer_id in customer_ids:
+                self._entries.pop(customer_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        stats = super().stats()
+        stats['size'] = len(self._entries)
+        return stats
+
+class DjangoScoreCache(BaseScoreCache):
+    """Cache backed by a Django cache alias (Redis in production, locmem in tests)
+
+    Size-bounded eviction is left to the backend (MAX_ENTRIES for locmem, maxmemory
+    policy for Redis). The alias should be dedicated to scores because clear() flushes it.
+    """
+
+    key_prefix = 'credit_score'
+
+    def __init__(self, ttl=300, max_size=10000, alias='default', **options):
+        super().__init__(ttl, max_size, **options)
+        self.cache = caches[alias]
+
+    def key(self, customer_id):
+        return f'{self.key_prefix}:{customer_id}'
+
+    def _get(self, customer_id):
+        return self.cache.get(self.key(customer_id))
+
+    def _set(self, customer_id, entry):
+        self.cache.set(self.key(customer_id), entry, timeout=self.ttl)
+
+    def _delete_many(self, customer_ids):
+        self.cache.delete_many([self.key(customer_id) for customer_id in customer_ids])
+
+    def clear(self):
+        self.cache.clear()
+
+_score_cache = None
+_score_cache_lock = threading.Lock()
+
+def get_score_cache():
+    """Return the process-wide score cache configured by settings.CREDIT_SCORE_CACHE"""
+    global _score_cache
+    if _score_cache is None:
+        with _score_cache_lock:
+            if _score_cache is None:
+                config = dict(settings.CREDIT_SCORE_CACHE)
+                backend = import_string(config.pop('BACKEND'))
+                _score_cache = backend(**{key.lower(): value for key, value in config.items()})
+    return _score_cache
+
+@receiver(setting_changed)
+def reset_score_cache(setting, **kwargs):
+    global _score_cache
+    if setting in ('CREDIT_SCORE_CACHE', 'CACHES'):
+        _score_cache = None
+
+def invalidate_credit_scores(customer_ids):
+    """Drop cached scores now, and again once the current transaction commits
+
+    The second pass evicts entries re-read from the database by concurrent requests
+    before the write became visible. Both passes count towards the invalidations stat.
+    """
+    customer_ids = list(customer_ids)
+    score_cache = get_score_cache()
+    score_cache.invalidate_many(customer_ids)
+    transaction.on_commit(lambda: score_cache.invalidate_many(customer_ids))
@@ -1,5 +1,21 @@
+import json
 from rest_framework import serializers
-from .models import Customer, Loan
+from .metrics import request_phase
+from .jobs import job_data_file
+from .models import Customer, Job, Loan
+from .portfolio import rate_band_labels
+from .utils import calculate_approved_limit
+
+class TimedDataMixin:
+    """Count the time spent building .data as serializer time in request metrics"""
+
+    @property
+    def data(self):
+        with request_phase('serialize'):
+            return super().data
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
 
 class CustomerRegistrationSerializer(serializers.ModelSerializer):
     monthly_income = serializers.DecimalField(max_digits=12, decimal_places=2, source='monthly_salary')
@@ -10,7 +26,7 @@ class CustomerRegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         monthly_salary = validated_data['monthly_salary']
-        approved_limit = round(36 * monthly_salary / 100000) * 100000 
+        approved_limit = calculate_approved_limit(monthly_salary)
         
         customer = Customer.objects.create(
             first_name=validated_data['first_name'],
@@ -22,7 +38,13 @@ class CustomerRegistrationSerializer(serializers.ModelSerializer):
         )
         return customer
 
-class CustomerRegistrationResponseSerializer(serializers.ModelSerializer):
+class CustomerRegistrationBatchItemSerializer(CustomerRegistrationSerializer):
+    """One row of a batch registration; phone numbers are checked for the whole batch at once"""
+
+    class Meta(CustomerRegistrationSerializer.Meta):
+        extra_kwargs = {'phone_number': {'validators': []}}
+
+class CustomerRegistrationResponseSerializer(TimedDataMixin, serializers.ModelSerializer):
     monthly_income = serializers.DecimalField(max_digits=12, decimal_places=2, source='monthly_salary')
     name = serializers.CharField(read_only=True)
     
@@ -36,13 +58,17 @@ class LoanEligibilitySerializer(serializers.Serializer):
     interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
     tenure = serializers.IntegerField(min_value=1, max_value=600)
 
-class LoanEligibilityResponseSerializer(serializers.Serializer):
+class LoanEligibilityResponseSerializer(TimedDataMixin, serializers.Serializer):
     customer_id = serializers.IntegerField()
     approval = serializers.BooleanField()
     interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
     corrected_interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
     tenure = serializers.IntegerField()
     monthly_installment = serializers.DecimalField(max_digits=12, decimal_places=2)
+    ruleset_version = serializers.CharField(allow_null=True)
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
 
 class LoanCreationSerializer(serializers.Serializer):
     customer_id = serializers.IntegerField()
@@ -50,7 +76,7 @@ class LoanCreationSerializer(serializers.Serializer):
     interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
     tenure = serializers.IntegerField(min_value=1, max_value=600)
 
-class LoanCreationResponseSerializer(serializers.Serializer):
+class LoanCreationResponseSerializer(TimedDataMixin, serializers.Serializer):
     loan_id = serializers.IntegerField(allow_null=True)
     customer_id = serializers.IntegerField()
     loan_approved = serializers.BooleanField()
@@ -64,16 +90,116 @@ class CustomerDetailSerializer(serializers.ModelSerializer):
         model = Customer
         fields = ['id', 'first_name', 'last_name', 'phone_number', 'age']
 
-class LoanDetailSerializer(serializers.ModelSerializer):
+class LoanDetailSerializer(TimedDataMixin, serializers.ModelSerializer):
     customer = CustomerDetailSerializer(read_only=True)
     
     class Meta:
         model = Loan
         fields = ['loan_id', 'customer', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure']
 
-class LoanListSerializer(serializers.ModelSerializer):
+class LoanListSerializer(TimedDataMixin, serializers.ModelSerializer):
     monthly_installment = serializers.DecimalField(max_digits=12, decimal_places=2, source='monthly_repayment')
+    repayments_left = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Loan
         fields = ['loan_id', 'loan_amount', 'interest_rate', 'monthly_installment', 'repayments_left']
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        """Accept fields=[...] to render only a subset of the fields"""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class PortfolioSummaryQuerySerializer(serializers.Serializer):
+    rate_band = serializers.CharField(required=False)
+    start_year_min = serializers.IntegerField(required=False)
+    start_year_max = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(choices=['all', 'active', 'ended'], default='all')
+
+    def validate_rate_band(self, value):
+        """Accept a comma-separated list of band labels"""
+        bands = [band.strip() for band in value.split(',') if band.strip()]
+        unknown = sorted(set(bands) - set(rate_band_labels()))
+        if unknown:
+            raise serializers.ValidationError(f"Unknown rate bands: {', '.join(unknown)}")
+        return bands
+
+class PortfolioLoanTotalsSerializer(serializers.Serializer):
+    loan_count = serializers.IntegerField()
+    loan_amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+    active_loan_amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+    active_monthly_repayment = serializers.DecimalField(max_digits=18, decimal_places=2)
+    on_time_ratio = serializers.FloatField(allow_null=True)
+
+class PortfolioRateBandSerializer(serializers.Serializer):
+    rate_band = serializers.CharField()
+    loan_count = serializers.IntegerField()
+    loan_amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+    active_loan_amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+    active_monthly_repayment = serializers.DecimalField(max_digits=18, decimal_places=2)
+
+class PortfolioStartYearSerializer(serializers.Serializer):
+    start_year = serializers.IntegerField()
+    loan_count = serializers.IntegerField()
+    loan_amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+    on_time_ratio = serializers.FloatField(allow_null=True)
+
+class PortfolioCustomerTotalsSerializer(serializers.Serializer):
+    customer_count = serializers.IntegerField()
+    over_limit_customers = serializers.IntegerField()
+    approved_limit = serializers.DecimalField(max_digits=18, decimal_places=2)
+    current_debt = serializers.DecimalField(max_digits=18, decimal_places=2)
+
+class PortfolioSummarySerializer(TimedDataMixin, serializers.Serializer):
+    loans = PortfolioLoanTotalsSerializer()
+    by_rate_band = PortfolioRateBandSerializer(many=True)
+    by_start_year = PortfolioStartYearSerializer(many=True)
+    customers = PortfolioCustomerTotalsSerializer()
+    refreshed_at = serializers.DateTimeField(allow_null=True)
+    stale_shards = serializers.IntegerField()
+
+class IngestJobSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['customers', 'loans', 'all'], default='all')
+    # A file name in JOB_DATA_DIR; defaults to the bundled workbook
+    file = serializers.CharField(required=False)
+    chunk_size = serializers.IntegerField(min_value=1, required=False)
+    force = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if 'file' in data:
+            if data['type'] == 'all':
+                raise serializers.ValidationError({'file': 'Give a file only with type customers or loans.'})
+            try:
+                job_data_file(data['file'])
+            except ValueError as error:
+                raise serializers.ValidationError({'file': str(error)})
+        return data
+
+class RescoreJobSerializer(serializers.Serializer):
+    # Only rescore customers whose data changed at or after this time
+    since = serializers.DateTimeField(required=False)
+    shard_size = serializers.IntegerField(min_value=1, required=False)
+
+class JobSerializer(TimedDataMixin, serializers.ModelSerializer):
+    throughput = serializers.FloatField(read_only=True, allow_null=True)
+    eta_seconds = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'params', 'rows_total', 'rows_processed', 'throughput', 'eta_seconds',
+            'error_count', 'errors', 'result', 'created_at', 'started_at', 'finished_at', 'updated_at'
+        ]
+
+def stream_ndjson(serializer, rows):
+    """Yield one JSON document per line for each row, rendered by serializer"""
+    for row in rows:
+        yield json.dumps(serializer.to_representation(row), separators=(',', ':')) + '\n'
+
+async def astream_ndjson(serializer, rows):
+    """Async version of stream_ndjson for async row iterators"""
+    async for row in rows:
+        yield json.dumps(serializer.to_representation(row), separators=(',', ':')) + '\n'
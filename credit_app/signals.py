@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Customer, Loan, OutboxEvent
+from .outbox import record_events
+from .portfolio import mark_portfolio_stale
+from .profiles import rebuild_credit_profiles, record_new_loans
+from .score_cache import invalidate_credit_scores
+
+@receiver(post_save, sender=Loan)
+def loan_saved(sender, instance, created, **kwargs):
+    record_events(OutboxEvent.TOPIC_LOAN, OutboxEvent.TYPE_CREATED if created else OutboxEvent.TYPE_UPDATED, [instance])
+    mark_portfolio_stale([instance.customer_id])
+    if created:
+        record_new_loans([instance])
+    else:
+        # Edits (admin, repayments) change totals in ways a delta can't express
+        transaction.on_commit(lambda: rebuild_credit_profiles([instance.customer_id]))
+
+@receiver(post_delete, sender=Loan)
+def loan_deleted(sender, instance, **kwargs):
+    record_events(OutboxEvent.TOPIC_LOAN, OutboxEvent.TYPE_DELETED, [instance])
+    mark_portfolio_stale([instance.customer_id])
+    transaction.on_commit(lambda: rebuild_credit_profiles([instance.customer_id]))
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def customer_changed(sender, instance, signal, created=False, **kwargs):
+    if signal is post_delete:
+        event_type = OutboxEvent.TYPE_DELETED
+    else:
+        event_type = OutboxEvent.TYPE_CREATED if created else OutboxEvent.TYPE_UPDATED
+    record_events(OutboxEvent.TOPIC_CUSTOMER, event_type, [instance])
+    # Salary and approved limit are part of every cached decision
+    invalidate_credit_scores([instance.customer_id])
+    mark_portfolio_stale([instance.customer_id])
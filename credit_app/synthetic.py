@@ -0,0 +1,287 @@
+from datetime import date
+import csv
+import gzip
+import io
+import os
+import numpy as np
+import openpyxl
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .amortization import monthly_installments
+from .ingestion import reset_customer_sequence
+from .models import Customer, Loan
+
+# Rows generated per step. Part of the seed derivation, so changing it changes the data
+BLOCK_SIZE = 100000
+XLSX_MAX_ROWS = 1048575
+
+# Same headers as the data/*.xlsx workbooks, so generated files can be ingested as-is
+CUSTOMER_HEADERS = [
+    'Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number', 'Monthly Salary', 'Approved Limit', 'Current Debt',
+]
+LOAN_HEADERS = [
+    'Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate', 'Monthly payment', 'EMIs paid on Time',
+    'Date of Approval', 'End Date',
+]
+
+FIRST_NAMES = np.array([
+    'Aaron', 'Aditi', 'Alejandro', 'Amara', 'Arjun', 'Beatriz', 'Carlos', 'Chen', 'Daniel', 'Deepa', 'Elena',
+    'Farah', 'Gabriel', 'Hana', 'Ibrahim', 'Isha', 'Jamal', 'Julia', 'Kavya', 'Leon', 'Lucia', 'Mateo', 'Meera',
+    'Nikhil', 'Nora', 'Omar', 'Priya', 'Rahul', 'Rosa', 'Sanjay', 'Sofia', 'Tariq', 'Uma', 'Victor', 'Yara', 'Zoe',
+])
+LAST_NAMES = np.array([
+    'Ahmed', 'Banerjee', 'Castillo', 'Das', 'Estrada', 'Fernandes', 'Garcia', 'Gupta', 'Hernandez', 'Iyer',
+    'Joshi', 'Kapoor', 'Khan', 'Lopez', 'Mehta', 'Nair', 'Ortiz', 'Patel', 'Quintero', 'Rao', 'Reddy', 'Sanchez',
+    'Shah', 'Singh', 'Torres', 'Verma', 'Wong', 'Yadav',
+])
+TENURES = np.array([6, 12, 18, 24, 36, 48, 60, 72, 84, 96, 108, 120, 180, 240])
+TENURE_WEIGHTS = np.array([4, 10, 6, 12, 14, 10, 12, 6, 5, 4, 3, 6, 4, 4], dtype=np.float64)
+HISTORY_DAYS = 15 * 365
+
+def block_rng(seed, kind, block_index):
+    """Independent, reproducible generator for one block of rows"""
+    return np.random.default_rng([seed, kind, block_index])
+
+def iter_blocks(count):
+    """Yield (block index, first row offset, rows) covering count rows"""
+    for block_index, offset in enumerate(range(0, count, BLOCK_SIZE)):
+        yield block_index, offset, min(BLOCK_SIZE, count - offset)
+
+def customer_block(seed, block_index, offset, size, first_customer_id, first_phone):
+    """Arrays for one block of customers; money columns are whole rupees"""
+    rng = block_rng(seed, 0, block_index)
+    # Log-normal salaries around a 45k median, rounded to the nearest thousand
+    monthly_salary = np.clip(np.round(rng.lognormal(np.log(45000), 0.6, size) / 1000) * 1000, 10000, 1000000).astype(np.int64)
+    index = np.arange(offset, offset + size, dtype=np.int64)
+    return {
+        'customer_id': first_customer_id + index,
+        'first_name': FIRST_NAMES[rng.integers(0, len(FIRST_NAMES), size)],
+        'last_name': LAST_NAMES[rng.integers(0, len(LAST_NAMES), size)],
+        'age': rng.integers(21, 71, size),
+        'phone_number': first_phone + index,
+        'monthly_salary': monthly_salary,
+        # Same rule as customer registration: 36 x salary, rounded to the nearest lakh
+        'approved_limit': np.round(36 * monthly_salary / 100000).astype(np.int64) * 100000,
+        'current_debt': np.zeros(size, dtype=np.int64),
+    }
+
+def loan_block(seed, block_index, offset, size, first_customer_id, customers, first_loan_id, today):
+    """Arrays for one block of loans spread over the customer ID range; money columns are cents"""
+    rng = block_rng(seed, 1, block_index)
+    tenure = rng.choice(TENURES, size, p=TENURE_WEIGHTS / TENURE_WEIGHTS.sum())
+    rate_bps = rng.integers(600, 2001, size)
+    loan_amount = np.clip(np.round(rng.lognormal(np.log(300000), 0.9, size) / 1000) * 1000, 10000, 10000000)
+    # EMIs from the same formula as calculate_monthly_installment, rounded to the cent
+    emi_cents = np.round(monthly_installments(loan_amount, rate_bps / 100, tenure) * 100).astype(np.int64)
+
+    start_date = np.datetime64(today, 'D') - rng.integers(0, HISTORY_DAYS, size).astype('timedelta64[D]')
+    end_date = start_date + (30 * tenure).astype('timedelta64[D]')
+    # Payments due so far, with a per-loan probability of paying late
+    due = np.minimum((np.datetime64(today, 'D') - start_date).astype(np.int64) // 30, tenure)
+    paid_on_time = due - rng.binomial(due, rng.beta(1, 12, size))
+    return {
+        'customer_id': first_customer_id + rng.integers(0, customers, size),
+        'loan_id': first_loan_id + np.arange(offset, offset + size, dtype=np.int64),
+        'loan_amount': loan_amount.astype(np.int64) * 100,
+        'tenure': tenure,
+        'interest_rate': rate_bps,
+        'monthly_repayment': emi_cents,
+        'emis_paid_on_time': paid_on_time,
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+
+def money_strings(cents):
+    """Format integer cents as 'rupees.paise' strings"""
+    cents = np.asarray(cents, dtype=np.int64)
+    return np.strings.add(np.strings.add((cents // 100).astype(str), '.'), np.strings.zfill((cents % 100).astype(str), 2))
+
+def customer_columns(block):
+    """Column strings for a customer block, in CUSTOMER_HEADERS order"""
+    return [
+        block['customer_id'].astype(str),
+        block['first_name'],
+        block['last_name'],
+        block['age'].astype(str),
+        block['phone_number'].astype(str),
+        block['monthly_salary'].astype(str),
+        block['approved_limit'].astype(str),
+        block['current_debt'].astype(str),
+    ]
+
+def loan_columns(block):
+    """Column strings for a loan block, in LOAN_HEADERS order"""
+    return [
+        block['customer_id'].astype(str),
+        block['loan_id'].astype(str),
+        money_strings(block['loan_amount']),
+        block['tenure'].astype(str),
+        money_strings(block['interest_rate']),
+        money_strings(block['monthly_repayment']),
+        block['emis_paid_on_time'].astype(str),
+        block['start_date'].astype(str),
+        block['end_date'].astype(str),
+    ]
+
+def xlsx_value(value):
+    """Store numbers and dates as typed cells, like the source workbooks"""
+    if value.isdigit():
+        return int(value)
+    if value.replace('.', '', 1).isdigit():
+        return float(value)
+    if len(value) == 10 and value[4] == '-' and value[7] == '-':
+        return date.fromisoformat(value)
+    return value
+
+def csv_text(columns):
+    return ''.join(','.join(row) + '\n' for row in zip(*(column.tolist() for column in columns)))
+
+class CsvOutput:
+    def __init__(self, path, headers, compress=False):
+        self.path = path + ('.gz' if compress else '')
+        self.file = gzip.open(self.path, 'wt', newline='') if compress else open(self.path, 'w', newline='')
+        csv.writer(self.file).writerow(headers)
+
+    def write(self, columns):
+        self.file.write(csv_text(columns))
+
+    def close(self):
+        self.file.close()
+
+class XlsxOutput:
+    def __init__(self, path, headers):
+        self.path = path
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(headers)
+
+    def write(self, columns):
+        for row in zip(*(column.tolist() for column in columns)):
+            self.sheet.append([xlsx_value(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+class ParquetOutput:
+    def __init__(self, path, headers):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('Parquet output needs pyarrow (pip install pyarrow)')
+        self.pyarrow = pyarrow
+        self.path = path
+        self.headers = headers
+        self.writer = None
+
+    def write(self, columns):
+        table = self.pyarrow.table(dict(zip(self.headers, columns)))
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class DatabaseOutput:
+    """Append blocks to a table with COPY on PostgreSQL, or bulk_create elsewhere"""
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+
+    def write(self, columns):
+        now = timezone.now()
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                table = self.model._meta.db_table
+                stamp = np.full(len(columns[0]), now.isoformat())
+                buffer = io.StringIO(csv_text(list(columns) + [stamp, stamp]))
+                column_list = ', '.join(self.fields + ['created_at', 'updated_at'])
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(f'COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+            else:
+                rows = zip(*(column.tolist() for column in columns))
+                self.model.objects.bulk_create(
+                    (self.model(**dict(zip(self.fields, row))) for row in rows), batch_size=5000
+                )
+
+    def close(self):
+        pass
+
+CUSTOMER_FIELDS = [
+    'customer_id', 'first_name', 'last_name', 'age', 'phone_number', 'monthly_salary', 'approved_limit', 'current_debt',
+]
+LOAN_FIELDS = [
+    'customer_id', 'loan_amount', 'tenure', 'interest_rate', 'monthly_repayment', 'emis_paid_on_time',
+    'start_date', 'end_date',
+]
+
+def open_outputs(output, directory=None, compress=False):
+    """Return (customer output, loan output) for db, csv, xlsx or parquet"""
+    if output == 'db':
+        return DatabaseOutput(Customer, CUSTOMER_FIELDS), DatabaseOutput(Loan, LOAN_FIELDS)
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f'{name}.{output}') for name in ('customer_data', 'loan_data')]
+    if output == 'csv':
+        return CsvOutput(paths[0], CUSTOMER_HEADERS, compress), CsvOutput(paths[1], LOAN_HEADERS, compress)
+    if output == 'xlsx':
+        return XlsxOutput(paths[0], CUSTOMER_HEADERS), XlsxOutput(paths[1], LOAN_HEADERS)
+    if output == 'parquet':
+        return ParquetOutput(paths[0], CUSTOMER_HEADERS), ParquetOutput(paths[1], LOAN_HEADERS)
+    raise ValueError(f'Unknown output: {output}')
+
+def generate_synthetic_data(customers, loans, seed=0, output='db', directory=None, compress=False, today=None,
+                            first_customer_id=None, first_phone=None, progress=None):
+    """Stream customers then loans to the chosen output, BLOCK_SIZE rows at a time
+
+    The same seed, counts and start IDs always produce the same rows. Database output
+    continues after the existing customer IDs and phone numbers; file output starts at
+    customer 1 and phone 7000000001 unless given. Returns a dict of the ID ranges and
+    output paths.
+    """
+    today = today or date.today()
+    if output == 'xlsx' and max(customers, loans) > XLSX_MAX_ROWS:
+        raise ValueError(f'xlsx sheets hold at most {XLSX_MAX_ROWS} rows; use csv or parquet')
+    if output == 'db':
+        first_customer_id = (Customer.objects.aggregate(Max('customer_id'))['customer_id__max'] or 0) + 1
+        first_phone = (Customer.objects.aggregate(Max('phone_number'))['phone_number__max'] or 7000000000) + 1
+        first_loan_id = None
+    else:
+        first_customer_id = first_customer_id or 1
+        first_phone = first_phone or 7000000001
+        first_loan_id = 1
+
+    customer_output, loan_output = open_outputs(output, directory, compress)
+    try:
+        for block_index, offset, size in iter_blocks(customers):
+            block = customer_block(seed, block_index, offset, size, first_customer_id, first_phone)
+            customer_output.write(customer_columns(block))
+            if progress:
+                progress('customers', offset + size, customers)
+        if output == 'db':
+            reset_customer_sequence()
+
+        loan_fields = LOAN_FIELDS if output == 'db' else None
+        for block_index, offset, size in iter_blocks(loans if customers else 0):
+            block = loan_block(seed, block_index, offset, size, first_customer_id, customers, first_loan_id or 1, today)
+            columns = loan_columns(block)
+            if loan_fields:
+                # The database assigns loan IDs
+                columns = columns[:1] + columns[2:]
+            loan_output.write(columns)
+            if progress:
+                progress('loans', offset + size, loans)
+    finally:
+        customer_output.close()
+        loan_output.close()
+
+    return {
+        'customers': customers,
+        'loans': loans if customers else 0,
+        'first_customer_id': first_customer_id,
+        'last_customer_id': first_customer_id + customers - 1,
+        'paths': [getattr(customer_output, 'path', None), getattr(loan_output, 'path', None)],
+    }
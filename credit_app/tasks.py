@@ -1,110 +1,135 @@
-from celery import shared_task
+from celery import chord, shared_task
 from django.conf import settings
-import openpyxl
+from datetime import date, datetime, timedelta
 import os
-from .models import Customer, Loan
-from datetime import datetime
-from decimal import Decimal
+import time
+from .bulk_load import copy_load_customers, copy_load_loans
+from .idempotency import purge_idempotency_keys
+from .jobs import run_job
+from .outbox import dispatch_outbox, purge_published_events
+from .portfolio import refresh_portfolio_shards
+from .rescoring import rescore_shard
+from .ingestion import (
+    DATA_FILES, combine_range_results, count_sheet_rows, format_skipped_file, ingest_customers, ingest_file,
+    ingest_loans, plan_row_ranges, reset_customer_sequence
+)
+
+def data_file_path(label):
+    return os.path.join(settings.BASE_DIR, 'data', DATA_FILES[label])
 
 @shared_task
-def ingest_customer_data():
-    """Ingest customer data from Excel file"""
-    file_path = os.path.join(settings.BASE_DIR, 'data', 'customer_data.xlsx')
+def ingest_customer_data(chunk_size=None, file_path=None, force=False):
+    """Ingest new and changed customers from a data file (the bundled workbook by default)"""
+    file_path = file_path or data_file_path('customers')
     
     if not os.path.exists(file_path):
         return f"Customer data file not found at {file_path}"
     
     try:
-        workbook = openpyxl.load_workbook(file_path)
-        sheet = workbook.active
-        
-        customers_created = 0
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            if row[0] is None: 
-                continue
-                
-            excel_customer_id, first_name, last_name, phone_number, monthly_salary, approved_limit, current_debt = row
-            
-            customer, created = Customer.objects.get_or_create(
-                phone_number=phone_number,
-                defaults={
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'monthly_salary': Decimal(str(monthly_salary)),
-                    'approved_limit': Decimal(str(approved_limit)),
-                    'current_debt': Decimal(str(current_debt or 0)),
-                    'age': 30 
-                }
-            )
-            
-            if created:
-                customers_created += 1
-        
-        from django.db import connection
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT setval(pg_get_serial_sequence('customers', 'customer_id'), COALESCE(MAX(customer_id), 1)) FROM customers;")
-        
-        return f"Successfully ingested {customers_created} customers"
+        stats, manifest = ingest_file('customers', file_path, chunk_size or settings.INGEST_CHUNK_SIZE, force)
+        if stats is None:
+            return format_skipped_file(manifest)
+        reset_customer_sequence()
+        return stats.summary()
         
     except Exception as e:
         return f"Error ingesting customer data: {str(e)}"
 
 @shared_task
-def ingest_loan_data():
-    """Ingest loan data from Excel file"""
-    file_path = os.path.join(settings.BASE_DIR, 'data', 'loan_data.xlsx')
+def ingest_loan_data(chunk_size=None, file_path=None, force=False):
+    """Ingest new and changed loans from a data file (the bundled workbook by default)"""
+    file_path = file_path or data_file_path('loans')
     
     if not os.path.exists(file_path):
         return f"Loan data file not found at {file_path}"
     
     try:
-        workbook = openpyxl.load_workbook(file_path)
-        sheet = workbook.active
-        
-        loans_created = 0
-        # Create a mapping of original customer IDs to new customer IDs
-        customer_mapping = {}
-        
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            if row[0] is None:  # Skip empty rows
-                continue
-                
-            excel_customer_id, loan_id, loan_amount, tenure, interest_rate, monthly_repayment, emis_paid_on_time, start_date, end_date = row
-            
-            try:
-                if excel_customer_id not in customer_mapping:
-                    customers = list(Customer.objects.all().order_by('customer_id'))
-                    if excel_customer_id <= len(customers):
-                        customer = customers[excel_customer_id - 1]  
-                        customer_mapping[excel_customer_id] = customer
-                    else:
-                        continue  
-                else:
-                    customer = customer_mapping[excel_customer_id]
-                
-                if isinstance(start_date, str):
-                    start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-                if isinstance(end_date, str):
-                    end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-                
-                loan = Loan.objects.create(
-                    customer=customer,
-                    loan_amount=Decimal(str(loan_amount)),
-                    tenure=tenure,
-                    interest_rate=Decimal(str(interest_rate)),
-                    monthly_repayment=Decimal(str(monthly_repayment)),
-                    emis_paid_on_time=emis_paid_on_time,
-                    start_date=start_date,
-                    end_date=end_date
-                )
-                
-                loans_created += 1
-                    
-            except Exception as e:
-                print(f"Error processing loan row: {e}")
-                continue 
-        
-        return f"Successfully ingested {loans_created} loans"
+        stats, manifest = ingest_file('loans', file_path, chunk_size or settings.INGEST_CHUNK_SIZE, force)
+        if stats is None:
+            return format_skipped_file(manifest)
+        return stats.summary()
         
     except Exception as e:
-        return f"Error ingesting loan data: {str(e)}"
\ No newline at end of file
+        return f"Error ingesting loan data: {str(e)}"
+
+@shared_task
+def copy_load_data(label, file_path=None, chunk_size=None):
+    """Load a customer or loan file (xlsx, CSV, gzipped CSV or Parquet) through a staging table"""
+    file_path = file_path or data_file_path(label)
+
+    if not os.path.exists(file_path):
+        return f"{label.capitalize()} data file not found at {file_path}"
+
+    try:
+        load = copy_load_customers if label == 'customers' else copy_load_loans
+        return load(file_path, chunk_size or settings.INGEST_CHUNK_SIZE).summary()
+
+    except Exception as e:
+        return f"Error loading {label} data: {str(e)}"
+
+@shared_task
+def ingest_row_range(label, file_path, min_row, max_row, chunk_size):
+    """Ingest one row range of a workbook as part of a parallel run"""
+    ingest = ingest_customers if label == 'customers' else ingest_loans
+    result = ingest(file_path, chunk_size, min_row, max_row).as_dict()
+    result.update(min_row=min_row, max_row=max_row)
+    for error in result['errors']:
+        error['range'] = f"{min_row}-{max_row}"
+    return result
+
+@shared_task
+def finish_parallel_ingestion(results, label, started_at):
+    """Chord callback: fix the customers sequence and total up the per-range results"""
+    if label == 'customers':
+        reset_customer_sequence()
+    return combine_range_results(label, results, started_at)
+
+def parallel_ingestion(label, rows_per_range=None, chunk_size=None, file_path=None):
+    """Build a chord ingesting one workbook as row ranges spread over the Celery workers"""
+    file_path = file_path or data_file_path(label)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{label.capitalize()} data file not found at {file_path}")
+
+    chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+    ranges = plan_row_ranges(count_sheet_rows(file_path), rows_per_range or settings.INGEST_RANGE_ROWS)
+    header = [ingest_row_range.si(label, file_path, min_row, max_row, chunk_size) for min_row, max_row in ranges]
+    return chord(header, finish_parallel_ingestion.s(label, time.time()))
+
+@shared_task
+def purge_expired_idempotency_keys():
+    """Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS"""
+    deleted = purge_idempotency_keys(timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS))
+    return f"Deleted {deleted} expired idempotency keys"
+
+@shared_task
+def rescore_customer_shard(min_id, max_id, since=None, today=None):
+    """Score one customer ID range as part of a parallel rescoring run"""
+    return rescore_shard(
+        min_id,
+        max_id,
+        since=datetime.fromisoformat(since) if since else None,
+        today=date.fromisoformat(today) if today else None,
+    )
+
+@shared_task
+def refresh_portfolio_rollups(full=False):
+    """Recompute stale portfolio rollup shards, or all of them with full=True"""
+    refreshed = refresh_portfolio_shards(full=full)
+    return f"Refreshed {refreshed} portfolio shards"
+
+@shared_task(bind=True)
+def run_background_job(self, job_id):
+    """Run a job queued through /api/jobs, reporting progress as PROGRESS task state"""
+    return run_job(job_id, task=self)
+
+@shared_task
+def dispatch_outbox_events():
+    """Publish the outbox events written since the last dispatch"""
+    published = dispatch_outbox()
+    return f"Published {published} outbox events"
+
+@shared_task
+def purge_published_outbox_events():
+    """Delete outbox events published more than OUTBOX_RETENTION_HOURS ago"""
+    deleted = purge_published_events(timedelta(hours=settings.OUTBOX_RETENTION_HOURS))
+    return f"Deleted {deleted} published outbox events"
@@ -1,9 +1,98 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractYear
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
-from decimal import Decimal
-from .models import Customer, Loan
-from .utils import calculate_credit_score, calculate_monthly_installment
+from rest_framework.renderers import JSONRenderer
+from decimal import Decimal, ROUND_HALF_UP
+from datetime import date, datetime, timedelta
+from io import StringIO
+import csv
+import gzip
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+import openpyxl
+from credit_system.celery import app as celery_app
+from . import loan_book, renderers
+from .amortization import loan_schedule_arrays, monthly_installments
+from .bulk_load import copy_load_customers, copy_load_loans
+from .fast_serializers import field_map
+from .ingestion import (
+    LOAN_COLUMNS, REQUIRED_LOAN_FIELDS, IngestionStats, ingest_customers, ingest_file, ingest_loans, iter_source_rows
+)
+from .loan_book import get_loan_book, loan_book_entry, loan_book_metric_lines, refresh_loan_book
+from .loadtest import DEFAULT_MIX, InProcessTarget, load_request_log, percentile, run_load_test, synthetic_requests
+from .metrics import registry as metrics_registry
+from .jobs import JobProgress
+from .models import (
+    Customer, CustomerCreditProfile, CustomerCreditScore, IdempotencyKey, IngestionManifest, Job, Loan, OutboxCheckpoint,
+    OutboxEvent, PortfolioShard
+)
+from .outbox import LocalEventSink, RedisStreamSink, consume_events, dispatch_outbox, purge_published_events
+from .portfolio import refresh_portfolio_shards, shard_start
+from .profiles import compute_credit_profiles, verify_credit_profiles
+from .rescoring import rescore_portfolio
+from .routers import PIN_COOKIE, ReadReplicaRouter, replica_reads
+from .rules import DEFAULT_RULES, compile_rules, current_ruleset
+from .score_cache import LocalScoreCache, get_score_cache
+from .serializers import LoanDetailSerializer, LoanListSerializer
+from .synthetic import generate_synthetic_data
+from .tasks import parallel_ingestion, purge_expired_idempotency_keys, refresh_portfolio_rollups
+from .utils import (
+    calculate_approved_limit, calculate_approved_limits, calculate_credit_score, calculate_credit_score_legacy,
+    calculate_monthly_installment, check_loan_eligibility,
+    get_corrected_interest_rate, get_corrected_interest_rate_legacy, is_loan_approved, is_loan_approved_legacy,
+    score_from_aggregates, score_from_aggregates_legacy
+)
+
+def make_customer(**fields):
+    """Create a customer, filling in the fields a test does not set"""
+    defaults = {
+        'first_name': 'Test', 'last_name': 'User', 'age': 30, 'phone_number': 9876543210,
+        'monthly_salary': 50000, 'approved_limit': 1800000,
+    }
+    return Customer.objects.create(**{**defaults, **fields})
+
+def make_history(rng, customer, num_loans):
+    """Create num_loans random loans, started over the last ten years, for customer"""
+    today = date.today()
+    for _ in range(num_loans):
+        tenure = rng.randint(1, 120)
+        start_date = today - timedelta(days=rng.randint(0, 3650))
+        Loan.objects.create(
+            customer=customer,
+            loan_amount=Decimal(rng.randrange(10000, 800000, 10000)),
+            tenure=tenure,
+            interest_rate=Decimal(rng.randint(500, 2000)) / 100,
+            monthly_repayment=Decimal(rng.randint(1000, 90000)),
+            emis_paid_on_time=rng.randint(0, tenure),
+            start_date=start_date,
+            end_date=start_date + timedelta(days=30 * tenure)
+        )
+
+def write_workbook(directory, name, header, rows):
+    """Save a workbook of a header row and rows in directory, returning its path"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    path = os.path.join(directory, name)
+    workbook.save(path)
+    return path
 
 class CustomerModelTest(TestCase):
     def test_customer_creation(self):
@@ -33,6 +122,1731 @@ class CreditScoreTest(TestCase):
         score = calculate_credit_score(self.customer)
         self.assertEqual(score, 50)
 
+class CreditScoreParityTest(TestCase):
+    def test_aggregate_score_matches_legacy_on_random_histories(self):
+        rng = random.Random(20250531)
+        for index in range(60):
+            customer = make_customer(first_name="Parity", last_name=str(index), phone_number=9000000000 + index,
+                                     monthly_salary=Decimal(rng.randrange(20000, 200000, 1000)),
+                                     approved_limit=Decimal(rng.randrange(100000, 5000000, 100000)))
+            make_history(rng, customer, rng.choice([0, 1, 2, 3, 5, 8, 12, 20]))
+            with self.subTest(customer=index):
+                self.assertEqual(calculate_credit_score(customer), calculate_credit_score_legacy(customer))
+
+    def test_aggregate_score_uses_single_query(self):
+        customer = make_customer()
+        make_history(random.Random(7), customer, 15)
+        with self.assertNumQueries(1):
+            calculate_credit_score(customer)
+
+class ExcelIngestionTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.customer_file = write_workbook(
+            self.tmpdir.name, 'customers.xlsx',
+            ['Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number', 'Monthly Salary', 'Approved Limit'],
+            [[index, 'First', f'Last{index}', 30 + index, 9000000000 + index, 50000, 1800000] for index in range(1, 8)]
+            + [[8, 'Dup', 'Phone', 40, 9000000001, 60000, 2200000], [9, 'Bad', 'Salary', 40, 9000000099, 'n/a', 100000]]
+        )
+        self.loan_file = write_workbook(
+            self.tmpdir.name, 'loans.xlsx',
+            ['Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate', 'Monthly payment',
+             'EMIs paid on Time', 'Date of Approval', 'End Date'],
+            [[(index % 7) + 1, 1000 + index, 100000, 12, 8.5, 8722, 10, datetime(2020, 1, 1), datetime(2021, 1, 1)]
+             for index in range(20)] + [[99, 2000, 100000, 12, 8.5, 8722, 10, datetime(2020, 1, 1), datetime(2021, 1, 1)]]
+        )
+
+    def test_customers_ingested_in_chunks_with_duplicates_skipped(self):
+        make_customer(first_name='Existing', last_name='Customer', phone_number=9000000007)
+        stats = ingest_customers(self.customer_file, chunk_size=3)
+        self.assertEqual(stats.chunks, 3)
+        self.assertEqual(stats.rows_read, 9)
+        self.assertEqual(stats.created, 6)
+        self.assertEqual(stats.skipped, 2)
+        self.assertEqual(stats.error_count, 1)
+        self.assertEqual(stats.errors[0]['row'], 10)
+        self.assertEqual(Customer.objects.count(), 7)
+        self.assertEqual(Customer.objects.get(phone_number=9000000001).age, 31)
+
+    def test_loans_mapped_to_customers_by_source_id(self):
+        ingest_customers(self.customer_file, chunk_size=100)
+        stats = ingest_loans(self.loan_file, chunk_size=6)
+        self.assertEqual(stats.created, 20)
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(Loan.objects.filter(customer__source_customer_id=1).count(), 3)
+        self.assertEqual(verify_credit_profiles(), [])
+        self.assertEqual(Loan.objects.first().start_date, date(2020, 1, 1))
+
+    def test_reingesting_upserts_only_new_and_changed_rows(self):
+        ingest_customers(self.customer_file, chunk_size=100)
+        ingest_loans(self.loan_file, chunk_size=6)
+        self.assertEqual(Loan.objects.count(), 20)
+
+        workbook = openpyxl.load_workbook(self.loan_file)
+        sheet = workbook.active
+        sheet.cell(row=2, column=7, value=11)
+        sheet.append([1, 3000, 50000, 6, 9, 8600, 0, datetime(2024, 1, 1), datetime(2024, 7, 1)])
+        workbook.save(self.loan_file)
+
+        stats = ingest_loans(self.loan_file, chunk_size=6)
+        self.assertEqual((stats.created, stats.updated, stats.unchanged, stats.skipped), (1, 1, 19, 1))
+        self.assertEqual(Loan.objects.count(), 21)
+        self.assertEqual(Loan.objects.get(source_loan_id=1000).emis_paid_on_time, 11)
+        self.assertEqual(verify_credit_profiles(), [])
+
+        customer_stats = ingest_customers(self.customer_file, chunk_size=100)
+        self.assertEqual((customer_stats.created, customer_stats.updated, customer_stats.unchanged), (0, 0, 7))
+
+    def test_loans_ingested_without_source_ids_are_adopted(self):
+        ingest_customers(self.customer_file, chunk_size=100)
+        ingest_loans(self.loan_file, chunk_size=100)
+        Loan.objects.update(source_loan_id=None)
+
+        stats = ingest_loans(self.loan_file, chunk_size=100)
+        self.assertEqual((stats.created, stats.updated), (0, 20))
+        self.assertEqual(Loan.objects.count(), 20)
+        self.assertFalse(Loan.objects.filter(source_loan_id__isnull=True).exists())
+
+    def test_refeed_does_not_duplicate_loans_without_ids(self):
+        ingest_customers(self.customer_file, chunk_size=100)
+        header = ['Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate', 'Monthly payment',
+                  'EMIs paid on Time', 'Date of Approval', 'End Date']
+        loan = [1, None, 100000, 12, 8.5, 8722, 10, datetime(2020, 1, 1), datetime(2021, 1, 1)]
+        other = [2, None, 50000, 6, 8.5, 8553, 6, datetime(2020, 1, 1), datetime(2020, 7, 1)]
+        # The same loan twice is two loans
+        loan_file = write_workbook(self.tmpdir.name, 'unkeyed.xlsx', header, [loan, loan, other])
+        self.assertEqual(ingest_loans(loan_file, chunk_size=10).created, 3)
+
+        edited = loan[:6] + [11] + loan[7:]
+        loan_file = write_workbook(self.tmpdir.name, 'unkeyed.xlsx', header, [loan, edited, other])
+        stats = ingest_loans(loan_file, chunk_size=10)
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (0, 1, 2))
+        self.assertEqual(Loan.objects.count(), 3)
+        self.assertEqual(sorted(Loan.objects.filter(customer__source_customer_id=1).values_list('emis_paid_on_time', flat=True)), [10, 11])
+        self.assertEqual(verify_credit_profiles(), [])
+
+        self.assertEqual(copy_load_loans(loan_file, chunk_size=10).created, 0)
+        loan_file = write_workbook(self.tmpdir.name, 'unkeyed.xlsx', header, [loan, loan, loan, other])
+        self.assertEqual(copy_load_loans(loan_file, chunk_size=10).created, 1)
+        self.assertEqual(Loan.objects.count(), 4)
+
+    def test_ingest_file_skips_unchanged_files_and_resumes_after_a_crash(self):
+        ingest_customers(self.customer_file, chunk_size=100)
+        checkpoint = IngestionStats.checkpoint
+        calls = []
+
+        def crash_on_third_chunk(stats, chunk, **kwargs):
+            calls.append(chunk)
+            if len(calls) == 3:
+                raise SystemExit('worker killed')
+            checkpoint(stats, chunk, **kwargs)
+
+        with mock.patch.object(IngestionStats, 'checkpoint', crash_on_third_chunk):
+            with self.assertRaises(SystemExit):
+                ingest_file('loans', self.loan_file, chunk_size=5)
+        manifest = IngestionManifest.objects.get(label='loans')
+        self.assertEqual((manifest.status, manifest.last_row, manifest.created), ('running', 11, 10))
+        self.assertEqual(Loan.objects.count(), 10)
+
+        stats, manifest = ingest_file('loans', self.loan_file, chunk_size=5)
+        self.assertEqual((stats.rows_read, stats.created, stats.skipped), (21, 20, 1))
+        self.assertEqual((manifest.status, manifest.last_row, manifest.row_count), ('completed', 22, 21))
+        self.assertEqual(Loan.objects.count(), 20)
+        self.assertEqual(verify_credit_profiles(), [])
+
+        stats, skipped = ingest_file('loans', self.loan_file, chunk_size=5)
+        self.assertIsNone(stats)
+        self.assertEqual(skipped.pk, manifest.pk)
+        stats, _ = ingest_file('loans', self.loan_file, chunk_size=5, force=True)
+        self.assertEqual((stats.created, stats.unchanged), (0, 20))
+
+    def test_refeed_only_reapplies_changed_chunks(self):
+        ingest_customers(self.customer_file, chunk_size=100)
+        ingest_file('loans', self.loan_file, chunk_size=5)
+        # Edited in the database after the first feed; its chunk is unchanged in the next feed
+        Loan.objects.filter(source_loan_id=1005).update(emis_paid_on_time=3)
+
+        workbook = openpyxl.load_workbook(self.loan_file)
+        workbook.active.cell(row=2, column=7, value=11)
+        workbook.save(self.loan_file)
+
+        stats, manifest = ingest_file('loans', self.loan_file, chunk_size=5)
+        self.assertEqual((stats.created, stats.updated, stats.unchanged, stats.skipped), (0, 1, 19, 1))
+        self.assertEqual(Loan.objects.get(source_loan_id=1000).emis_paid_on_time, 11)
+        self.assertEqual(Loan.objects.get(source_loan_id=1005).emis_paid_on_time, 3)
+        # The chunk holding the unknown customer's loan is retried on every feed
+        self.assertEqual(sorted(manifest.chunk_hashes, key=int), ['2', '7', '12', '17'])
+
+    def write_csv(self, name, header, rows):
+        path = os.path.join(self.tmpdir.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(header)
+            writer.writerows(rows)
+        return path
+
+    def test_csv_rows_match_workbook_rows(self):
+        workbook_rows = list(iter_source_rows(self.loan_file, LOAN_COLUMNS, REQUIRED_LOAN_FIELDS))
+        csv_file = self.write_csv(
+            'loans.csv.gz',
+            ['Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate', 'Monthly payment',
+             'EMIs paid on Time', 'Date of Approval', 'End Date'],
+            [[1, 1000, 100000, 12, 8.5, 8722, '', '2020-01-01', '2021-01-01']]
+        )
+        row_number, record = next(iter_source_rows(csv_file, LOAN_COLUMNS, REQUIRED_LOAN_FIELDS))
+        self.assertEqual(row_number, 2)
+        self.assertEqual(set(record), set(workbook_rows[0][1]))
+        self.assertIsNone(record['emis_paid_on_time'])
+        self.assertEqual(ingest_loans(csv_file, chunk_size=10).skipped, 1)
+
+    def test_copy_loader_matches_orm_loader(self):
+        make_customer(first_name='Existing', last_name='Customer', phone_number=9000000007)
+        stats = copy_load_customers(self.customer_file, chunk_size=3)
+        self.assertEqual((stats.rows_read, stats.created, stats.skipped, stats.error_count), (9, 6, 2, 1))
+        self.assertEqual(stats.errors[0]['row'], 10)
+        self.assertEqual(Customer.objects.get(phone_number=9000000001).age, 31)
+
+        stats = copy_load_loans(self.loan_file, chunk_size=6)
+        self.assertEqual((stats.created, stats.skipped), (18, 3))
+        self.assertEqual(Loan.objects.filter(customer__source_customer_id=1).count(), 3)
+        self.assertEqual(list(Loan.objects.order_by('loan_id').values_list('customer__source_customer_id', flat=True)[:3]), [1, 2, 3])
+        self.assertEqual(Loan.objects.first().start_date, date(2020, 1, 1))
+        self.assertEqual(verify_credit_profiles(), [])
+
+        # The sequence continues after the loaded customers
+        customer = make_customer(first_name='New', last_name='Customer', phone_number=9100000000)
+        self.assertGreater(customer.customer_id, Customer.objects.exclude(pk=customer.pk).order_by('-customer_id')[0].customer_id)
+
+    def test_parallel_ingestion_runs_ranges_as_chord(self):
+        # Celery reads its settings under the CELERY_ namespace
+        previous = celery_app.conf.task_always_eager
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+        self.addCleanup(setattr, celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', previous)
+
+        customers = parallel_ingestion('customers', rows_per_range=4, chunk_size=2, file_path=self.customer_file)
+        customer_totals = customers.apply_async().get()
+        self.assertEqual([(r['min_row'], r['max_row']) for r in customer_totals['ranges']], [(2, 5), (6, 9), (10, 10)])
+        self.assertEqual(customer_totals['created'], 7)
+        self.assertEqual(customer_totals['error_count'], 1)
+
+        loans = parallel_ingestion('loans', rows_per_range=5, chunk_size=2, file_path=self.loan_file)
+        loan_totals = loans.apply_async().get()
+        self.assertEqual(len(loan_totals['ranges']), 5)
+        self.assertEqual(loan_totals['created'], 20)
+        self.assertEqual(Loan.objects.count(), 20)
+
+class CreditProfileTest(APITestCase):
+    def setUp(self):
+        self.customer = make_customer(first_name="Profile", phone_number=9200000000, monthly_salary=200000,
+                                      approved_limit=7200000)
+        make_history(random.Random(3), self.customer, 4)
+
+    def test_create_loan_updates_profile_incrementally(self):
+        check_loan_eligibility(self.customer.customer_id, Decimal('100000'), Decimal('14'), 12)
+        data = {"customer_id": self.customer.customer_id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12}
+        response = self.client.post('/api/create-loan', data, format='json')
+        self.assertTrue(response.data['loan_approved'])
+        profile = CustomerCreditProfile.objects.get(customer=self.customer)
+        expected = compute_credit_profiles([self.customer.customer_id])[self.customer.customer_id]
+        self.assertEqual(profile.loan_count, 5)
+        for field, value in expected.items():
+            self.assertEqual(getattr(profile, field), value, field)
+
+    def test_eligibility_reads_single_row_once_profile_exists(self):
+        expected = check_loan_eligibility(self.customer.customer_id, Decimal('100000'), Decimal('14'), 12)
+        get_score_cache().clear()
+        with self.assertNumQueries(1):
+            result = check_loan_eligibility(self.customer.customer_id, Decimal('100000'), Decimal('14'), 12)
+        self.assertEqual(result, expected)
+
+    def test_stale_profile_is_rebuilt_after_a_loan_expires(self):
+        check_loan_eligibility(self.customer.customer_id, Decimal('100000'), Decimal('14'), 12)
+        Loan.objects.filter(customer=self.customer).update(end_date=date.today() - timedelta(days=1))
+        CustomerCreditProfile.objects.filter(customer=self.customer).update(active_until=date.today() - timedelta(days=1))
+        get_score_cache().clear()
+        result = check_loan_eligibility(self.customer.customer_id, Decimal('100000'), Decimal('14'), 12)
+        self.assertEqual(CustomerCreditProfile.objects.get(customer=self.customer).active_monthly_repayment, 0)
+        self.assertEqual(verify_credit_profiles(), [])
+        self.assertTrue(result['approval'])
+
+class ScoreCacheTest(APITestCase):
+    def setUp(self):
+        self.score_cache = get_score_cache()
+        self.score_cache.clear()
+        self.score_cache.reset_stats()
+        self.customer = make_customer(first_name="Cache", phone_number=9300000000, monthly_salary=100000,
+                                      approved_limit=3600000)
+        make_history(random.Random(11), self.customer, 2)
+
+    def test_repeated_checks_are_served_from_cache(self):
+        first = check_loan_eligibility(self.customer.customer_id, Decimal('50000'), Decimal('12'), 12)
+        with self.assertNumQueries(0):
+            second = check_loan_eligibility(self.customer.customer_id, Decimal('50000'), Decimal('12'), 12)
+        self.assertEqual(first, second)
+        self.assertEqual(self.score_cache.stats()['hits'], 1)
+        self.assertEqual(self.score_cache.stats()['misses'], 1)
+
+    def test_cached_result_is_never_stale_after_create_loan(self):
+        customer = make_customer(first_name="Fresh", phone_number=9300000001, monthly_salary=100000,
+                                 approved_limit=3600000)
+        data = {"customer_id": customer.customer_id, "loan_amount": 200000, "interest_rate": 12, "tenure": 6}
+        before = self.client.post('/api/check-eligibility', data, format='json').data
+        self.assertTrue(before['approval'])
+        self.assertTrue(self.client.post('/api/create-loan', data, format='json').data['loan_approved'])
+
+        after = self.client.post('/api/check-eligibility', data, format='json').data
+        self.score_cache.clear()
+        uncached = self.client.post('/api/check-eligibility', data, format='json').data
+        self.assertEqual(after, uncached)
+        self.assertFalse(after['approval'])
+
+    def test_lru_eviction_and_ttl(self):
+        score_cache = LocalScoreCache(ttl=60, max_size=2)
+        entry = {'valid_through': date.today()}
+        for customer_id in (1, 2, 3):
+            score_cache.set(customer_id, entry)
+        self.assertIsNone(score_cache.get(1))
+        self.assertEqual(score_cache.get(3), entry)
+        score_cache.ttl = -1
+        score_cache.set(4, entry)
+        self.assertIsNone(score_cache.get(4))
+        self.assertIsNone(score_cache.get(5, today=date.today() + timedelta(days=1)))
+
+class AmortizationTest(APITestCase):
+    def decimal_schedule(self, loan_amount, interest_rate, tenure, payment):
+        balance = loan_amount
+        rows = []
+        for month in range(1, tenure + 1):
+            interest = (balance * interest_rate / 1200).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            principal = payment - interest
+            if month == tenure or principal > balance:
+                principal = balance
+            balance -= principal
+            rows.append((interest + principal, interest, principal, balance))
+        return rows
+
+    def test_vectorized_emis_match_scalar_formula(self):
+        rng = random.Random(5)
+        loans = [(rng.randrange(10000, 5000000), rng.choice([0, 5.5, 8.2, 12, 17.75]), rng.randint(1, 360)) for _ in range(200)]
+        emis = monthly_installments(*zip(*loans))
+        for (amount, rate, tenure), emi in zip(loans, emis):
+            expected = calculate_monthly_installment(Decimal(amount), Decimal(str(rate)), tenure)
+            self.assertAlmostEqual(float(emi), float(expected), places=6)
+
+    def test_exact_schedule_matches_decimal_reference(self):
+        rng = random.Random(9)
+        loans = []
+        for _ in range(50):
+            amount = Decimal(rng.randrange(1000000, 500000000)) / 100
+            rate = Decimal(rng.randint(0, 2400)) / 100
+            tenure = rng.randint(1, 120)
+            payment = calculate_monthly_installment(amount, rate, tenure).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            loans.append({'loan_amount': amount, 'interest_rate': rate, 'tenure': tenure,
+                          'monthly_repayment': payment + rng.choice([0, 0, Decimal('-3.50'), Decimal('125')])})
+        schedule = loan_schedule_arrays(loans)
+        for index, loan in enumerate(loans):
+            rows = schedule['loan_index'] == index
+            actual = list(zip(*(schedule[field][rows] for field in ('payment', 'interest', 'principal', 'balance'))))
+            expected = self.decimal_schedule(loan['loan_amount'], loan['interest_rate'], loan['tenure'], loan['monthly_repayment'])
+            self.assertEqual([tuple(Decimal(int(v)) / 100 for v in row) for row in actual], expected)
+            self.assertEqual(Decimal(int(schedule['principal'][rows].sum())) / 100, loan['loan_amount'])
+
+    def test_float_schedule_pays_off_level_emi_loans(self):
+        amounts, rates, tenures = [500000, 120000, 90000], [10.5, 0, 14], [24, 12, 1]
+        schedule = loan_schedule_arrays([
+            {'loan_amount': a, 'interest_rate': r, 'tenure': t, 'monthly_repayment': e}
+            for a, r, t, e in zip(amounts, rates, tenures, monthly_installments(amounts, rates, tenures))
+        ], exact=False)
+        for index, amount in enumerate(amounts):
+            rows = schedule['loan_index'] == index
+            self.assertAlmostEqual(float(schedule['principal'][rows].sum()), amount, places=4)
+            self.assertAlmostEqual(float(schedule['balance'][rows][-1]), 0, places=4)
+
+    def test_schedule_endpoint_streams_reconciled_schedule(self):
+        customer = make_customer(first_name="Sched", phone_number=9400000000, monthly_salary=100000,
+                                 approved_limit=3600000)
+        loan = Loan.objects.create(customer=customer, loan_amount=Decimal('250000'), tenure=18, interest_rate=Decimal('11.50'),
+                                   monthly_repayment=Decimal('15172.76'), start_date=date.today(),
+                                   end_date=date.today() + timedelta(days=540))
+        response = self.client.get(f'/api/view-loan/{loan.loan_id}/schedule')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(body['loan_id'], loan.loan_id)
+        self.assertEqual(len(body['schedule']), 18)
+        self.assertEqual(body['schedule'][0]['payment'], '15172.76')
+        self.assertEqual(sum(Decimal(row['principal']) for row in body['schedule']), Decimal('250000'))
+        self.assertEqual(self.client.get('/api/view-loan/999999/schedule').status_code, status.HTTP_404_NOT_FOUND)
+
+class BatchEligibilityTest(APITestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.customer_ids = []
+        for index in range(12):
+            customer = make_customer(first_name="Batch", last_name=str(index), phone_number=9100000000 + index,
+                                     monthly_salary=Decimal(rng.randrange(20000, 200000, 1000)),
+                                     approved_limit=Decimal(rng.randrange(500000, 5000000, 100000)))
+            make_history(rng, customer, rng.choice([0, 2, 4, 7, 12]))
+            self.customer_ids.append(customer.customer_id)
+        self.applications = [
+            {
+                "customer_id": rng.choice(self.customer_ids + [999999]),
+                "loan_amount": rng.randrange(10000, 1000000, 5000),
+                "interest_rate": rng.choice([0, 8.5, 11.99, 14.25, 18]),
+                "tenure": rng.choice([6, 12, 36, 60])
+            }
+            for _ in range(40)
+        ]
+
+    def test_batch_results_match_single_endpoint(self):
+        response = self.client.post('/api/check-eligibility/batch', self.applications, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), len(self.applications))
+        for application, result in zip(self.applications, response.data):
+            single = self.client.post('/api/check-eligibility', application, format='json')
+            self.assertEqual(result, single.data)
+
+    def test_batch_uses_constant_queries(self):
+        with self.assertNumQueries(2):
+            self.client.post('/api/check-eligibility/batch', self.applications, format='json')
+
+    def test_batch_reports_item_errors(self):
+        applications = self.applications[:2] + [{"customer_id": 1, "loan_amount": 1000, "interest_rate": 10, "tenure": 0}]
+        response = self.client.post('/api/check-eligibility/batch', applications, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data), [2])
+        self.assertIn('tenure', response.data[2])
+
+class CreateLoanTest(APITestCase):
+    def setUp(self):
+        get_score_cache().clear()
+        self.customer = make_customer(first_name="Loan", phone_number=9500000000, monthly_salary=100000,
+                                      approved_limit=3600000)
+        self.data = {"customer_id": self.customer.customer_id, "loan_amount": 100000, "interest_rate": 12, "tenure": 12}
+
+    def test_create_loan_adds_to_current_debt(self):
+        self.client.post('/api/create-loan', self.data, format='json')
+        self.client.post('/api/create-loan', self.data, format='json')
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, Decimal('200000'))
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 2)
+
+    def test_idempotency_key_replays_response(self):
+        first = self.client.post('/api/create-loan', self.data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        second = self.client.post('/api/create-loan', self.data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertTrue(first.data['loan_approved'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 1)
+
+        changed = dict(self.data, loan_amount=50000)
+        response = self.client.post('/api/create-loan', changed, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_invalid_request_does_not_create_loan(self):
+        data = dict(self.data, tenure=0)
+        self.client.post('/api/create-loan', data, format='json', HTTP_IDEMPOTENCY_KEY='bad-1')
+        response = self.client.post('/api/create-loan', data, format='json', HTTP_IDEMPOTENCY_KEY='bad-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Loan.objects.exists())
+
+    def test_expired_idempotency_keys_are_purged_on_a_schedule(self):
+        scheduled = {entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()}
+        self.assertIn('credit_app.tasks.purge_expired_idempotency_keys', scheduled)
+        self.client.post('/api/create-loan', self.data, format='json', HTTP_IDEMPOTENCY_KEY='old-1')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS + 1))
+        purge_expired_idempotency_keys()
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks and concurrent connections')
+class CreateLoanConcurrencyTest(TransactionTestCase):
+    """Hammer /api/create-loan for one customer from many threads"""
+
+    threads = 8
+    requests_per_thread = 4
+
+    def setUp(self):
+        get_score_cache().clear()
+        # Each loan has an EMI of 8884.88, so only 5 fit under half of the 100000 salary
+        self.customer = make_customer(first_name="Contended", phone_number=9600000000, monthly_salary=100000,
+                                      approved_limit=3600000)
+        self.data = {"customer_id": self.customer.customer_id, "loan_amount": 100000, "interest_rate": 12, "tenure": 12}
+
+    def run_concurrently(self, make_request):
+        barrier = threading.Barrier(self.threads)
+        responses = []
+
+        def worker(index):
+            client = Client()
+            try:
+                barrier.wait()
+                for attempt in range(self.requests_per_thread):
+                    responses.append(make_request(client, index, attempt))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(self.threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return responses, time.perf_counter() - start
+
+    def test_emi_ceiling_and_debt_hold_under_contention(self):
+        responses, seconds = self.run_concurrently(
+            lambda client, index, attempt: client.post('/api/create-loan', self.data, content_type='application/json')
+        )
+        self.assertEqual(len(responses), self.threads * self.requests_per_thread)
+        self.assertTrue(all(response.status_code == status.HTTP_200_OK for response in responses))
+        approved = [response for response in responses if response.json()['loan_approved']]
+        self.assertEqual(len(approved), 5)
+
+        self.customer.refresh_from_db()
+        loans = Loan.objects.filter(customer=self.customer)
+        self.assertEqual(loans.count(), 5)
+        self.assertEqual(self.customer.current_debt, Decimal('500000'))
+        self.assertLessEqual(sum(loan.monthly_repayment for loan in loans), self.customer.monthly_salary / 2)
+        self.assertEqual(verify_credit_profiles(), [])
+        # Requests for one customer are serialized, but must not stall behind each other
+        self.assertLess(seconds, 30)
+
+    def test_concurrent_retries_with_one_key_create_one_loan(self):
+        responses, _ = self.run_concurrently(
+            lambda client, index, attempt: client.post(
+                '/api/create-loan', self.data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='same-key'
+            )
+        )
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 1)
+        self.assertEqual(len({response.json()['loan_id'] for response in responses}), 1)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, Decimal('100000'))
+
+class QueryBudgetTest(APITestCase):
+    """Fail when an endpoint starts issuing more queries than its access path needs"""
+
+    def setUp(self):
+        get_score_cache().clear()
+        self.customer = make_customer(first_name="Budget", phone_number=9700000000, monthly_salary=1000000,
+                                      approved_limit=36000000)
+        make_history(random.Random(5), self.customer, 6)
+        self.loan = Loan.objects.filter(customer=self.customer).first()
+        self.application = {"customer_id": self.customer.customer_id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12}
+        # Build the credit profile so reads below take the steady-state path
+        check_loan_eligibility(self.customer.customer_id, Decimal('100000'), Decimal('14'), 12)
+        get_score_cache().clear()
+
+    def assertEndpointQueries(self, count, method, url, data=None, **extra):
+        with self.assertNumQueries(count):
+            response = getattr(self.client, method)(url, data, format='json', **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 300)
+        return response
+
+    def test_register(self):
+        data = {"first_name": "New", "last_name": "User", "age": 30, "monthly_income": 50000, "phone_number": 9700000001}
+        # Phone uniqueness check, then insert, outbox event and marking the portfolio shard stale
+        # in a savepoint
+        self.assertEndpointQueries(6, 'post', '/api/register', data)
+
+    def test_check_eligibility(self):
+        # Customer joined with its credit profile, then served from the score cache
+        self.assertEndpointQueries(1, 'post', '/api/check-eligibility', self.application)
+        self.assertEndpointQueries(0, 'post', '/api/check-eligibility', self.application)
+
+    def test_check_eligibility_batch(self):
+        self.assertEndpointQueries(2, 'post', '/api/check-eligibility/batch', [self.application] * 20)
+
+    def test_create_loan(self):
+        # Counts include the SAVEPOINT/RELEASE pairs each atomic block issues inside the test transaction.
+        # Customer lock, profile read, loan insert and outbox event, portfolio shard mark, profile lock
+        # and update, debt update and outbox event
+        self.assertEndpointQueries(13, 'post', '/api/create-loan', self.application)
+        # Idempotency key insert and response update around the same work
+        self.assertEndpointQueries(19, 'post', '/api/create-loan', self.application, HTTP_IDEMPOTENCY_KEY='budget')
+        # A replay only reads the stored response after the insert conflicts
+        self.assertEndpointQueries(7, 'post', '/api/create-loan', self.application, HTTP_IDEMPOTENCY_KEY='budget')
+
+    def test_view_loan(self):
+        self.assertEndpointQueries(1, 'get', f'/api/view-loan/{self.loan.loan_id}')
+        self.assertEndpointQueries(1, 'get', f'/api/view-loan/{self.loan.loan_id}/schedule')
+
+    def test_view_customer_loans(self):
+        self.assertEndpointQueries(2, 'get', f'/api/view-loans/{self.customer.customer_id}')
+
+@skipUnless(connection.vendor == 'postgresql', 'query plans are checked on PostgreSQL')
+class QueryPlanTest(TestCase):
+    """Fail when a hot lookup stops using the index built for it"""
+
+    def setUp(self):
+        self.customer = make_customer(first_name="Plan", phone_number=9800000000, monthly_salary=200000,
+                                      approved_limit=7200000)
+        make_history(random.Random(7), self.customer, 20)
+        # A long repaid history, so active and current-year loans are a small slice of the customer's loans
+        start_date = date.today() - timedelta(days=4000)
+        Loan.objects.bulk_create(
+            Loan(
+                customer=self.customer,
+                loan_amount=100000,
+                tenure=12,
+                interest_rate=10,
+                monthly_repayment=8792,
+                emis_paid_on_time=12,
+                start_date=start_date + timedelta(days=day),
+                end_date=start_date + timedelta(days=day + 360)
+            )
+            for day in range(0, 3000, 10)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE loans')
+            # The test tables are tiny, so the plan must show which index is usable, not cheapest
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_active_loans_use_end_date_index(self):
+        active = Loan.objects.filter(customer=self.customer, end_date__gte=date.today())
+        self.assertUsesIndex(active.values('loan_amount', 'monthly_repayment'), 'loans_customer_end_date_idx')
+
+    def test_customer_loans_use_composite_index(self):
+        # Any of the indexes leading with customer_id serves this, including unique_source_loan_per_customer
+        self.assertUsesIndex(Loan.objects.filter(customer=self.customer), 'Index Cond: (customer_id = ')
+
+    def test_current_year_loans_use_start_date_index(self):
+        current_year = Loan.objects.filter(customer=self.customer, start_date__year=date.today().year)
+        self.assertUsesIndex(current_year.values('loan_id'), 'loans_customer_start_date_idx')
+
+    def test_customer_lookup_by_phone_uses_unique_index(self):
+        self.assertUsesIndex(Customer.objects.filter(phone_number=9800000000), 'phone_number')
+
+class CustomerLoansListTest(APITestCase):
+    def setUp(self):
+        self.customer = make_customer(first_name="Corporate", age=40, phone_number=9900000000, monthly_salary=5000000,
+                                      approved_limit=180000000)
+        make_history(random.Random(13), self.customer, 25)
+        Loan.objects.filter(loan_id=Loan.objects.filter(customer=self.customer).first().loan_id).update(
+            emis_paid_on_time=F('tenure') + 3
+        )
+        self.url = f'/api/view-loans/{self.customer.customer_id}'
+        self.expected = LoanListSerializer(Loan.objects.filter(customer=self.customer).order_by('loan_id'), many=True).data
+
+    def test_full_list_matches_model_serialization(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), json.loads(json.dumps(self.expected)))
+        self.assertIn(0, [loan['repayments_left'] for loan in response.json()])
+
+    def test_cursor_pages_cover_every_loan_once(self):
+        loans = []
+        url = f'{self.url}?limit=10'
+        while url:
+            with self.assertNumQueries(2):
+                page = self.client.get(url).json()
+            loans.extend(page['results'])
+            url = page['next']
+        self.assertEqual(loans, json.loads(json.dumps(self.expected)))
+
+    def test_ndjson_stream_and_field_selection(self):
+        response = self.client.get(f'{self.url}?mode=ndjson&fields=loan_id,repayments_left')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(lines, [
+            {'loan_id': loan['loan_id'], 'repayments_left': loan['repayments_left']} for loan in self.expected
+        ])
+        response = self.client.get(f'{self.url}?fields=loan_id,balance')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class RescoringTest(TestCase):
+    def setUp(self):
+        rng = random.Random(17)
+        self.customers = []
+        for index in range(12):
+            customer = make_customer(first_name="Score", last_name=f"User{index}", phone_number=9910000000 + index,
+                                     monthly_salary=100000, approved_limit=3600000)
+            make_history(rng, customer, index % 5)
+            self.customers.append(customer)
+
+    def assertScoresMatch(self, customers):
+        stored = CustomerCreditScore.objects.in_bulk([customer.customer_id for customer in customers])
+        for customer in customers:
+            self.assertAlmostEqual(stored[customer.customer_id].credit_score, calculate_credit_score(customer))
+
+    def test_sharded_rescoring_matches_single_customer_scores(self):
+        # Shard planning, then customers, grouped loan aggregate and upsert for each of 3 shards
+        with self.assertNumQueries(1 + 3 * 3):
+            scored, _ = rescore_portfolio(shard_size=5, backend='serial')
+        self.assertEqual(scored, 12)
+        self.assertScoresMatch(self.customers)
+
+    def test_since_only_rescores_changed_customers(self):
+        rescore_portfolio(backend='serial')
+        since = timezone.now()
+        changed = self.customers[3]
+        Loan.objects.create(
+            customer=changed,
+            loan_amount=5000000,
+            tenure=12,
+            interest_rate=10,
+            monthly_repayment=1000,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=360)
+        )
+        scored, _ = rescore_portfolio(shard_size=5, backend='serial', since=since)
+        self.assertEqual(scored, 1)
+        self.assertScoresMatch([changed])
+        self.assertEqual(CustomerCreditScore.objects.filter(scored_at__gte=since).count(), 1)
+
+    def test_command_runs_shards_on_celery(self):
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+        self.addCleanup(setattr, celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', False)
+        out = StringIO()
+        call_command('calculate_scores', backend='celery', shard_size=4, stdout=out)
+        self.assertIn('Calculated scores for 12 customers', out.getvalue())
+        self.assertIn('customers/s', out.getvalue())
+        self.assertScoresMatch(self.customers)
+
+class LoadTestHarnessTest(TestCase):
+    def setUp(self):
+        customer = make_customer(first_name="Load", phone_number=9920000000, monthly_salary=100000,
+                                 approved_limit=3600000)
+        make_history(random.Random(19), customer, 3)
+
+    def test_request_log_skips_lines_that_are_not_api_calls(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as log:
+            log.write(json.dumps({'method': 'get', 'path': '/api/view-loans/1'}) + '\n')
+            log.write(json.dumps({'request_id': 'user-001', 'title': 'Not an API call'}) + '\n')
+            log.write('not json\n\n')
+        self.addCleanup(os.remove, log.name)
+        requests, skipped = load_request_log(log.name)
+        self.assertEqual(requests, [{'method': 'GET', 'path': '/api/view-loans/1', 'body': None, 'headers': {}}])
+        self.assertEqual(skipped, 2)
+
+    def test_synthetic_mix_reports_percentiles_and_queries_per_endpoint(self):
+        requests = synthetic_requests(60, seed=1)
+        results = run_load_test(requests, InProcessTarget())
+        self.assertEqual(results['overall']['requests'], 60)
+        self.assertEqual(results['overall']['errors'], 0)
+        self.assertEqual(sum(summary['requests'] for summary in results['endpoints'].values()), 60)
+        self.assertLessEqual(set(results['endpoints']), set(DEFAULT_MIX))
+        view_loan = results['endpoints']['view_loan']
+        self.assertEqual(view_loan['queries_per_request'], 1)
+        self.assertLessEqual(view_loan['p50_ms'], view_loan['p95_ms'])
+        self.assertLessEqual(view_loan['p95_ms'], view_loan['p99_ms'])
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2)
+
+class RequestMetricsTest(APITestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.customer = make_customer(first_name="Metrics", phone_number=9930000000, monthly_salary=100000,
+                                      approved_limit=3600000)
+        make_history(random.Random(23), self.customer, 2)
+        self.loan = Loan.objects.filter(customer=self.customer).first()
+
+    def metric_lines(self):
+        response = self.client.get('/api/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode().splitlines()
+
+    def test_metrics_expose_queries_and_phases_per_view(self):
+        self.client.get(f'/api/view-loan/{self.loan.loan_id}')
+        self.client.get(f'/api/view-loan/{self.loan.loan_id}')
+        self.client.get('/api/view-loan/999999')
+        lines = self.metric_lines()
+        self.assertIn('credit_http_requests_total{view="view_loan",status="200"} 2', lines)
+        self.assertIn('credit_http_requests_total{view="view_loan",status="404"} 1', lines)
+        self.assertIn('credit_http_request_db_queries_sum{view="view_loan"} 3.0', lines)
+        self.assertIn('credit_http_request_db_queries_bucket{view="view_loan",le="1"} 3', lines)
+        self.assertIn('credit_http_request_serializer_duration_seconds_count{view="view_loan"} 3', lines)
+        self.assertIn('credit_http_request_render_duration_seconds_count{view="view_loan"} 3', lines)
+        self.assertTrue(any(line.startswith('credit_score_cache_hits_total') for line in lines))
+        self.assertFalse(any('view="metrics"' in line for line in lines))
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_only_counted(self):
+        self.client.get(f'/api/view-loan/{self.loan.loan_id}')
+        lines = self.metric_lines()
+        self.assertIn('credit_http_requests_total{view="view_loan",status="200"} 1', lines)
+        self.assertFalse(any(line.startswith('credit_http_request_duration_seconds_count') for line in lines))
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=1)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('credit_app.slow_requests', level='WARNING') as logs:
+            with mock.patch('credit_app.metrics.time.perf_counter', side_effect=itertools.count(step=0.5)):
+                self.client.get(f'/api/view-loans/{self.customer.customer_id}')
+        self.assertIn('view_customer_loans', logs.output[0])
+        self.assertIn('FROM "loans"', logs.output[0])
+
+class SyntheticDataTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def generate_csv(self, name, seed):
+        directory = os.path.join(self.tmpdir.name, name)
+        generate_synthetic_data(50, 300, seed=seed, output='csv', directory=directory, today=date(2025, 6, 1))
+        with open(os.path.join(directory, 'loan_data.csv')) as loans:
+            return loans.read()
+
+    def test_same_seed_gives_same_rows(self):
+        first = self.generate_csv('a', seed=3)
+        self.assertEqual(first, self.generate_csv('b', seed=3))
+        self.assertNotEqual(first, self.generate_csv('c', seed=4))
+
+        rows = [line.split(',') for line in first.splitlines()[1:]]
+        self.assertEqual(len(rows), 300)
+        for customer_id, _, amount, tenure, rate, payment, paid_on_time, start, end in rows:
+            self.assertTrue(1 <= int(customer_id) <= 50)
+            expected = calculate_monthly_installment(float(amount), float(rate), int(tenure))
+            self.assertAlmostEqual(float(payment), expected, delta=0.005)
+            self.assertLessEqual(int(paid_on_time), int(tenure))
+            self.assertLess(start, end)
+
+    def test_database_output_continues_after_existing_customers(self):
+        existing = make_customer(first_name='Existing', last_name='Customer', phone_number=9999999999)
+        result = generate_synthetic_data(40, 120, seed=1, output='db')
+        self.assertEqual(result['first_customer_id'], existing.customer_id + 1)
+        self.assertEqual(Customer.objects.count(), 41)
+        self.assertEqual(Loan.objects.count(), 120)
+        self.assertFalse(Loan.objects.filter(customer=existing).exists())
+        customer = Customer.objects.get(customer_id=result['last_customer_id'])
+        self.assertEqual(customer.approved_limit, round(36 * customer.monthly_salary / 100000) * 100000)
+        self.assertGreater(customer.phone_number, existing.phone_number)
+
+    def test_xlsx_output_can_be_ingested(self):
+        directory = os.path.join(self.tmpdir.name, 'xlsx')
+        generate_synthetic_data(20, 60, seed=2, output='xlsx', directory=directory)
+        self.assertEqual(ingest_customers(os.path.join(directory, 'customer_data.xlsx'), chunk_size=10).created, 20)
+        self.assertEqual(ingest_loans(os.path.join(directory, 'loan_data.xlsx'), chunk_size=25).created, 60)
+        self.assertEqual(verify_credit_profiles(), [])
+
+class AsyncViewsTest(APITestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.customer = make_customer(first_name="Async", age=35, phone_number=9940000000, monthly_salary=150000,
+                                      approved_limit=5400000)
+        make_history(random.Random(29), self.customer, 12)
+        self.loan = Loan.objects.filter(customer=self.customer).first()
+
+    async def assert_same_response(self, method, path, data=None):
+        """The async view answers exactly like the sync view at the same path"""
+        kwargs = {'data': json.dumps(data), 'content_type': 'application/json'} if data is not None else {}
+        sync_response = await sync_to_async(getattr(self.client, method))(f'/api/{path}', **kwargs)
+        async_response = await getattr(self.async_client, method)(f'/api/async/{path}', **kwargs)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response['Content-Type'], sync_response['Content-Type'])
+        self.assertEqual(async_response.content.replace(b'/api/async/', b'/api/'), sync_response.content)
+        return async_response
+
+    async def test_eligibility_matches_sync_view(self):
+        application = {'customer_id': self.customer.customer_id, 'loan_amount': 200000, 'interest_rate': 11.5, 'tenure': 24}
+        response = await self.assert_same_response('post', 'check-eligibility', application)
+        self.assertEqual(response.json()['customer_id'], self.customer.customer_id)
+        await self.assert_same_response('post', 'check-eligibility', {**application, 'customer_id': 999999})
+        await self.assert_same_response('post', 'check-eligibility', {**application, 'tenure': 0})
+        await self.assert_same_response('get', 'check-eligibility')
+
+    async def test_loan_views_match_sync_views(self):
+        customer_id = self.customer.customer_id
+        await self.assert_same_response('get', f'view-loan/{self.loan.loan_id}')
+        await self.assert_same_response('get', 'view-loan/999999')
+        await self.assert_same_response('get', f'view-loans/{customer_id}')
+        await self.assert_same_response('get', f'view-loans/{customer_id}?fields=loan_id,repayments_left')
+        await self.assert_same_response('get', f'view-loans/{customer_id}?fields=balance')
+        await self.assert_same_response('get', 'view-loans/999999')
+        page = await self.assert_same_response('get', f'view-loans/{customer_id}?limit=5')
+        await self.assert_same_response('get', page.json()['next'].split('/api/async/')[1])
+        await self.assert_same_response('get', f'view-loans/{customer_id}?limit=5&cursor=bogus')
+
+    async def test_ndjson_stream_matches_sync_view(self):
+        path = f'view-loans/{self.customer.customer_id}?mode=ndjson&fields=loan_id,loan_amount'
+        sync_response = await sync_to_async(self.client.get)(f'/api/{path}')
+        sync_lines = await sync_to_async(b''.join)(sync_response.streaming_content)
+        async_response = await self.async_client.get(f'/api/async/{path}')
+        self.assertEqual(async_response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(b''.join([chunk async for chunk in async_response.streaming_content]), sync_lines)
+
+    async def test_metrics_count_queries_of_async_views(self):
+        await self.async_client.get(f'/api/async/view-loan/{self.loan.loan_id}')
+        response = await self.async_client.get('/api/metrics')
+        lines = response.content.decode().splitlines()
+        self.assertIn('credit_http_requests_total{view="async_view_loan",status="200"} 1', lines)
+        self.assertIn('credit_http_request_db_queries_sum{view="async_view_loan"} 1.0', lines)
+
+class ReadSerializationTest(APITestCase):
+    def setUp(self):
+        self.customer = make_customer(first_name="Zoë", last_name="Line\u2028Break", age=52, phone_number=9950000000,
+                                      monthly_salary=250000, approved_limit=9000000)
+        make_history(random.Random(31), self.customer, 15)
+        self.loan = Loan.objects.filter(customer=self.customer).first()
+
+    def get_content(self, path):
+        response = self.client.get(path)
+        if response.streaming:
+            return response.status_code, b''.join(response.streaming_content)
+        return response.status_code, response.content
+
+    def test_every_mode_renders_the_same_bytes(self):
+        customer_id = self.customer.customer_id
+        paths = [
+            f'/api/view-loan/{self.loan.loan_id}',
+            '/api/view-loan/999999',
+            f'/api/view-loans/{customer_id}',
+            f'/api/view-loans/{customer_id}?fields=repayments_left,loan_id',
+            f'/api/view-loans/{customer_id}?limit=4',
+            f'/api/view-loans/{customer_id}?mode=ndjson&fields=loan_amount',
+        ]
+        for path in paths:
+            with override_settings(READ_SERIALIZATION='drf'):
+                expected = self.get_content(path)
+            for mode in ['values', 'orjson']:
+                with self.subTest(path=path, mode=mode), override_settings(READ_SERIALIZATION=mode):
+                    self.assertEqual(self.get_content(path), expected)
+        self.assertIn(b'Zo\xc3\xab', self.get_content(f'/api/view-loan/{self.loan.loan_id}')[1])
+
+    def test_field_map_matches_serializer_rounding_and_nulls(self):
+        row = {
+            'loan_id': 7,
+            'loan_amount': Decimal('1234.565'),
+            'interest_rate': Decimal('12.345'),
+            'monthly_repayment': None,
+            'repayments_left': 3,
+        }
+        self.assertEqual(field_map(LoanListSerializer).to_representation(row), LoanListSerializer().to_representation(row))
+        self.assertEqual(
+            field_map(LoanDetailSerializer).lookups,
+            ['loan_id', 'customer__customer_id', 'customer__first_name', 'customer__last_name', 'customer__phone_number',
+             'customer__age', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure']
+        )
+
+    @skipUnless(renderers.orjson is not None, 'orjson is not installed')
+    @override_settings(READ_SERIALIZATION='orjson')
+    def test_fast_renderer_matches_json_renderer(self):
+        payloads = [
+            {'name': 'Zoë \u2028\u2029 "quoted" \\ \x01', 'ids': [1, 2**62, True, None], 'nested': {'a': []}},
+            {'rate': 1e16, 'small': 1e-05},
+            {'amount': Decimal('10.50'), 'day': date(2025, 1, 31)},
+            {1: 'int key'},
+            {'big': 2**70},
+        ]
+        for data in payloads:
+            with self.subTest(data=data):
+                self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+class ReadReplicaRoutingTest(TransactionTestCase):
+    """A second connection to the test database stands in for a replica"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica1'] = dict(connections['default'].settings_dict)
+        # Added after the test runner set up the databases, which it never needs to create
+        cls.databases = cls.databases | {'replica1'}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+
+    def setUp(self):
+        self.customer = make_customer(first_name="Replica", age=45, phone_number=9960000000, monthly_salary=200000,
+                                      approved_limit=7200000)
+        make_history(random.Random(37), self.customer, 6)
+        self.loan = Loan.objects.filter(customer=self.customer).first()
+
+    def get_streamed(self, path):
+        response = self.client.get(path)
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def queries_by_alias(self, *paths):
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica1']) as replica:
+            for path in paths:
+                self.get_streamed(path)
+        return [query['sql'] for query in primary], [query['sql'] for query in replica]
+
+    @override_settings(READ_REPLICAS=['replica1'])
+    def test_read_views_query_the_replica(self):
+        customer_id = self.customer.customer_id
+        primary, replica = self.queries_by_alias(
+            f'/api/view-loan/{self.loan.loan_id}',
+            f'/api/view-loans/{customer_id}',
+            f'/api/view-loans/{customer_id}?mode=ndjson',
+        )
+        self.assertEqual(primary, [])
+        self.assertEqual(len(replica), 5)
+
+    @override_settings(READ_REPLICAS=['replica1'])
+    def test_stale_profiles_are_rebuilt_from_the_primary(self):
+        CustomerCreditProfile.objects.filter(customer=self.customer).delete()
+        application = {'customer_id': self.customer.customer_id, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12}
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica1']) as replica:
+            response = self.client.post('/api/check-eligibility', application, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(replica), 1)
+        self.assertTrue(any('INSERT INTO "customer_credit_profiles"' in query['sql'] for query in primary))
+        self.assertTrue(CustomerCreditProfile.objects.filter(customer=self.customer).exists())
+
+    @override_settings(READ_REPLICAS=['replica1'])
+    def test_replica_reads_do_not_fill_the_score_cache(self):
+        score_cache = get_score_cache()
+        score_cache.clear()
+        customer_id = self.customer.customer_id
+        application = {'customer_id': customer_id, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12}
+        for _ in range(2):
+            with CaptureQueriesContext(connections['replica1']) as replica:
+                self.client.post('/api/check-eligibility', application, format='json')
+            self.assertEqual(len(replica), 1)
+        self.assertIsNone(score_cache.get(customer_id))
+
+        # Pinned clients read from the primary, which fills the cache
+        self.client.cookies[PIN_COOKIE] = '1'
+        with CaptureQueriesContext(connections['replica1']) as replica:
+            self.client.post('/api/check-eligibility', application, format='json')
+        self.assertEqual(replica.captured_queries, [])
+        self.assertIsNotNone(score_cache.get(customer_id))
+
+    @override_settings(READ_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+    def test_clients_read_their_writes_from_the_primary(self):
+        response = self.client.post('/api/register', {
+            "first_name": "Pinned", "last_name": "Client", "age": 30, "monthly_income": 50000, "phone_number": 9960000001
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        primary, replica = self.queries_by_alias(f"/api/view-loans/{response.json()['customer_id']}")
+        self.assertEqual((len(primary), replica), (2, []))
+
+        self.client.cookies.clear()
+        primary, replica = self.queries_by_alias(f"/api/view-loans/{response.json()['customer_id']}")
+        self.assertEqual((primary, len(replica)), ([], 2))
+
+    @override_settings(READ_REPLICAS=['replica1'])
+    def test_writes_and_transactions_read_from_the_primary(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(Loan), 'default')
+        with replica_reads(RequestFactory().get('/')):
+            self.assertEqual(router.db_for_read(Loan), 'replica1')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Loan), 'default')
+            self.assertEqual(router.db_for_read(Loan), 'replica1')
+            self.assertEqual(router.db_for_write(Loan), 'default')
+            self.assertEqual(router.db_for_read(Loan), 'default')
+        self.assertFalse(router.allow_migrate('replica1', 'credit_app'))
+
+class DecisionRulesTest(APITestCase):
+    def setUp(self):
+        get_score_cache().clear()
+        get_score_cache().reset_stats()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.rules_file = os.path.join(self.tmpdir.name, 'rules.json')
+        # A new customer scores 50, in the band with the 12% floor
+        self.customer = make_customer(first_name="Rules", phone_number=9700000000, monthly_salary=100000,
+                                      approved_limit=3600000)
+        self.data = {"customer_id": self.customer.customer_id, "loan_amount": 100000, "interest_rate": 10, "tenure": 12}
+
+    def write_rules(self, version, floor, mtime_ns):
+        definition = json.loads(json.dumps(DEFAULT_RULES))
+        definition['version'] = version
+        definition['approval']['bands'][2]['min_interest_rate'] = floor
+        with open(self.rules_file, 'w') as rules_file:
+            json.dump(definition, rules_file)
+        os.utime(self.rules_file, ns=(mtime_ns, mtime_ns))
+
+    def test_default_ruleset_matches_hard_coded_rules(self):
+        rng = random.Random(20)
+        for _ in range(2000):
+            approved_limit = Decimal(rng.randrange(100000, 5000000, 100000))
+            loan_count = rng.choice([0, 1, 2, 3, 5, 6, 10, 11, 20])
+            total_tenure = rng.randint(0, loan_count * 60)
+            aggregates = {
+                'loan_count': loan_count,
+                'total_tenure': total_tenure,
+                'total_emis_paid_on_time': rng.randint(0, total_tenure),
+                'current_year_loan_count': rng.randint(0, loan_count),
+                'total_loan_amount': approved_limit * rng.choice([0, Decimal('0.5'), Decimal('0.51'), 1, Decimal('1.2')]),
+                'active_loan_amount': approved_limit * rng.choice([0, 1, Decimal('1.01')]),
+            }
+            self.assertEqual(
+                score_from_aggregates(aggregates, approved_limit), score_from_aggregates_legacy(aggregates, approved_limit)
+            )
+
+        salary = Decimal('100000')
+        for score, rate, emis in itertools.product(
+            [0, 10, 10.5, 30, 30.01, 50, 50.5, 100],
+            [Decimal('8'), Decimal('12'), Decimal('12.00'), Decimal('14'), Decimal('16'), Decimal('18')],
+            [Decimal('49999.99'), Decimal('50000'), Decimal('50000.01')],
+        ):
+            corrected = get_corrected_interest_rate(score, rate)
+            self.assertEqual(corrected, get_corrected_interest_rate_legacy(score, rate))
+            self.assertEqual(str(corrected), str(get_corrected_interest_rate_legacy(score, rate)))
+            self.assertEqual(is_loan_approved(score, rate, emis, salary), is_loan_approved_legacy(score, rate, emis, salary))
+
+    def test_decisions_record_their_ruleset_version(self):
+        eligibility = self.client.post('/api/check-eligibility', self.data, format='json').data
+        self.assertEqual(eligibility['ruleset_version'], 'default-1')
+        batch = self.client.post('/api/check-eligibility/batch', [self.data], format='json').data
+        self.assertEqual(batch[0]['ruleset_version'], 'default-1')
+
+        self.assertTrue(self.client.post('/api/create-loan', self.data, format='json').data['loan_approved'])
+        self.assertEqual(Loan.objects.get(customer=self.customer).ruleset_version, 'default-1')
+        rescore_portfolio(backend='serial')
+        self.assertEqual(CustomerCreditScore.objects.get(customer=self.customer).ruleset_version, 'default-1')
+
+    def test_rules_file_is_reloaded_without_restart(self):
+        self.write_rules('floor-14', '14', 1_000_000_000)
+        with override_settings(CREDIT_RULES_FILE=self.rules_file, CREDIT_RULES_RELOAD_SECONDS=0):
+            first = self.client.post('/api/check-eligibility', self.data, format='json').data
+            self.assertEqual(first['corrected_interest_rate'], '14.00')
+            self.assertEqual(first['ruleset_version'], 'floor-14')
+
+            self.write_rules('floor-13', '13', 2_000_000_000)
+            second = self.client.post('/api/check-eligibility', self.data, format='json').data
+            self.assertEqual(second['corrected_interest_rate'], '13.00')
+            self.assertEqual(second['ruleset_version'], 'floor-13')
+            # The score cached under floor-14 is not reused under floor-13
+            self.assertEqual(get_score_cache().stats()['misses'], 2)
+
+        self.assertEqual(current_ruleset().version, 'default-1')
+
+    def test_bad_rules_file_keeps_the_loaded_ruleset(self):
+        self.write_rules('floor-14', '14', 1_000_000_000)
+        with override_settings(CREDIT_RULES_FILE=self.rules_file, CREDIT_RULES_RELOAD_SECONDS=0):
+            self.assertEqual(current_ruleset().version, 'floor-14')
+            with open(self.rules_file, 'w') as rules_file:
+                rules_file.write('{"version": "broken"')
+            os.utime(self.rules_file, ns=(2_000_000_000, 2_000_000_000))
+            with self.assertLogs('credit_app.rules', 'ERROR'):
+                self.assertEqual(current_ruleset().version, 'floor-14')
+
+        with override_settings(CREDIT_RULES_FILE=os.path.join(self.tmpdir.name, 'missing.json')):
+            with self.assertRaises(ImproperlyConfigured):
+                current_ruleset()
+
+    def test_malformed_definitions_are_rejected(self):
+        definition = json.loads(json.dumps(DEFAULT_RULES))
+        definition['approval']['bands'][1]['max'] = 5
+        with self.assertRaisesMessage(ValueError, 'must ascend'):
+            compile_rules(definition)
+        definition = json.loads(json.dumps(DEFAULT_RULES))
+        del definition['approval']['bands'][-1]
+        with self.assertRaisesMessage(ValueError, 'the last must not have one'):
+            compile_rules(definition)
+        definition = json.loads(json.dumps(DEFAULT_RULES))
+        del definition['score']['on_time_weight']
+        with self.assertRaises(ValueError):
+            compile_rules(definition)
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks and concurrent connections')
+class PortfolioRefreshConcurrencyTest(TransactionTestCase):
+    """A loan written while its shard is being refreshed"""
+
+    def setUp(self):
+        self.customer = make_customer(first_name="Portfolio", last_name="Race", phone_number=9800000000)
+        make_history(random.Random(41), self.customer, 3)
+        refresh_portfolio_shards()
+        # A write before the refresh leaves the shard stale, so it is refreshed below
+        make_history(random.Random(43), self.customer, 1)
+
+    def test_write_during_refresh_leaves_the_shard_stale(self):
+        start = shard_start(self.customer.customer_id, settings.PORTFOLIO_SHARD_SIZE)
+        saving, release = threading.Event(), threading.Event()
+        save = PortfolioShard.save
+
+        def paused_save(shard, *args, **kwargs):
+            # Totals are computed; hold the refresh open before it marks the shard fresh
+            saving.set()
+            release.wait(10)
+            return save(shard, *args, **kwargs)
+
+        def in_thread(target):
+            def run():
+                try:
+                    target()
+                finally:
+                    connection.close()
+            thread = threading.Thread(target=run)
+            thread.start()
+            return thread
+
+        with mock.patch.object(PortfolioShard, 'save', paused_save):
+            refresh = in_thread(refresh_portfolio_shards)
+            self.assertTrue(saving.wait(10))
+            writer = in_thread(lambda: make_history(random.Random(47), self.customer, 1))
+            # The writer queues on the shard row the refresh holds
+            writer.join(0.5)
+            self.assertTrue(writer.is_alive())
+            release.set()
+            refresh.join(10)
+            writer.join(10)
+
+        shard = PortfolioShard.objects.get(shard_start=start)
+        self.assertTrue(shard.stale)
+        refresh_portfolio_shards()
+        self.assertEqual(
+            sum(shard.loan_rollups.values_list('loan_count', flat=True)), Loan.objects.filter(customer=self.customer).count()
+        )
+
+@override_settings(PORTFOLIO_SHARD_SIZE=4, PORTFOLIO_RATE_BANDS=['10', '14'])
+class PortfolioRollupTest(APITestCase):
+    def setUp(self):
+        rng = random.Random(23)
+        self.today = date.today()
+        for index in range(10):
+            customer = make_customer(first_name="Portfolio", last_name=f"User{index}", phone_number=9800000000 + index,
+                                     monthly_salary=100000,
+                                     approved_limit=Decimal(rng.choice([200000, 1000000, 3600000])),
+                                     current_debt=Decimal(rng.randrange(0, 500000, 1000)))
+            make_history(rng, customer, index % 6)
+        refresh_portfolio_shards()
+
+    def summary(self, **params):
+        response = self.client.get('/api/portfolio/summary', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def expected_bands(self, loans):
+        bands = {'0-10': Q(interest_rate__lt=10), '10-14': Q(interest_rate__gte=10, interest_rate__lt=14), '14+': Q(interest_rate__gte=14)}
+        active = Q(end_date__gte=self.today)
+        expected = []
+        for label, band in bands.items():
+            totals = loans.filter(band).aggregate(
+                active_loan_amount=Sum('loan_amount', filter=active),
+                active_monthly_repayment=Sum('monthly_repayment', filter=active),
+                loan_count=Count('loan_id'),
+                loan_amount=Sum('loan_amount'),
+            )
+            expected.append({
+                'rate_band': label,
+                'loan_count': totals['loan_count'],
+                **{key: f'{totals[key] or 0:.2f}' for key in ('loan_amount', 'active_loan_amount', 'active_monthly_repayment')},
+            })
+        return expected
+
+    def test_summary_matches_aggregates_over_the_tables(self):
+        summary = self.summary()
+        self.assertEqual(summary['by_rate_band'], self.expected_bands(Loan.objects.all()))
+        self.assertEqual(summary['stale_shards'], 0)
+
+        years = (
+            Loan.objects.values(start_year=ExtractYear('start_date'))
+            .annotate(loan_count=Count('loan_id'), paid=Sum('emis_paid_on_time'), tenure=Sum('tenure'))
+            .order_by('start_year')
+        )
+        self.assertEqual(
+            [(row['start_year'], row['loan_count'], row['on_time_ratio']) for row in summary['by_start_year']],
+            [(row['start_year'], row['loan_count'], row['paid'] / row['tenure']) for row in years],
+        )
+
+        over_limit = Customer.objects.annotate(
+            active_loan_amount=Sum('loans__loan_amount', filter=Q(loans__end_date__gte=self.today))
+        ).filter(active_loan_amount__gt=F('approved_limit')).count()
+        totals = Customer.objects.aggregate(Sum('current_debt'))
+        self.assertEqual(summary['customers']['customer_count'], 10)
+        self.assertEqual(summary['customers']['over_limit_customers'], over_limit)
+        self.assertEqual(summary['customers']['current_debt'], f"{totals['current_debt__sum']:.2f}")
+
+    def test_filters(self):
+        loans = Loan.objects.filter(start_date__year__gte=self.today.year - 3, end_date__lt=self.today)
+        summary = self.summary(start_year_min=self.today.year - 3, status='ended')
+        self.assertEqual(summary['by_rate_band'], self.expected_bands(loans))
+
+        summary = self.summary(rate_band='10-14,14+', status='active')
+        self.assertEqual([band['rate_band'] for band in summary['by_rate_band']], ['10-14', '14+'])
+        self.assertEqual(
+            summary['loans']['loan_count'], Loan.objects.filter(interest_rate__gte=10, end_date__gte=self.today).count()
+        )
+
+        response = self.client.get('/api/portfolio/summary', {'rate_band': '3-5'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('rate_band', response.json())
+
+    def test_writes_mark_their_shard_and_refresh_catches_up(self):
+        # No loan history, so the application is approved
+        customer = Customer.objects.order_by('customer_id')[6]
+        data = {"customer_id": customer.customer_id, "loan_amount": 10000, "interest_rate": 18, "tenure": 12}
+        self.assertTrue(self.client.post('/api/create-loan', data, format='json').json()['loan_approved'])
+        self.assertEqual(self.summary()['stale_shards'], 1)
+
+        self.assertEqual(refresh_portfolio_shards(), 1)
+        self.assertEqual(self.summary()['by_rate_band'], self.expected_bands(Loan.objects.all()))
+
+        Loan.objects.filter(customer=customer).first().delete()
+        new_customer = make_customer(first_name="Late", phone_number=9800000100, monthly_salary=100000,
+                                     approved_limit=200000)
+        self.assertEqual(refresh_portfolio_rollups(), 'Refreshed 2 portfolio shards')
+        summary = self.summary()
+        self.assertEqual(summary['by_rate_band'], self.expected_bands(Loan.objects.all()))
+        self.assertEqual(summary['customers']['customer_count'], 11)
+        self.assertTrue(PortfolioShard.objects.filter(shard_start__lte=new_customer.customer_id, shard_end__gte=new_customer.customer_id).exists())
+
+    def shard_count(self, shard_size):
+        customer_ids = list(Customer.objects.values_list('customer_id', flat=True))
+        return len(range(shard_start(min(customer_ids), shard_size), max(customer_ids) + 1, shard_size))
+
+    def test_shards_refresh_on_a_new_day_and_on_resize(self):
+        self.assertEqual(refresh_portfolio_shards(), 0)
+        self.assertEqual(refresh_portfolio_shards(today=self.today + timedelta(days=1)), self.shard_count(4))
+        with override_settings(PORTFOLIO_SHARD_SIZE=5):
+            self.assertEqual(refresh_portfolio_shards(), self.shard_count(5))
+            self.assertEqual(self.summary()['by_rate_band'], self.expected_bands(Loan.objects.all()))
+
+    def test_summary_is_answered_from_the_rollups(self):
+        # Rate band totals, start year totals and shard totals
+        with self.assertNumQueries(3):
+            self.client.get('/api/portfolio/summary', {'status': 'active'})
+
+class BatchRegistrationTest(APITestCase):
+    def registration(self, index, **overrides):
+        return {
+            "first_name": "Batch",
+            "last_name": f"User{index}",
+            "age": 30,
+            "monthly_income": 50000 + index * 1000,
+            "phone_number": 9600000000 + index,
+            **overrides,
+        }
+
+    def test_vectorized_limits_match_the_single_formula(self):
+        rng = random.Random(11)
+        salaries = [Decimal(rng.randrange(0, 10**9)) / 100 for _ in range(2000)]
+        # 36 * salary lands exactly half way between two lakhs; ties go to the even one
+        salaries += [Decimal(12500), Decimal(37500), Decimal('13888.89'), Decimal(0)]
+        self.assertEqual(calculate_approved_limits(salaries), [calculate_approved_limit(salary) for salary in salaries])
+
+    def test_batch_matches_single_registration(self):
+        single = self.client.post('/api/register', self.registration(0), format='json')
+        batch = self.client.post('/api/register/batch', [self.registration(1, monthly_income=50000)], format='json')
+        self.assertEqual(batch.status_code, status.HTTP_200_OK)
+        customer = batch.json()['results'][0]['customer']
+        self.assertEqual(customer['approved_limit'], single.json()['approved_limit'])
+        self.assertEqual(set(customer), set(single.json()))
+
+    def test_reports_each_row(self):
+        make_customer(first_name="Taken", last_name="Phone", age=40, phone_number=9600000002)
+        rows = [
+            self.registration(0),
+            self.registration(1, phone_number=9600000000),
+            self.registration(2),
+            self.registration(3, age=12),
+            "not a registration",
+            self.registration(5),
+        ]
+        response = self.client.post('/api/register/batch', rows, format='json')
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 4))
+        self.assertEqual([result['index'] for result in body['results']], list(range(6)))
+        results = body['results']
+        self.assertIsNone(results[0]['errors'])
+        self.assertIn('row 0', results[1]['errors']['phone_number'][0])
+        single = self.client.post('/api/register', self.registration(2), format='json')
+        self.assertEqual(results[2]['errors'], single.json())
+        self.assertIn('age', results[3]['errors'])
+        self.assertIn('non_field_errors', results[4]['errors'])
+        self.assertEqual(results[5]['customer']['phone_number'], 9600000005)
+        self.assertEqual(Customer.objects.filter(first_name="Batch").count(), 2)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        for size, offset in ((5, 0), (50, 100)):
+            rows = [self.registration(offset + index) for index in range(size)]
+            # Registered phone lookup, savepoint, insert, marking shards stale, outbox events, release
+            with self.assertNumQueries(6):
+                response = self.client.post('/api/register/batch', rows, format='json')
+            self.assertEqual(response.json()['created'], size)
+
+    @override_settings(REGISTRATION_BATCH_MAX_SIZE=3)
+    def test_rejects_malformed_batches(self):
+        for body in ({}, [], [self.registration(index) for index in range(4)]):
+            response = self.client.post('/api/register/batch', body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Customer.objects.exists())
+
+    def test_register_customers_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'registrations.csv')
+            with open(path, 'w', newline='') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(['First Name', 'Last Name', 'Age', 'Monthly Salary', 'Phone Number'])
+                writer.writerow(['Ana', 'Rao', '28', '62000', '9600000100'])
+                writer.writerow(['Ben', 'Iyer', '35', 'lots', '9600000101'])
+                writer.writerow(['Cal', 'Das', '44', '81000', '9600000100'])
+                writer.writerow(['Dev', 'Sen', '51', '125000', '9600000103'])
+            out = StringIO()
+            call_command('register_customers', path, batch_size=2, stdout=out)
+        output = out.getvalue()
+        self.assertIn('Registered 2 customers, rejected 2 rows', output)
+        self.assertIn('Row 3: monthly_income', output)
+        self.assertIn('Row 4: phone_number: customer with this phone number already exists.', output)
+        self.assertEqual(Customer.objects.get(phone_number=9600000103).approved_limit, Decimal('4500000'))
+
+class JobsApiTest(APITestCase):
+    def setUp(self):
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+        self.addCleanup(setattr, celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', False)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        data_dir = override_settings(JOB_DATA_DIR=self.tmpdir.name)
+        data_dir.enable()
+        self.addCleanup(data_dir.disable)
+
+    def write_customers(self, name, rows, header=None):
+        with open(os.path.join(self.tmpdir.name, name), 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(header or ['Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number', 'Monthly Salary', 'Approved Limit'])
+            writer.writerows(rows)
+
+    def start(self, url, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return self.client.get(response['Location']).json()
+
+    def test_ingest_job_reports_progress_per_chunk(self):
+        rows = [[index, 'Job', f'Customer{index}', 30, 9500000000 + index, 50000, 1800000] for index in range(1, 8)]
+        rows.insert(4, [8, 'Bad', 'Salary', 30, 9500000008, 'n/a', 1800000])
+        self.write_customers('customers.csv', rows)
+        with mock.patch.object(JobProgress, 'update', autospec=True, side_effect=JobProgress.update) as update:
+            job = self.start('/api/jobs/ingest', {'type': 'customers', 'file': 'customers.csv', 'chunk_size': 3})
+        self.assertEqual([call.args[1] for call in update.call_args_list], [0, 3, 6, 8])
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual((job['rows_total'], job['rows_processed'], job['error_count']), (8, 8, 1))
+        self.assertEqual(job['errors'][0]['row'], 6)
+        self.assertEqual(job['errors'][0]['label'], 'customers')
+        self.assertEqual(job['result']['customers']['created'], 7)
+        self.assertEqual(job['eta_seconds'], 0.0)
+        self.assertEqual(Customer.objects.filter(first_name='Job').count(), 7)
+
+    def test_rescore_job(self):
+        for index in range(5):
+            make_customer(first_name='Job', last_name=f'Rescore{index}', phone_number=9500000100 + index)
+        job = self.start('/api/jobs/rescore', {'shard_size': 2})
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual((job['rows_total'], job['rows_processed']), (5, 5))
+        self.assertEqual(job['result']['customers_scored'], 5)
+        self.assertEqual(CustomerCreditScore.objects.count(), 5)
+
+    def test_failed_job_keeps_a_structured_error(self):
+        self.write_customers('customers.csv', [[1, 'Job', 'Customer', 30]], header=['Customer ID', 'First Name', 'Last Name', 'Age'])
+        job = self.start('/api/jobs/ingest', {'type': 'customers', 'file': 'customers.csv'})
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['errors'][-1]['type'], 'ValueError')
+        self.assertIn('Missing columns', job['errors'][-1]['message'])
+        self.assertIsNotNone(job['finished_at'])
+
+    def test_rejects_bad_requests(self):
+        for data in ({'type': 'loans', 'file': '../settings.py'}, {'type': 'all', 'file': 'x.csv'}, {'type': 'loans', 'file': 'missing.csv'}):
+            response = self.client.post('/api/jobs/ingest', data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('file', response.json())
+        self.assertEqual(self.client.post('/api/jobs/rescore', {'since': 'yesterday'}, format='json').status_code, 400)
+        self.assertEqual(self.client.get('/api/jobs/00000000-0000-0000-0000-000000000000').status_code, 404)
+        self.assertFalse(Job.objects.exists())
+
+    def test_progress_goes_to_task_state_on_workers(self):
+        job = Job.objects.create(kind=Job.KIND_RESCORE, rows_total=10)
+        task = mock.Mock(request=mock.Mock(is_eager=False))
+        JobProgress(job, task).update(4)
+        task.update_state.assert_called_once_with(
+            state='PROGRESS', meta={'rows_total': 10, 'rows_processed': 4, 'error_count': 0}
+        )
+        self.assertEqual(Job.objects.get(pk=job.pk).rows_processed, 4)
+
+    def test_throughput_and_eta(self):
+        started = timezone.now()
+        job = Job(status=Job.STATUS_RUNNING, rows_total=100, rows_processed=25,
+                  started_at=started, updated_at=started + timedelta(seconds=10))
+        self.assertEqual(job.throughput, 2.5)
+        self.assertEqual(job.eta_seconds, 30)
+        job.status = Job.STATUS_QUEUED
+        self.assertIsNone(job.eta_seconds)
+
+class LoanBookSnapshotTest(APITestCase):
+    def setUp(self):
+        get_score_cache().clear()
+        self.customers = []
+        rng = random.Random(24)
+        for index in range(6):
+            customer = make_customer(first_name='Book', last_name=f'User{index}', phone_number=9600000000 + index,
+                                     monthly_salary=40000 + 10000 * index,
+                                     approved_limit=1500000 + 100000 * index)
+            make_history(rng, customer, index)
+            self.customers.append(customer)
+
+    def check(self, customer, loan_amount='200000'):
+        return check_loan_eligibility(customer.customer_id, Decimal(loan_amount), Decimal('12'), 12)
+
+    def test_snapshot_matches_database_path(self):
+        expected = [self.check(customer, amount) for customer in self.customers for amount in ('50000', '900000')]
+        get_score_cache().clear()
+        with override_settings(LOAN_BOOK_SNAPSHOT=True):
+            actual = [self.check(customer, amount) for customer in self.customers for amount in ('50000', '900000')]
+        self.assertEqual(actual, expected)
+
+    @override_settings(LOAN_BOOK_SNAPSHOT=True, LOAN_BOOK_MAX_STALENESS_SECONDS=60)
+    def test_fresh_snapshot_answers_without_queries(self):
+        get_loan_book()
+        with self.assertNumQueries(0):
+            for customer in self.customers:
+                self.check(customer)
+        lines = loan_book_metric_lines()
+        self.assertIn(f'credit_loan_book_customers {len(self.customers)}', lines)
+        self.assertIn(f'credit_loan_book_bytes {get_loan_book().nbytes}', lines)
+
+    @override_settings(LOAN_BOOK_SNAPSHOT=True, LOAN_BOOK_MAX_STALENESS_SECONDS=0)
+    def test_refresh_picks_up_writes(self):
+        customer = self.customers[0]
+        get_loan_book()
+        data = {'customer_id': customer.customer_id, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12}
+        self.assertTrue(self.client.post('/api/create-loan', data, format='json').data['loan_approved'])
+        get_score_cache().clear()
+        with override_settings(LOAN_BOOK_SNAPSHOT=False):
+            expected = self.check(customer)
+        self.assertEqual(self.check(customer), expected)
+
+        registered = make_customer(first_name='Book', last_name='Late', phone_number=9600000100)
+        book = get_loan_book()
+        self.assertIsNotNone(book.index_of(registered.customer_id))
+        self.assertTrue(self.check(registered)['approval'])
+
+    @override_settings(LOAN_BOOK_SNAPSHOT=True, LOAN_BOOK_MAX_STALENESS_SECONDS=60)
+    def test_customers_missing_from_snapshot_fall_back_to_database(self):
+        get_loan_book()
+        registered = make_customer(first_name='Book', last_name='Late', phone_number=9600000100)
+        self.assertIsNone(get_loan_book().index_of(registered.customer_id))
+        self.assertTrue(self.check(registered)['approval'])
+        self.assertEqual(check_loan_eligibility(999999, Decimal('1000'), Decimal('12'), 12)['approval'], False)
+
+    @override_settings(LOAN_BOOK_SNAPSHOT=True, LOAN_BOOK_MAX_STALENESS_SECONDS=0)
+    def test_deleted_customers_leave_the_snapshot(self):
+        self.assertEqual(len(get_loan_book()), len(self.customers))
+        deleted_id = self.customers.pop().customer_id
+        Customer.objects.filter(customer_id=deleted_id).delete()
+        # Paired with a registration, so the customer count is unchanged
+        registered = make_customer(first_name='Book', last_name='Late', phone_number=9600000100)
+        with mock.patch.object(Customer.objects, 'count', side_effect=AssertionError('counted customers')):
+            book = get_loan_book()
+        self.assertEqual(len(book), len(self.customers) + 1)
+        self.assertIsNone(book.index_of(deleted_id))
+        self.assertIsNotNone(book.index_of(registered.customer_id))
+
+    @override_settings(LOAN_BOOK_SNAPSHOT=True, LOAN_BOOK_MAX_STALENESS_SECONDS=0)
+    def test_checks_do_not_wait_for_another_threads_load(self):
+        today = date.today()
+        book = get_loan_book(today)
+        # Held as if another thread were reloading
+        with loan_book._loan_book_lock:
+            with self.assertNumQueries(0):
+                self.assertIs(get_loan_book(today), book)
+                self.assertIsNone(get_loan_book(today + timedelta(days=1)))
+            self.assertIsNone(loan_book_entry(self.customers[0].customer_id, current_ruleset(), today + timedelta(days=1)))
+
+    def test_new_day_reloads_the_snapshot(self):
+        today = date.today()
+        book = refresh_loan_book(today=today)
+        self.assertEqual(refresh_loan_book(book, today).as_of, today)
+        tomorrow = refresh_loan_book(book, today + timedelta(days=1))
+        self.assertEqual(tomorrow.as_of, today + timedelta(days=1))
+        self.assertIsNot(tomorrow.columns, book.columns)
+
+class OutboxTest(APITestCase):
+    def setUp(self):
+        self.sink = LocalEventSink()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def events(self, **filters):
+        return list(OutboxEvent.objects.filter(**filters).order_by('id').values_list('topic', 'event_type', 'key'))
+
+    def create_customer(self, index):
+        return make_customer(first_name='Outbox', last_name=f'User{index}', phone_number=9800000000 + index)
+
+    def test_api_writes_record_events(self):
+        registration = {"first_name": "Outbox", "last_name": "User", "age": 30, "monthly_income": 100000, "phone_number": 9800000000}
+        customer_id = self.client.post('/api/register', registration, format='json').data['customer_id']
+        application = {"customer_id": customer_id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12}
+        loan_id = self.client.post('/api/create-loan', application, format='json').data['loan_id']
+        self.assertEqual(self.events(), [
+            ('customer', 'created', customer_id), ('loan', 'created', loan_id), ('customer', 'updated', customer_id),
+        ])
+        debt_update = OutboxEvent.objects.filter(topic='customer').last().payload
+        self.assertEqual(Decimal(debt_update['current_debt']), Customer.objects.get(pk=customer_id).current_debt)
+        self.assertEqual(OutboxEvent.objects.get(topic='loan').payload['customer_id'], customer_id)
+
+    def test_only_committed_writes_record_events(self):
+        with transaction.atomic():
+            self.create_customer(0)
+            transaction.set_rollback(True)
+        with override_settings(OUTBOX_ENABLED=False):
+            self.create_customer(1)
+        self.assertEqual(self.events(), [])
+
+    def test_bulk_writes_record_events(self):
+        registrations = [
+            {"first_name": "Outbox", "last_name": f"Batch{index}", "age": 30, "monthly_income": 50000, "phone_number": 9800000100 + index}
+            for index in range(3)
+        ]
+        self.client.post('/api/register/batch', registrations, format='json')
+        batch_ids = list(Customer.objects.filter(last_name__startswith='Batch').values_list('customer_id', flat=True))
+        self.assertCountEqual([key for _, _, key in self.events(topic='customer', event_type='created')], batch_ids)
+
+        customer_header = ['Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number', 'Monthly Salary', 'Approved Limit']
+        loan_header = ['Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate', 'Monthly payment',
+                       'EMIs paid on Time', 'Date of Approval', 'End Date']
+        customer_file = write_workbook(
+            self.tmpdir.name, 'customers.xlsx', customer_header,
+            [[index, 'Outbox', f'Sheet{index}', 30, 9800000200 + index, 50000, 1800000] for index in range(1, 4)]
+        )
+        loan_file = write_workbook(
+            self.tmpdir.name, 'loans.xlsx', loan_header,
+            [[index % 3 + 1, 100 + index, 100000, 12, 8.5, 8722, 10, datetime(2020, 1, 1), datetime(2021, 1, 1)] for index in range(4)]
+        )
+        ingest_customers(customer_file, chunk_size=2)
+        sheet_ids = set(Customer.objects.filter(last_name__startswith='Sheet').values_list('customer_id', flat=True))
+        self.assertEqual({key for _, _, key in self.events(topic='customer', key__in=sheet_ids)}, sheet_ids)
+        ingest_loans(loan_file, chunk_size=10)
+        self.assertCountEqual([key for _, _, key in self.events(topic='loan')], Loan.objects.values_list('loan_id', flat=True))
+
+        staged_file = write_workbook(
+            self.tmpdir.name, 'staged.xlsx', customer_header,
+            [[index, 'Outbox', f'Staged{index}', 30, 9800000300 + index, 50000, 1800000] for index in range(4, 6)]
+        )
+        copy_load_customers(staged_file, chunk_size=10)
+        staged_ids = set(Customer.objects.filter(last_name__startswith='Staged').values_list('customer_id', flat=True))
+        self.assertEqual(set(self.events(key__in=staged_ids)), {('customer', 'created', key) for key in staged_ids})
+        staged_loans = write_workbook(
+            self.tmpdir.name, 'staged_loans.xlsx', loan_header,
+            [[4, 200, 100000, 12, 8.5, 8722, 10, datetime(2020, 1, 1), datetime(2021, 1, 1)]]
+        )
+        copy_load_loans(staged_loans, chunk_size=10)
+        loan = Loan.objects.get(source_loan_id=200)
+        self.assertEqual(self.events(topic='loan', key=loan.loan_id), [('loan', 'created', loan.loan_id)])
+
+    def test_copy_loader_records_events_only_for_its_own_rows(self):
+        staged_file = write_workbook(
+            self.tmpdir.name, 'staged.xlsx',
+            ['Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number', 'Monthly Salary', 'Approved Limit'],
+            [[1, 'Outbox', 'Staged1', 30, 9800000301, 50000, 1800000]]
+        )
+        registered = []
+
+        def register_meanwhile(execute, sql, params, many, context):
+            # Another writer commits a customer just before the loader's merge
+            if sql.lstrip().startswith('INSERT INTO customers (') and not registered:
+                registered.append(self.create_customer(0))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(register_meanwhile):
+            stats = copy_load_customers(staged_file, chunk_size=10)
+        self.assertEqual(stats.created, 1)
+        staged = Customer.objects.get(last_name='Staged1')
+        self.assertEqual(self.events(), [
+            ('customer', 'created', registered[0].customer_id), ('customer', 'created', staged.customer_id)
+        ])
+
+    def test_orm_loader_records_events_only_for_its_own_rows(self):
+        customer_file = write_workbook(
+            self.tmpdir.name, 'customers.xlsx',
+            ['Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number', 'Monthly Salary', 'Approved Limit'],
+            [[1, 'Outbox', 'Sheet1', 30, 9800000201, 50000, 1800000], [2, 'Outbox', 'Sheet2', 30, 9800000202, 50000, 1800000]]
+        )
+        registered = []
+
+        def ingest_meanwhile(execute, sql, params, many, context):
+            # Another loader commits the first row just before this one's insert
+            if 'ON CONFLICT' in sql and not registered:
+                registered.append(make_customer(last_name='Elsewhere', phone_number=9800000299, source_customer_id=1))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(ingest_meanwhile):
+            stats = ingest_customers(customer_file, chunk_size=10)
+        self.assertEqual((stats.created, stats.skipped), (1, 1))
+        sheet2 = Customer.objects.get(last_name='Sheet2')
+        self.assertFalse(Customer.objects.filter(last_name='Sheet1').exists())
+        self.assertEqual(self.events(), [
+            ('customer', 'created', registered[0].customer_id), ('customer', 'created', sheet2.customer_id)
+        ])
+
+    def test_dispatch_assigns_sequences_and_publishes_once(self):
+        customers = [self.create_customer(index) for index in range(3)]
+        self.assertEqual(dispatch_outbox(batch_size=2, sink=self.sink), 3)
+        self.assertEqual([message['sequence'] for message in self.sink.events], [1, 2, 3])
+        self.assertEqual([message['key'] for message in self.sink.events], [customer.customer_id for customer in customers])
+        self.assertEqual(self.sink.events[0]['payload']['last_name'], 'User0')
+        self.assertEqual(dispatch_outbox(sink=self.sink), 0)
+        # Sequences stay gap-free when event IDs are not
+        later = [self.create_customer(index) for index in range(3, 6)]
+        OutboxEvent.objects.filter(key=later[1].customer_id).delete()
+        self.assertEqual(dispatch_outbox(sink=self.sink), 2)
+        self.assertEqual([(message['sequence'], message['key']) for message in list(self.sink.events)[3:]],
+                         [(4, later[0].customer_id), (5, later[2].customer_id)])
+        self.assertEqual(sorted(OutboxEvent.objects.values_list('sequence', flat=True)), [1, 2, 3, 4, 5])
+
+    def test_failed_publish_is_retried(self):
+        self.create_customer(0)
+
+        def unavailable(messages):
+            raise ConnectionError('sink unavailable')
+
+        with self.assertRaises(ConnectionError):
+            dispatch_outbox(sink=LocalEventSink(handlers=[unavailable]))
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=False).exists())
+        self.assertEqual(dispatch_outbox(sink=self.sink), 1)
+        self.assertEqual(self.sink.events[0]['sequence'], 1)
+
+    def test_consumers_checkpoint_and_redeliver_failed_batches(self):
+        customer = self.create_customer(0)
+        Loan.objects.create(customer=customer, loan_amount=100000, tenure=12, interest_rate=10, monthly_repayment=8792,
+                            start_date=date(2024, 1, 1), end_date=date(2025, 1, 1))
+        self.create_customer(1)
+        dispatch_outbox(sink=self.sink)
+
+        def failing(messages):
+            raise RuntimeError('consumer failed')
+
+        with self.assertRaises(RuntimeError):
+            consume_events('rollups', failing)
+        received = []
+        self.assertEqual(consume_events('rollups', received.extend, batch_size=2), 3)
+        self.assertEqual([message['sequence'] for message in received], [1, 2, 3])
+        self.assertEqual(consume_events('rollups', received.extend), 0)
+        self.assertEqual(OutboxCheckpoint.objects.get(consumer='rollups').position, 3)
+
+        loans = []
+        self.assertEqual(consume_events('loans', loans.extend, topics=['loan']), 1)
+        self.assertEqual(loans[0]['type'], 'created')
+        self.assertEqual(OutboxCheckpoint.objects.get(consumer='loans').position, 3)
+
+    def test_deletes_record_events_and_published_events_are_purged(self):
+        customer = self.create_customer(0)
+        loan = Loan.objects.create(customer=customer, loan_amount=100000, tenure=12, interest_rate=10, monthly_repayment=8792,
+                                   start_date=date(2024, 1, 1), end_date=date(2025, 1, 1))
+        customer_id = customer.customer_id
+        customer.delete()
+        self.assertIn(('loan', 'deleted', loan.loan_id), self.events())
+        self.assertEqual(self.events()[-1], ('customer', 'deleted', customer_id))
+
+        self.create_customer(1)
+        dispatch_outbox(sink=self.sink)
+        unpublished = self.create_customer(2)
+        self.assertEqual(purge_published_events(timedelta(0)), 5)
+        self.assertEqual(self.events(), [('customer', 'created', unpublished.customer_id)])
+
+    def test_redis_stream_sink_appends_to_topic_streams(self):
+        sink = RedisStreamSink(url='redis://localhost:6379/0', maxlen=100)
+        sink.client = mock.Mock()
+        self.create_customer(0)
+        dispatch_outbox(sink=sink)
+        pipeline = sink.client.pipeline.return_value
+        stream, fields = pipeline.xadd.call_args.args
+        self.assertEqual(stream, 'credit:customer')
+        self.assertEqual(json.loads(fields['payload'])['last_name'], 'User0')
+        self.assertEqual(pipeline.xadd.call_args.kwargs, {'maxlen': 100, 'approximate': True})
+        pipeline.execute.assert_called_once_with()
+
 class APITestCase(APITestCase):
     def test_register_customer(self):
         data = {
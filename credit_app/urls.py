@@ -1,10 +1,21 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('register', views.register_customer, name='register_customer'),
+    path('register/batch', views.register_customer_batch, name='register_customer_batch'),
     path('check-eligibility', views.check_eligibility, name='check_eligibility'),
+    path('check-eligibility/batch', views.check_eligibility_batch, name='check_eligibility_batch'),
     path('create-loan', views.create_loan, name='create_loan'),
     path('view-loan/<int:loan_id>', views.view_loan, name='view_loan'),
+    path('view-loan/<int:loan_id>/schedule', views.view_loan_schedule, name='view_loan_schedule'),
     path('view-loans/<int:customer_id>', views.view_customer_loans, name='view_customer_loans'),
+    path('portfolio/summary', views.portfolio_summary, name='portfolio_summary'),
+    path('jobs/ingest', views.start_ingest_job, name='start_ingest_job'),
+    path('jobs/rescore', views.start_rescore_job, name='start_rescore_job'),
+    path('jobs/<uuid:job_id>', views.view_job, name='view_job'),
+    path('metrics', views.metrics, name='metrics'),
+    path('async/check-eligibility', async_views.check_eligibility, name='async_check_eligibility'),
+    path('async/view-loan/<int:loan_id>', async_views.view_loan, name='async_view_loan'),
+    path('async/view-loans/<int:customer_id>', async_views.view_customer_loans, name='async_view_customer_loans'),
 ]
\ No newline at end of file
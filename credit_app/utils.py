@@ -1,10 +1,110 @@
 from decimal import Decimal
-from datetime import datetime, date
-from .models import Customer, Loan
+from datetime import datetime, date, timedelta
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Customer, Loan, OutboxEvent, to_cents
+from .outbox import record_events
+from .profiles import get_profile_credit_inputs
+from .rules import current_ruleset
+from .score_cache import get_score_cache
 import math
+import numpy as np
+
+def credit_score_aggregates(today=None):
+    """Aggregate expressions feeding the credit score, for use over Loan querysets"""
+    today = today or date.today()
+    return {
+        'loan_count': Count('loan_id'),
+        'total_tenure': Sum('tenure'),
+        'total_emis_paid_on_time': Sum('emis_paid_on_time'),
+        'current_year_loan_count': Count('loan_id', filter=Q(start_date__year=today.year)),
+        'total_loan_amount': Sum('loan_amount'),
+        'active_loan_amount': Sum('loan_amount', filter=Q(end_date__gte=today)),
+        'active_monthly_repayment': Sum('monthly_repayment', filter=Q(end_date__gte=today)),
+    }
+
+def get_credit_score_inputs(customer, today=None):
+    """Fetch all credit score inputs for a customer in a single aggregate query"""
+    aggregates = Loan.objects.filter(customer=customer).aggregate(**credit_score_aggregates(today))
+    return {key: value or 0 for key, value in aggregates.items()}
+
+def get_credit_score_inputs_bulk(customer_ids, today=None, batch_size=1000):
+    """Fetch credit score inputs for many customers with one grouped aggregate per batch"""
+    customer_ids = list(customer_ids)
+    expressions = credit_score_aggregates(today)
+    inputs = {customer_id: {key: 0 for key in expressions} for customer_id in customer_ids}
+    for start in range(0, len(customer_ids), batch_size):
+        rows = (
+            Loan.objects.filter(customer_id__in=customer_ids[start:start + batch_size])
+            .values('customer_id')
+            .annotate(**expressions)
+        )
+        for row in rows:
+            customer_id = row.pop('customer_id')
+            inputs[customer_id] = {key: value or 0 for key, value in row.items()}
+    return inputs
+
+def score_from_aggregates(aggregates, approved_limit, ruleset=None):
+    """Compute the credit score from pre-aggregated loan history under the active ruleset"""
+    return (ruleset or current_ruleset()).credit_score(aggregates, approved_limit)
+
+def score_from_aggregates_legacy(aggregates, approved_limit):
+    """Hard-coded scoring the default ruleset replaced, kept for parity checks and benchmarks"""
+    if not aggregates['loan_count']:
+        return 50  # Default score for new customers
+    
+    # Component 1: Past Loans paid on time (40% weightage)
+    total_emis = aggregates['total_tenure']
+    emis_paid_on_time = aggregates['total_emis_paid_on_time']
+    on_time_ratio = emis_paid_on_time / total_emis if total_emis > 0 else 0
+    on_time_score = on_time_ratio * 40
+    
+    # Component 2: Number of loans taken (20% weightage)
+    num_loans = aggregates['loan_count']
+    if num_loans <= 2:
+        loan_count_score = 20
+    elif num_loans <= 5:
+        loan_count_score = 15
+    elif num_loans <= 10:
+        loan_count_score = 10
+    else:
+        loan_count_score = 5
+    
+    # Component 3: Loan activity in current year (20% weightage)
+    current_year_loans = aggregates['current_year_loan_count']
+    if current_year_loans <= 2:
+        current_year_score = 20
+    elif current_year_loans <= 4:
+        current_year_score = 15
+    else:
+        current_year_score = 10
+    
+    # Component 4: Loan approved volume (20% weightage)
+    total_loan_amount = aggregates['total_loan_amount']
+    if total_loan_amount <= approved_limit * Decimal('0.5'):
+        volume_score = 20
+    elif total_loan_amount <= approved_limit:
+        volume_score = 15
+    else:
+        volume_score = 5
+    
+    credit_score = on_time_score + loan_count_score + current_year_score + volume_score
+    
+    # Component 5: Check if sum of current loans > approved limit
+    if aggregates['active_loan_amount'] > approved_limit:
+        return 0
+    
+    return min(100, max(0, credit_score))
 
 def calculate_credit_score(customer):
     """Calculate credit score based on historical loan data"""
+    return score_from_aggregates(get_credit_score_inputs(customer), customer.approved_limit)
+
+def calculate_credit_score_legacy(customer):
+    """Reference implementation walking every loan in Python, kept for parity checks"""
     loans = Loan.objects.filter(customer=customer)
     
     if not loans.exists():
@@ -61,12 +161,57 @@ def calculate_monthly_installment(loan_amount, interest_rate, tenure):
     if monthly_rate == 0:
         return loan_amount / tenure
     
-    numerator = loan_amount * monthly_rate * ((1 + monthly_rate) ** tenure)
-    denominator = ((1 + monthly_rate) ** tenure) - 1
+    growth = (1 + monthly_rate) ** tenure
+    numerator = loan_amount * monthly_rate * growth
+    denominator = growth - 1
     return numerator / denominator
 
-def get_corrected_interest_rate(credit_score, requested_rate):
+def calculate_monthly_installments(loans):
+    """Calculate installments for many (loan_amount, interest_rate, tenure) tuples at once
+    
+    The compound growth factor is computed once per distinct (interest_rate, tenure) pair and
+    shared by every loan using it; results are identical to calculate_monthly_installment.
+    """
+    growth_factors = {}
+    installments = []
+    for loan_amount, interest_rate, tenure in loans:
+        key = (interest_rate, tenure)
+        if key not in growth_factors:
+            monthly_rate = interest_rate / (12 * 100)
+            growth_factors[key] = (monthly_rate, (1 + monthly_rate) ** tenure if monthly_rate != 0 else None)
+        monthly_rate, growth = growth_factors[key]
+        if monthly_rate == 0:
+            installments.append(loan_amount / tenure)
+        else:
+            installments.append(loan_amount * monthly_rate * growth / (growth - 1))
+    return installments
+
+def calculate_approved_limit(monthly_salary):
+    """Approved limit: 36 months of salary, rounded to the nearest lakh"""
+    return round(36 * monthly_salary / 100000) * 100000
+
+def calculate_approved_limits(monthly_salaries):
+    """Approved limits for many salaries at once, identical to calculate_approved_limit
+
+    Salaries have two decimal places and at most 12 digits, so float64 recovers their
+    whole cents exactly; the rounding is then done on int64 cents to match Decimal's
+    round(), ties going to the even lakh.
+    """
+    cents = np.rint(np.array(list(monthly_salaries), dtype=np.float64) * 100).astype(np.int64)
+    lakhs, remainder = np.divmod(36 * cents, 10000000)
+    lakhs += (2 * remainder > 10000000) | ((2 * remainder == 10000000) & (lakhs % 2 == 1))
+    return (lakhs * 100000).tolist()
+
+def get_corrected_interest_rate(credit_score, requested_rate, ruleset=None):
     """Get corrected interest rate based on credit score"""
+    return (ruleset or current_ruleset()).corrected_interest_rate(credit_score, requested_rate)
+
+def is_loan_approved(credit_score, corrected_rate, total_emis_after_loan, monthly_salary, ruleset=None):
+    """Apply the credit score bands and the EMI-to-salary ceiling"""
+    return (ruleset or current_ruleset()).approves_loan(credit_score, corrected_rate, total_emis_after_loan, monthly_salary)
+
+def get_corrected_interest_rate_legacy(credit_score, requested_rate):
+    """Hard-coded rate floors the default ruleset replaced, kept for parity checks and benchmarks"""
     if credit_score > 50:
         return requested_rate
     elif 30 < credit_score <= 50:
@@ -76,31 +221,8 @@ def get_corrected_interest_rate(credit_score, requested_rate):
     else:
         return requested_rate  # Won't be approved anyway
 
-def check_loan_eligibility(customer_id, loan_amount, interest_rate, tenure):
-    """Check loan eligibility and return approval decision"""
-    try:
-        customer = Customer.objects.get(customer_id=customer_id)
-    except Customer.DoesNotExist:
-        return {
-            'customer_id': customer_id,
-            'approval': False,
-            'interest_rate': interest_rate,
-            'corrected_interest_rate': interest_rate,
-            'tenure': tenure,
-            'monthly_installment': Decimal('0')
-        }
-    
-    credit_score = calculate_credit_score(customer)
-    corrected_rate = get_corrected_interest_rate(credit_score, interest_rate)
-    monthly_installment = calculate_monthly_installment(loan_amount, corrected_rate, tenure)
-    
-    current_loans = Loan.objects.filter(
-        customer=customer,
-        end_date__gte=date.today()
-    )
-    current_emis = sum(loan.monthly_repayment for loan in current_loans)
-    total_emis_after_loan = current_emis + monthly_installment
-    
+def is_loan_approved_legacy(credit_score, corrected_rate, total_emis_after_loan, monthly_salary):
+    """Hard-coded approval bands the default ruleset replaced, kept for parity checks and benchmarks"""
     approval = True
     
     if credit_score <= 10:
@@ -110,14 +232,201 @@ def check_loan_eligibility(customer_id, loan_amount, interest_rate, tenure):
     elif 30 < credit_score <= 50 and corrected_rate < 12:
         approval = False
     
-    if total_emis_after_loan > customer.monthly_salary * Decimal('0.5'):
+    if total_emis_after_loan > monthly_salary * Decimal('0.5'):
         approval = False
     
+    return approval
+
+def customer_not_found_eligibility(customer_id, interest_rate, tenure):
+    return {
+        'customer_id': customer_id,
+        'approval': False,
+        'interest_rate': interest_rate,
+        'corrected_interest_rate': interest_rate,
+        'tenure': tenure,
+        'monthly_installment': Decimal('0'),
+        'ruleset_version': None,
+    }
+
+def build_credit_score_entry(customer, today=None, ruleset=None):
+    """Compute the eligibility inputs for a customer; fetch it with select_related('credit_profile') to save a query"""
+    today = today or date.today()
+    ruleset = ruleset or current_ruleset()
+    aggregates = get_profile_credit_inputs(customer, today)
+    end_of_year = date(today.year, 12, 31)
+    active_until = customer.credit_profile.active_until
+    return {
+        'credit_score': ruleset.credit_score(aggregates, customer.approved_limit),
+        'ruleset_version': ruleset.version,
+        'active_monthly_repayment': aggregates['active_monthly_repayment'],
+        'monthly_salary': customer.monthly_salary,
+        'valid_through': min(active_until, end_of_year) if active_until else end_of_year,
+    }
+
+def get_credit_score_entry(customer_id, today=None, ruleset=None):
+    """Return the cached eligibility inputs for a customer, loading them on a miss
+    
+    Entries scored under another ruleset count as misses. Returns None for unknown
+    customers, which are not cached. Entries read from a replica are not cached either.
+    """
+    today = today or date.today()
+    ruleset = ruleset or current_ruleset()
+    score_cache = get_score_cache()
+    entry = score_cache.get(customer_id, today, ruleset.version)
+    if entry is not None:
+        return entry
+    
+    try:
+        customer = Customer.objects.select_related('credit_profile').get(customer_id=customer_id)
+    except Customer.DoesNotExist:
+        return None
+    
+    entry = build_credit_score_entry(customer, today, ruleset)
+    # A lagging replica can return rows from before a write whose evictions already ran.
+    # Cached, they would be served to every client, including those pinned to the primary
+    if customer._state.db == DEFAULT_DB_ALIAS:
+        score_cache.set(customer_id, entry)
+    return entry
+
+def eligibility_from_entry(customer_id, entry, loan_amount, interest_rate, tenure, ruleset=None):
+    """Apply the approval rules to a customer's eligibility inputs, scored under the same ruleset"""
+    ruleset = ruleset or current_ruleset()
+    credit_score = entry['credit_score']
+    corrected_rate = ruleset.corrected_interest_rate(credit_score, interest_rate)
+    monthly_installment = calculate_monthly_installment(loan_amount, corrected_rate, tenure)
+    
+    current_emis = entry['active_monthly_repayment']
+    total_emis_after_loan = current_emis + monthly_installment
+    approval = ruleset.approves_loan(credit_score, corrected_rate, total_emis_after_loan, entry['monthly_salary'])
+    
     return {
         'customer_id': customer_id,
         'approval': approval,
         'interest_rate': interest_rate,
         'corrected_interest_rate': corrected_rate,
         'tenure': tenure,
-        'monthly_installment': monthly_installment
-    }
\ No newline at end of file
+        'monthly_installment': monthly_installment,
+        'ruleset_version': ruleset.version,
+    }
+
+def check_loan_eligibility(customer_id, loan_amount, interest_rate, tenure):
+    """Check loan eligibility and return approval decision"""
+    # One ruleset for the score and the decision, even if it is reloaded in between
+    ruleset = current_ruleset()
+    entry = None
+    if settings.LOAN_BOOK_SNAPSHOT:
+        from .loan_book import loan_book_entry
+        entry = loan_book_entry(customer_id, ruleset)
+    if entry is None:
+        # Also customers registered since the snapshot's last refresh
+        entry = get_credit_score_entry(customer_id, ruleset=ruleset)
+    if entry is None:
+        return customer_not_found_eligibility(customer_id, interest_rate, tenure)
+    return eligibility_from_entry(customer_id, entry, loan_amount, interest_rate, tenure, ruleset)
+
+def create_loan_if_eligible(customer_id, loan_amount, interest_rate, tenure):
+    """Check eligibility and create the loan in one transaction
+    
+    Returns (eligibility, loan), with loan None when not approved, or (None, None) for an
+    unknown customer. The customer row is locked for the duration, so concurrent applications for the same
+    customer are decided one after another against the committed loan book rather than a
+    cached score that an in-flight loan is about to change.
+    """
+    today = date.today()
+    ruleset = current_ruleset()
+    with transaction.atomic():
+        try:
+            # The profile is read by a separate statement once the lock is held. Joined into
+            # the locking query, it would come from the snapshot taken before the wait
+            customer = Customer.objects.select_for_update().get(customer_id=customer_id)
+        except Customer.DoesNotExist:
+            return None, None
+        
+        entry = build_credit_score_entry(customer, today, ruleset)
+        eligibility = eligibility_from_entry(customer_id, entry, loan_amount, interest_rate, tenure, ruleset)
+        if not eligibility['approval']:
+            return eligibility, None
+        
+        loan = Loan.objects.create(
+            customer=customer,
+            loan_amount=loan_amount,
+            tenure=tenure,
+            interest_rate=eligibility['corrected_interest_rate'],
+            monthly_repayment=to_cents(eligibility['monthly_installment']),
+            start_date=today,
+            end_date=today + timedelta(days=30*tenure),
+            ruleset_version=ruleset.version
+        )
+        now = timezone.now()
+        Customer.objects.filter(customer_id=customer_id).update(
+            current_debt=F('current_debt') + loan_amount, updated_at=now
+        )
+        # The row is locked, so the in-memory copy matches what was written
+        customer.current_debt += loan_amount
+        customer.updated_at = now
+        record_events(OutboxEvent.TOPIC_CUSTOMER, OutboxEvent.TYPE_UPDATED, [customer])
+        return eligibility, loan
+
+def check_loan_eligibility_batch(applications):
+    """Check eligibility for many applications using set-based customer and loan queries
+    
+    Each application is a dict with customer_id, loan_amount, interest_rate and tenure.
+    Results are returned in input order, in the same shape as check_loan_eligibility.
+    """
+    customer_ids = {application['customer_id'] for application in applications}
+    customers = Customer.objects.in_bulk(customer_ids)
+    aggregates = get_credit_score_inputs_bulk(customers)
+    ruleset = current_ruleset()
+    
+    credit_scores = {
+        customer_id: ruleset.credit_score(aggregates[customer_id], customer.approved_limit)
+        for customer_id, customer in customers.items()
+    }
+    corrected_rates = [
+        ruleset.corrected_interest_rate(credit_scores[application['customer_id']], application['interest_rate'])
+        if application['customer_id'] in customers else application['interest_rate']
+        for application in applications
+    ]
+    installments = calculate_monthly_installments(
+        (application['loan_amount'], corrected_rate, application['tenure'])
+        for application, corrected_rate in zip(applications, corrected_rates)
+    )
+    
+    results = []
+    for application, corrected_rate, monthly_installment in zip(applications, corrected_rates, installments):
+        customer_id = application['customer_id']
+        customer = customers.get(customer_id)
+        if customer is None:
+            results.append(customer_not_found_eligibility(customer_id, application['interest_rate'], application['tenure']))
+            continue
+        total_emis_after_loan = aggregates[customer_id]['active_monthly_repayment'] + monthly_installment
+        results.append({
+            'customer_id': customer_id,
+            'approval': ruleset.approves_loan(credit_scores[customer_id], corrected_rate, total_emis_after_loan, customer.monthly_salary),
+            'interest_rate': application['interest_rate'],
+            'corrected_interest_rate': corrected_rate,
+            'tenure': application['tenure'],
+            'monthly_installment': monthly_installment,
+            'ruleset_version': ruleset.version,
+        })
+    return results
+
+# Loan list fields and the columns or expressions they are read from
+LOAN_LIST_COLUMNS = {
+    'loan_id': 'loan_id',
+    'loan_amount': 'loan_amount',
+    'interest_rate': 'interest_rate',
+    'monthly_installment': 'monthly_repayment',
+    'repayments_left': Greatest(F('tenure') - F('emis_paid_on_time'), Value(0)),
+}
+
+def customer_loan_rows(customer_id, fields=None):
+    """Values queryset of a customer's loans ordered by loan_id, selecting only the listed fields
+    
+    loan_id is always selected because pagination keys on it. repayments_left is computed
+    in the database.
+    """
+    fields = set(fields or LOAN_LIST_COLUMNS) | {'loan_id'}
+    columns = [column for name, column in LOAN_LIST_COLUMNS.items() if name in fields and isinstance(column, str)]
+    expressions = {name: column for name, column in LOAN_LIST_COLUMNS.items() if name in fields and not isinstance(column, str)}
+    return Loan.objects.filter(customer_id=customer_id).values(*columns, **expressions).order_by('loan_id')
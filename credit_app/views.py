@@ -1,23 +1,65 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from datetime import date, timedelta
-from .models import Customer, Loan
+from django.urls import reverse
+from .amortization import iter_schedule_rows, loan_schedule_arrays, stream_schedule_json
+from .fast_serializers import field_map, use_field_maps
+from .idempotency import idempotent
+from .jobs import enqueue_job
+from .loan_book import loan_book_metric_lines
+from .metrics import registry, score_cache_metric_lines
+from .models import Customer, Job, Loan
+from .pagination import LoanCursorPagination
+from .portfolio import summarize_portfolio
+from .registration import register_customers
+from .renderers import FastJSONRenderer
+from .routers import pins_primary, reads_from_replica
 from .serializers import *
-from .utils import check_loan_eligibility, calculate_monthly_installment
+from .utils import (
+    LOAN_LIST_COLUMNS, check_loan_eligibility, check_loan_eligibility_batch, create_loan_if_eligible, customer_loan_rows
+)
 
 @api_view(['POST'])
+@pins_primary
 def register_customer(request):
     """Register a new customer"""
     serializer = CustomerRegistrationSerializer(data=request.data)
     if serializer.is_valid():
-        customer = serializer.save()
+        # The customer's outbox event commits with it
+        with transaction.atomic():
+            customer = serializer.save()
         response_serializer = CustomerRegistrationResponseSerializer(customer)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
+@pins_primary
+def register_customer_batch(request):
+    """Register a list of customers in one request, reporting each row's outcome"""
+    rows = request.data
+    if not isinstance(rows, list):
+        return Response(
+            {'non_field_errors': [f'Expected a list of items but got type "{type(rows).__name__}".']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not rows or len(rows) > settings.REGISTRATION_BATCH_MAX_SIZE:
+        return Response(
+            {'non_field_errors': [f'Send between 1 and {settings.REGISTRATION_BATCH_MAX_SIZE} registrations.']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    results = register_customers(rows)
+    created = sum(result['errors'] is None for result in results)
+    return Response(
+        {'created': created, 'failed': len(results) - created, 'results': results}, status=status.HTTP_200_OK
+    )
+
+@api_view(['POST'])
+@reads_from_replica
 def check_eligibility(request):
     """Check loan eligibility for a customer"""
     serializer = LoanEligibilitySerializer(data=request.data)
@@ -33,50 +75,50 @@ def check_eligibility(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
+@reads_from_replica
+def check_eligibility_batch(request):
+    """Check loan eligibility for a list of applications in one request"""
+    serializer = LoanEligibilitySerializer(
+        data=request.data, many=True, max_length=settings.ELIGIBILITY_BATCH_MAX_SIZE
+    )
+    if serializer.is_valid():
+        eligibility_data = check_loan_eligibility_batch(serializer.validated_data)
+        response_serializer = LoanEligibilityResponseSerializer(eligibility_data, many=True)
+        return Response(response_serializer.data, status=status.HTTP_200_OK)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@pins_primary
+@idempotent('create-loan')
 def create_loan(request):
     """Create a new loan if eligible"""
     serializer = LoanCreationSerializer(data=request.data)
     if serializer.is_valid():
         customer_id = serializer.validated_data['customer_id']
-        loan_amount = serializer.validated_data['loan_amount']
-        interest_rate = serializer.validated_data['interest_rate']
-        tenure = serializer.validated_data['tenure']
         
-        eligibility = check_loan_eligibility(customer_id, loan_amount, interest_rate, tenure)
+        eligibility, loan = create_loan_if_eligible(
+            customer_id,
+            serializer.validated_data['loan_amount'],
+            serializer.validated_data['interest_rate'],
+            serializer.validated_data['tenure']
+        )
         
-        if eligibility['approval']:
-            try:
-                customer = Customer.objects.get(customer_id=customer_id)
-                
-                loan = Loan.objects.create(
-                    customer=customer,
-                    loan_amount=loan_amount,
-                    tenure=tenure,
-                    interest_rate=eligibility['corrected_interest_rate'],
-                    monthly_repayment=eligibility['monthly_installment'],
-                    start_date=date.today(),
-                    end_date=date.today() + timedelta(days=30*tenure)
-                )
-                
-                customer.current_debt += loan_amount
-                customer.save()
-                
-                response_data = {
-                    'loan_id': loan.loan_id,
-                    'customer_id': customer_id,
-                    'loan_approved': True,
-                    'message': 'Loan approved successfully',
-                    'monthly_installment': eligibility['monthly_installment']
-                }
-                
-            except Customer.DoesNotExist:
-                response_data = {
-                    'loan_id': None,
-                    'customer_id': customer_id,
-                    'loan_approved': False,
-                    'message': 'Customer not found',
-                    'monthly_installment': 0
-                }
+        if eligibility is None:
+            response_data = {
+                'loan_id': None,
+                'customer_id': customer_id,
+                'loan_approved': False,
+                'message': 'Customer not found',
+                'monthly_installment': 0
+            }
+        elif loan is not None:
+            response_data = {
+                'loan_id': loan.loan_id,
+                'customer_id': customer_id,
+                'loan_approved': True,
+                'message': 'Loan approved successfully',
+                'monthly_installment': eligibility['monthly_installment']
+            }
         else:
             response_data = {
                 'loan_id': None,
@@ -92,8 +134,20 @@ def create_loan(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@reads_from_replica
 def view_loan(request, loan_id):
     """View loan details by loan ID"""
+    if use_field_maps():
+        loan_map = field_map(LoanDetailSerializer)
+        row = Loan.objects.filter(loan_id=loan_id).values(*loan_map.lookups).first()
+        if row is None:
+            return Response(
+                {'error': 'Loan not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(loan_map.represent(row), status=status.HTTP_200_OK)
+    
     try:
         loan = Loan.objects.select_related('customer').get(loan_id=loan_id)
         serializer = LoanDetailSerializer(loan)
@@ -105,15 +159,121 @@ def view_loan(request, loan_id):
         )
 
 @api_view(['GET'])
-def view_customer_loans(request, customer_id):
-    """View all loans for a customer"""
+@reads_from_replica
+def view_loan_schedule(request, loan_id):
+    """Stream the month-by-month repayment schedule of a loan"""
     try:
-        customer = Customer.objects.get(customer_id=customer_id)
-        loans = Loan.objects.filter(customer=customer)
-        serializer = LoanListSerializer(loans, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    except Customer.DoesNotExist:
+        loan = Loan.objects.get(loan_id=loan_id)
+    except Loan.DoesNotExist:
+        return Response(
+            {'error': 'Loan not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    # exact (default): cent-exact schedule reconciling with the stored monthly_repayment
+    exact = request.query_params.get('mode', 'exact') != 'float'
+    schedule = loan_schedule_arrays([loan], exact=exact)
+    header = {
+        'loan_id': loan.loan_id,
+        'loan_amount': loan.loan_amount,
+        'interest_rate': loan.interest_rate,
+        'monthly_repayment': loan.monthly_repayment,
+        'tenure': loan.tenure,
+    }
+    return StreamingHttpResponse(
+        stream_schedule_json(header, iter_schedule_rows(schedule, exact=exact)),
+        content_type='application/json'
+    )
+
+@api_view(['GET'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@reads_from_replica
+def view_customer_loans(request, customer_id):
+    """View all loans for a customer
+    
+    Without parameters returns the full list. ?limit= and ?cursor= page through it by
+    loan_id, ?mode=ndjson streams one loan per line, and ?fields= selects fields.
+    """
+    if not Customer.objects.filter(customer_id=customer_id).exists():
         return Response(
             {'error': 'Customer not found'}, 
             status=status.HTTP_404_NOT_FOUND
-        )
\ No newline at end of file
+        )
+    
+    fields = request.query_params.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    unknown = sorted(set(fields or []) - set(LOAN_LIST_COLUMNS))
+    if unknown:
+        return Response(
+            {'error': f"Unknown fields: {', '.join(unknown)}"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    loans = customer_loan_rows(customer_id, fields)
+    loan_map = field_map(LoanListSerializer, fields) if use_field_maps() else None
+    
+    if request.query_params.get('mode') == 'ndjson':
+        # Bound to the read database now: the stream is consumed after the view returns
+        return StreamingHttpResponse(
+            stream_ndjson(loan_map or LoanListSerializer(fields=fields), loans.using(loans.db).iterator(chunk_size=2000)),
+            content_type='application/x-ndjson'
+        )
+    
+    if 'cursor' in request.query_params or 'limit' in request.query_params:
+        paginator = LoanCursorPagination()
+        page = paginator.paginate_queryset(loans, request)
+        return paginator.get_paginated_response(serialize_loan_rows(page, fields, loan_map))
+    
+    return Response(serialize_loan_rows(loans, fields, loan_map), status=status.HTTP_200_OK)
+
+def serialize_loan_rows(rows, fields, loan_map):
+    if loan_map is not None:
+        return loan_map.represent_many(rows)
+    return LoanListSerializer(rows, many=True, fields=fields).data
+
+@api_view(['GET'])
+@reads_from_replica
+def portfolio_summary(request):
+    """Portfolio totals by interest-rate band and start year, answered from the rollup tables"""
+    query = PortfolioSummaryQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    summary = summarize_portfolio(**query.validated_data)
+    return Response(PortfolioSummarySerializer(summary).data, status=status.HTTP_200_OK)
+
+def start_job(request, kind, serializer_class):
+    serializer = serializer_class(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    job = enqueue_job(kind, dict(serializer.data))
+    # Eager tasks have already run by now
+    job.refresh_from_db()
+    response = Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = reverse('view_job', args=[job.id])
+    return response
+
+@api_view(['POST'])
+def start_ingest_job(request):
+    """Queue a customer and/or loan file ingestion job"""
+    return start_job(request, Job.KIND_INGEST, IngestJobSerializer)
+
+@api_view(['POST'])
+def start_rescore_job(request):
+    """Queue a credit score recalculation job"""
+    return start_job(request, Job.KIND_RESCORE, RescoreJobSerializer)
+
+@api_view(['GET'])
+def view_job(request, job_id):
+    """Report a job's status, progress, throughput, ETA and errors"""
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(JobSerializer(job).data, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def metrics(request):
+    """Expose request, score cache and loan book snapshot metrics in Prometheus text format"""
+    return HttpResponse(
+        registry.render(score_cache_metric_lines() + loan_book_metric_lines()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,14 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'credit_system.settings')
+# Requests run on short-lived threads, so connections cannot persist between them
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+application = get_asgi_application()
+
+# Imported once the app registry is ready
+from credit_app.loan_book import preload_loan_book
+
+preload_loan_book()
@@ -1,5 +1,5 @@
 import os
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -30,6 +30,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'credit_app.metrics.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'credit_system.urls'
@@ -60,9 +61,25 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD', default='postgres'),
         'HOST': config('DB_HOST', default='db'),
         'PORT': config('DB_PORT', default='5432'),
+        # Persistent connections, checked before reuse in each request. Under ASGI every
+        # request runs on its own thread, so credit_system.asgi defaults this to 0
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
     }
 }
 
+# Read replicas serving the read-only API views (credit_app.routers): comma-separated
+# hosts, connected to with the primary's other settings. Tests read through the primary
+READ_REPLICAS = []
+for index, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    READ_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['credit_app.routers.ReadReplicaRouter']
+
+# Seconds a client's reads stay on the primary after it registers or creates a loan, so it
+# reads its own writes while the replicas catch up
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
 # Celery Configuration
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://redis:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://redis:6379/0')
@@ -77,6 +94,121 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'credit_scores': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'credit-scores',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Credit score cache in front of eligibility checks. LocalScoreCache is per process;
+# DjangoScoreCache on the Redis-backed 'credit_scores' alias is shared by web and worker
+CREDIT_SCORE_CACHE = {
+    'BACKEND': config('CREDIT_SCORE_CACHE_BACKEND', default='credit_app.score_cache.LocalScoreCache'),
+    'TTL': config('CREDIT_SCORE_CACHE_TTL', default=300, cast=int),
+    'MAX_SIZE': config('CREDIT_SCORE_CACHE_MAX_SIZE', default=10000, cast=int),
+    'ALIAS': 'credit_scores',
+}
+
+# Run tasks in-process instead of on a worker (local development and tests)
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+
+# Data ingestion
+INGEST_CHUNK_SIZE = config('INGEST_CHUNK_SIZE', default=5000, cast=int)
+INGEST_RANGE_ROWS = config('INGEST_RANGE_ROWS', default=50000, cast=int)
+
+# Customer IDs per shard in calculate_scores
+RESCORE_SHARD_SIZE = config('RESCORE_SHARD_SIZE', default=5000, cast=int)
+
+# Directory the files named in /api/jobs/ingest requests are read from
+JOB_DATA_DIR = config('JOB_DATA_DIR', default=str(BASE_DIR / 'data'))
+
+# Portfolio rollups behind /api/portfolio/summary: customer IDs per rollup shard, interest
+# rate band edges in percent, and how often Celery beat refreshes stale shards
+PORTFOLIO_SHARD_SIZE = config('PORTFOLIO_SHARD_SIZE', default=1000, cast=int)
+PORTFOLIO_RATE_BANDS = config('PORTFOLIO_RATE_BANDS', default='8,10,12,14,16', cast=Csv())
+PORTFOLIO_REFRESH_SECONDS = config('PORTFOLIO_REFRESH_SECONDS', default=60, cast=int)
+
+# Outbox of customer and loan writes (credit_app.outbox): whether writes record events,
+# where the dispatcher publishes them (LocalEventSink in the process, or RedisStreamSink
+# appending to one stream per topic), events per dispatch or consumer batch, how often
+# Celery beat dispatches, and how long published events are kept for consume_events
+OUTBOX_ENABLED = config('OUTBOX_ENABLED', default=True, cast=bool)
+OUTBOX_SINK = {
+    'BACKEND': config('OUTBOX_SINK_BACKEND', default='credit_app.outbox.LocalEventSink'),
+    'URL': config('OUTBOX_REDIS_URL', default=CELERY_BROKER_URL),
+    'STREAM_PREFIX': config('OUTBOX_STREAM_PREFIX', default='credit'),
+    'MAXLEN': config('OUTBOX_STREAM_MAXLEN', default=1000000, cast=int),
+}
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=1000, cast=int)
+OUTBOX_DISPATCH_SECONDS = config('OUTBOX_DISPATCH_SECONDS', default=1.0, cast=float)
+OUTBOX_RETENTION_HOURS = config('OUTBOX_RETENTION_HOURS', default=168, cast=int)
+
+# Periodic tasks, run by `celery -A credit_system beat`
+CELERY_BEAT_SCHEDULE = {
+    'refresh-portfolio-rollups': {
+        'task': 'credit_app.tasks.refresh_portfolio_rollups',
+        'schedule': PORTFOLIO_REFRESH_SECONDS,
+    },
+    'dispatch-outbox-events': {
+        'task': 'credit_app.tasks.dispatch_outbox_events',
+        'schedule': OUTBOX_DISPATCH_SECONDS,
+    },
+    'purge-expired-idempotency-keys': {
+        'task': 'credit_app.tasks.purge_expired_idempotency_keys',
+        'schedule': 3600,
+    },
+    'purge-published-outbox-events': {
+        'task': 'credit_app.tasks.purge_published_outbox_events',
+        'schedule': 3600,
+    },
+}
+
+# In-process loan book snapshot answering /api/check-eligibility from memory
+# (credit_app.loan_book). Answers lag writes by up to MAX_STALENESS_SECONDS plus one
+# refresh; each refresh re-reads rows written since the previous one, less
+# WATERMARK_OVERLAP_SECONDS for transactions that were still committing
+LOAN_BOOK_SNAPSHOT = config('LOAN_BOOK_SNAPSHOT', default=False, cast=bool)
+LOAN_BOOK_MAX_STALENESS_SECONDS = config('LOAN_BOOK_MAX_STALENESS_SECONDS', default=5, cast=float)
+LOAN_BOOK_WATERMARK_OVERLAP_SECONDS = config('LOAN_BOOK_WATERMARK_OVERLAP_SECONDS', default=60, cast=float)
+
+# Maximum number of applications accepted by /api/check-eligibility/batch
+ELIGIBILITY_BATCH_MAX_SIZE = config('ELIGIBILITY_BATCH_MAX_SIZE', default=5000, cast=int)
+
+# Maximum number of registrations accepted by /api/register/batch, and the batch size of
+# the register_customers command
+REGISTRATION_BATCH_MAX_SIZE = config('REGISTRATION_BATCH_MAX_SIZE', default=5000, cast=int)
+
+# Largest page (?limit=) served by /api/view-loans/<customer_id>
+VIEW_LOANS_MAX_PAGE_SIZE = config('VIEW_LOANS_MAX_PAGE_SIZE', default=1000, cast=int)
+
+# Serialization of the loan read endpoints: 'drf' (ModelSerializers), 'values' (field maps
+# compiled from them over .values() rows) or 'orjson' (field maps, rendered with orjson when
+# it is installed). All three produce the same bytes
+READ_SERIALIZATION = config('READ_SERIALIZATION', default='orjson')
+
+# Approval rules: a JSON rule definition (see credit_app.rules.DEFAULT_RULES, used when
+# unset). Workers re-read the file when it changes, checking at most every RELOAD_SECONDS
+CREDIT_RULES_FILE = config('CREDIT_RULES_FILE', default='')
+CREDIT_RULES_RELOAD_SECONDS = config('CREDIT_RULES_RELOAD_SECONDS', default=5, cast=float)
+
+# Request metrics served at /api/metrics: fraction of requests timed into histograms, and
+# sampled requests slower than this many milliseconds are logged with their SQL (0 disables)
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=1.0, cast=float)
+SLOW_REQUEST_THRESHOLD_MS = config('SLOW_REQUEST_THRESHOLD_MS', default=0, cast=int)
+
+# Idempotency-Key records older than this are removed by tasks.purge_expired_idempotency_keys
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
@@ -4,4 +4,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'credit_system.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Imported once the app registry is ready
+from credit_app.loan_book import preload_loan_book
+
+preload_loan_book()